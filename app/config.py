@@ -0,0 +1,82 @@
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+from dotenv import load_dotenv
+
+_loaded = False
+
+
+def load_env() -> None:
+    """Read the .env file into the environment, once per process.
+
+    Modules call this before their `from_env` constructors read os.environ;
+    only the first call parses the file.
+    """
+    global _loaded
+    if not _loaded:
+        load_dotenv()
+        _loaded = True
+
+
+def env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+@dataclass(frozen=True)
+class Settings:
+    """App-wide configuration, read from the environment once at startup.
+
+    Components with their own tuning knobs (scheduler, sandbox, caches,
+    stores) still read those in their `from_env` constructors.
+    """
+
+    openai_api_key: Optional[str] = None
+    anthropic_api_key: Optional[str] = None
+    xai_api_key: Optional[str] = None
+    xai_api_url: str = "https://api.grok.x.ai/v1"
+    provider_max_connections: int = 200
+    provider_max_keepalive: int = 50
+    provider_keepalive_expiry: float = 30.0
+    provider_connect_timeout: float = 5.0
+    log_level: str = "INFO"
+    log_format: str = "json"
+    log_debug_sample_rate: float = 0.01
+    startup_warmup: bool = True
+    # Concurrent identical chat requests share one provider call
+    chat_coalesce: bool = True
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        load_env()
+        return cls(
+            openai_api_key=os.getenv("OPENAI_API_KEY") or None,
+            anthropic_api_key=os.getenv("ANTHROPIC_API_KEY") or None,
+            xai_api_key=os.getenv("XAI_API_KEY") or None,
+            xai_api_url=os.getenv("XAI_API_URL", "https://api.grok.x.ai/v1"),
+            provider_max_connections=env_int("PROVIDER_MAX_CONNECTIONS", 200),
+            provider_max_keepalive=env_int("PROVIDER_MAX_KEEPALIVE", 50),
+            provider_keepalive_expiry=env_float("PROVIDER_KEEPALIVE_EXPIRY", 30.0),
+            provider_connect_timeout=env_float("PROVIDER_CONNECT_TIMEOUT_SECONDS", 5.0),
+            log_level=os.getenv("LOG_LEVEL", "INFO").upper(),
+            log_format=os.getenv("LOG_FORMAT", "json"),
+            log_debug_sample_rate=env_float("LOG_DEBUG_SAMPLE_RATE", 0.01),
+            startup_warmup=os.getenv("STARTUP_WARMUP", "1") == "1",
+            chat_coalesce=os.getenv("CHAT_COALESCE", "1") == "1",
+        )
+
+    def api_key(self, provider: str) -> Optional[str]:
+        return getattr(self, f"{provider}_api_key")
+
+
+settings = Settings.from_env()
@@ -1,16 +1,62 @@
 from fastapi import FastAPI, UploadFile, File, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response
 from fastapi.staticfiles import StaticFiles
+from contextlib import asynccontextmanager
+import asyncio
+import json
+import logging
 import os
-from dotenv import load_dotenv
 
-# Load environment variables
-load_dotenv()
+# Load environment variables (once, for every module) into typed settings
+from app.config import settings
+from app.utils.log import configure_logging
+
+configure_logging()
 
 # Import routes
 from app.routes import chat, images, code_execution, web_search, train
+from app.utils.cache import completion_cache
+from app.utils.metrics import CONTENT_TYPE, MetricsMiddleware, registry
+from app.utils.providers import providers
+from app.utils.sandbox import sandbox
+from app.utils.search import search_service
+from app.utils.sessions import session_store
+from app.utils.training_catalog import training_catalog
+from app.utils.training_store import training_store
+from app.utils.vector_index import vector_index
+
+logger = logging.getLogger("app.main")
+
+async def warm_up():
+    """Import the provider SDKs and open their clients after the server is already serving"""
+    try:
+        await asyncio.to_thread(providers.preload)
+        # Shared, pooled provider clients live for the whole process
+        providers.start()
+    except Exception:
+        logger.exception("warm-up failed; provider clients will be created on first use")
 
-app = FastAPI(title="HACKNEY DOWNS AI", description="Advanced AI Platform with Multi-Model Support")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    sandbox.start()
+    await asyncio.to_thread(training_catalog.load)
+    vector_index.start()
+    app.state.warmup = asyncio.create_task(warm_up()) if settings.startup_warmup else None
+    yield
+    if app.state.warmup is not None:
+        app.state.warmup.cancel()
+    await vector_index.close()
+    # Flush queued training writes before anything else shuts down
+    await training_store.close()
+    training_catalog.flush()
+    await providers.close()
+    await search_service.close()
+    await completion_cache.close()
+    session_store.close()
+    await sandbox.close()
+
+app = FastAPI(title="HACKNEY DOWNS AI", description="Advanced AI Platform with Multi-Model Support", lifespan=lifespan)
 
 # CORS middleware
 app.add_middleware(
@@ -20,6 +66,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Outermost, so its latencies include every other middleware
+app.add_middleware(MetricsMiddleware)
 
 # Include routers
 app.include_router(chat.router, prefix="/api", tags=["chat"])
@@ -36,21 +84,31 @@ app.include_router(train.router, prefix="/api", tags=["train"])
 
 @app.get("/")
 async def root():
-    return {"message": "HACKNEY DOWNS AI Platform", "status": "running"}
+    warmup = getattr(app.state, "warmup", None)
+    return {"message": "HACKNEY DOWNS AI Platform", "status": "running", "warming_up": warmup is not None and not warmup.done()}
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus text exposition of the request, provider, sandbox and ingest metrics"""
+    return Response(registry.render(), media_type=CONTENT_TYPE)
+
+AVAILABLE_MODELS = {
+    "models": [
+        {"id": "gpt-4", "name": "GPT-4", "provider": "OpenAI"},
+        {"id": "gpt-3.5-turbo", "name": "GPT-3.5 Turbo", "provider": "OpenAI"},
+        {"id": "claude-3-opus", "name": "Claude 3 Opus", "provider": "Anthropic"},
+        {"id": "claude-3-sonnet", "name": "Claude 3 Sonnet", "provider": "Anthropic"},
+        {"id": "grok-code-fast-1", "name": "Grok Code Fast", "provider": "xAI"},
+        {"id": "github-copilot", "name": "GitHub Copilot Style", "provider": "OpenAI"},
+        {"id": "local-llama", "name": "Local Llama", "provider": "Local"},
+    ]
+}
+# Static, so serialized once instead of validated and encoded on every request
+MODELS_BODY = json.dumps(AVAILABLE_MODELS).encode("utf-8")
 
 @app.get("/api/models")
 async def get_available_models():
-    return {
-        "models": [
-            {"id": "gpt-4", "name": "GPT-4", "provider": "OpenAI"},
-            {"id": "gpt-3.5-turbo", "name": "GPT-3.5 Turbo", "provider": "OpenAI"},
-            {"id": "claude-3-opus", "name": "Claude 3 Opus", "provider": "Anthropic"},
-            {"id": "claude-3-sonnet", "name": "Claude 3 Sonnet", "provider": "Anthropic"},
-            {"id": "grok-code-fast-1", "name": "Grok Code Fast", "provider": "xAI"},
-            {"id": "github-copilot", "name": "GitHub Copilot Style", "provider": "OpenAI"},
-            {"id": "local-llama", "name": "Local Llama", "provider": "Local"},
-        ]
-    }
+    return Response(MODELS_BODY, media_type="application/json")
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,7 +1,17 @@
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-from typing import List, Optional
-from app.utils.ai_model import AIModel
+from fastapi import APIRouter, File, Form, HTTPException, Request, UploadFile
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
+from typing import BinaryIO, Dict, List, Optional
+import asyncio
+import json
+import math
+from app.utils.ai_model import AIModel, chat_flight, chat_streams
+from app.utils.batches import BatchError, batch_store
+from app.utils.cache import completion_cache
+from app.utils.council import CouncilError
+from app.utils.resilience import ProviderError, resilience
+from app.utils.scheduler import scheduler
+from app.utils.sessions import session_store
 
 router = APIRouter()
 
@@ -11,25 +21,299 @@ class ChatRequest(BaseModel):
     temperature: float = 0.7
     max_tokens: int = 1000
     conversation_history: Optional[List[dict]] = None
+    session_id: Optional[str] = None
+    web_search: bool = False  # ground the reply in live web search results
+    training_context: bool = False  # ground the reply in the designated training datasets
 
 class ChatResponse(BaseModel):
     response: str
     model_used: str
+    session_id: Optional[str] = None
+
+class BatchRequest(BaseModel):
+    requests: List[ChatRequest] = []  # empty to resume an existing batch_id
+    batch_id: Optional[str] = None
+    concurrency: Optional[int] = None
+
+class CouncilRequest(BaseModel):
+    message: str
+    members: Optional[List[str]] = None  # gang member keys; default: the best topic matches, across providers
+    size: Optional[int] = None  # how many members to pick when `members` is not given
+    strategy: str = "first"  # first, quorum or synthesis
+    quorum: Optional[int] = None  # answers to wait for (quorum/synthesis); default a majority
+    deadline_seconds: Optional[float] = None
+    temperature: float = 0.7
+    max_tokens: int = 1000
+    conversation_history: Optional[List[dict]] = None
+    session_id: Optional[str] = None
+    web_search: bool = False
+    training_context: bool = False
+
+class CouncilAnswer(BaseModel):
+    gang_member: str
+    response: str
+    seconds: float
+
+class CouncilResponse(BaseModel):
+    response: str
+    strategy: str
+    chosen_member: Optional[str] = None  # None when the answers were synthesized
+    synthesized_by: Optional[str] = None
+    answers: List[CouncilAnswer]
+    failed: Dict[str, str]
+    cancelled: List[str]
+    elapsed_seconds: float
+    session_id: Optional[str] = None
+
+class SessionResponse(BaseModel):
+    session_id: str
+    messages: List[dict]
+
+def _sse(event: dict) -> str:
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+def _error_headers(retry_after: Optional[float]) -> Optional[dict]:
+    if retry_after is None:
+        return None
+    return {"Retry-After": str(max(1, math.ceil(retry_after)))}
+
+async def _require_session(session_id: Optional[str]) -> None:
+    if session_id is not None and await session_store.get(session_id) is None:
+        raise HTTPException(status_code=404, detail=f"Unknown session: {session_id}")
 
 @router.post("/chat", response_model=ChatResponse)
 async def chat_endpoint(request: ChatRequest):
+    await _require_session(request.session_id)
     try:
-        response = await AIModel.generate_response(
+        reply = await AIModel.generate_reply(
             message=request.message,
             model=request.model,
             temperature=request.temperature,
             max_tokens=request.max_tokens,
-            conversation_history=request.conversation_history
+            conversation_history=request.conversation_history,
+            session_id=request.session_id,
+            web_search=request.web_search,
+            training_context=request.training_context
         )
 
         return ChatResponse(
-            response=response,
-            model_used=request.model
+            response=reply.response,
+            model_used=reply.model_used,
+            session_id=request.session_id
         )
+    except ProviderError as e:
+        # 429 rate limited, 503 provider down / circuit open, 504 timed out, 502 rejected
+        raise HTTPException(status_code=e.status_code, detail=f"Chat error: {str(e)}", headers=_error_headers(e.retry_after))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Chat error: {str(e)}")
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Chat error: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Chat error: {str(e)}")
+
+@router.post("/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest, http_request: Request):
+    """Stream the reply as Server-Sent Events: `token` events then a final `done` event"""
+    await _require_session(request.session_id)
+
+    events = AIModel.stream_response(
+        message=request.message,
+        model=request.model,
+        temperature=request.temperature,
+        max_tokens=request.max_tokens,
+        conversation_history=request.conversation_history,
+        session_id=request.session_id,
+        web_search=request.web_search,
+        training_context=request.training_context
+    )
+    # Wait for the first event so failures before any output get a real status code
+    first = await events.__anext__()
+    if first["type"] == "error":
+        await events.aclose()
+        raise HTTPException(status_code=first["status"], detail=first["detail"], headers=_error_headers(first.get("retry_after")))
+
+    async def event_stream():
+        try:
+            yield _sse(first)
+            async for event in events:
+                if await http_request.is_disconnected():
+                    break
+                yield _sse(event)
+        finally:
+            # Stop the upstream provider stream as soon as the client goes away
+            await events.aclose()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.post("/chat/council", response_model=CouncilResponse)
+async def chat_council(request: CouncilRequest):
+    """Ask several gang members at once and combine their answers.
+
+    `first` returns the first answer, `quorum` the one most agreed with once
+    a quorum has answered, and `synthesis` merges the quorum's answers in one
+    more call. Slower members are cancelled; the deadline bounds the lot.
+    """
+    await _require_session(request.session_id)
+    try:
+        verdict = await AIModel.council_response(
+            message=request.message,
+            members=request.members,
+            size=request.size,
+            strategy=request.strategy,
+            quorum=request.quorum,
+            deadline=request.deadline_seconds,
+            temperature=request.temperature,
+            max_tokens=request.max_tokens,
+            conversation_history=request.conversation_history,
+            session_id=request.session_id,
+            web_search=request.web_search,
+            training_context=request.training_context
+        )
+    except ProviderError as e:
+        raise HTTPException(status_code=e.status_code, detail=f"Council error: {str(e)}", headers=_error_headers(e.retry_after))
+    except CouncilError as e:
+        raise HTTPException(status_code=e.status_code, detail=f"Council error: {str(e)}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Council error: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Council error: {str(e)}")
+
+    return CouncilResponse(
+        response=verdict.response,
+        strategy=verdict.strategy,
+        chosen_member=verdict.chosen,
+        synthesized_by=verdict.synthesized_by,
+        answers=[CouncilAnswer(gang_member=a.member, response=a.reply, seconds=a.seconds) for a in verdict.answers],
+        failed=verdict.failed,
+        cancelled=verdict.cancelled,
+        elapsed_seconds=verdict.seconds,
+        session_id=request.session_id
+    )
+
+async def _batch_item(item: dict) -> dict:
+    request = ChatRequest(**item)
+    try:
+        reply = await AIModel.generate_reply(
+            message=request.message,
+            model=request.model,
+            temperature=request.temperature,
+            max_tokens=request.max_tokens,
+            conversation_history=request.conversation_history,
+            session_id=request.session_id,
+            web_search=request.web_search,
+            training_context=request.training_context,
+            priority="batch"
+        )
+    except ValueError as e:
+        raise BatchError(str(e))
+    return {"response": reply.response, "model_used": reply.model_used}
+
+async def _run_batch(requests: List[dict], batch_id: Optional[str], concurrency: Optional[int]) -> StreamingResponse:
+    """Create (or resume) a batch and stream its results as NDJSON"""
+    try:
+        if requests or batch_id is None:
+            batch_id = batch_store.create(requests, batch_id)
+        events = batch_store.run(batch_id, _batch_item, concurrency)
+        # Start the run here so unknown or already-running batches get a real status code
+        first = await events.__anext__()
+    except BatchError as e:
+        raise HTTPException(status_code=e.status_code, detail=f"Batch error: {str(e)}")
+
+    async def ndjson():
+        try:
+            yield json.dumps(first) + "\n"
+            async for event in events:
+                yield json.dumps(event) + "\n"
+        finally:
+            # A disconnect stops the batch; its pending items run on resume
+            await events.aclose()
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson", headers={"X-Batch-Id": batch_id})
+
+@router.post("/chat/batch")
+async def chat_batch(request: BatchRequest):
+    """Run chat requests concurrently, streaming NDJSON results in completion order.
+
+    The first line names the batch id; each `result` line carries the input
+    `index`; a `done` line ends the run. Re-post just the batch id to resume.
+    """
+    return await _run_batch([r.model_dump() for r in request.requests], request.batch_id, request.concurrency)
+
+@router.post("/chat/batch/file")
+async def chat_batch_file(file: UploadFile = File(...), batch_id: Optional[str] = Form(None), concurrency: Optional[int] = Form(None)):
+    """Like /chat/batch, with the requests uploaded as JSONL (one ChatRequest per line)"""
+    requests = await asyncio.to_thread(_read_batch_lines, file.file)
+    return await _run_batch(requests, batch_id, concurrency)
+
+def _read_batch_lines(upload: BinaryIO) -> List[dict]:
+    """Parse the spooled upload a line at a time rather than reading and decoding it whole"""
+    requests = []
+    upload.seek(0)
+    for number, raw in enumerate(upload, start=1):
+        try:
+            line = raw.decode("utf-8")
+        except UnicodeDecodeError as e:
+            raise HTTPException(status_code=422, detail=f"Batch error: line {number}: not valid UTF-8 ({e.reason})")
+        if not line.strip():
+            continue
+        try:
+            requests.append(ChatRequest.model_validate_json(line).model_dump())
+        except ValidationError as e:
+            raise HTTPException(status_code=422, detail=f"Batch error: line {number}: {e.errors()[0]['msg']}")
+    return requests
+
+@router.get("/chat/batch/{batch_id}")
+async def chat_batch_status(batch_id: str):
+    try:
+        return batch_store.status(batch_id)
+    except BatchError as e:
+        raise HTTPException(status_code=e.status_code, detail=f"Batch error: {str(e)}")
+
+@router.get("/chat/batch/{batch_id}/results")
+async def chat_batch_results(batch_id: str):
+    """Stored results so far, in input order, as NDJSON"""
+    try:
+        if not batch_store.exists(batch_id):
+            raise BatchError(f"Unknown batch: {batch_id}", 404)
+        results = batch_store.results(batch_id)
+    except BatchError as e:
+        raise HTTPException(status_code=e.status_code, detail=f"Batch error: {str(e)}")
+    return StreamingResponse(
+        (json.dumps(results[index]) + "\n" for index in sorted(results)),
+        media_type="application/x-ndjson",
+    )
+
+@router.get("/chat/resilience/stats")
+async def chat_resilience_stats():
+    return resilience.stats()
+
+@router.get("/chat/scheduler/stats")
+async def chat_scheduler_stats():
+    return scheduler.stats()
+
+@router.get("/chat/coalescing/stats")
+async def chat_coalescing_stats():
+    return {"requests": chat_flight.stats(), "streams": chat_streams.stats()}
+
+@router.get("/chat/cache/stats")
+async def chat_cache_stats():
+    return completion_cache.stats()
+
+@router.post("/chat/sessions", response_model=SessionResponse)
+async def create_session():
+    session = await session_store.create()
+    return SessionResponse(session_id=session.id, messages=[])
+
+@router.get("/chat/sessions/{session_id}", response_model=SessionResponse)
+async def get_session(session_id: str):
+    session = await session_store.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail=f"Unknown session: {session_id}")
+    return SessionResponse(session_id=session.id, messages=session.messages)
+
+@router.delete("/chat/sessions/{session_id}")
+async def delete_session(session_id: str):
+    await session_store.delete(session_id)
+    return {"message": f"Session {session_id} deleted"}
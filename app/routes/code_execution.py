@@ -1,8 +1,8 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-import subprocess
-import tempfile
-import os
+import json
+from app.utils.sandbox import sandbox, ExecutionResult
 
 router = APIRouter()
 
@@ -26,82 +26,57 @@ async def execute_code(request: CodeExecutionRequest):
             return await execute_bash(request.code)
         else:
             raise HTTPException(status_code=400, detail=f"Unsupported language: {request.language}")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Code execution error: {str(e)}")
 
-async def execute_python(code: str) -> CodeExecutionResponse:
-    with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False) as f:
-        f.write(code)
-        temp_file = f.name
+@router.post("/code/execute/stream")
+async def execute_code_stream(request: CodeExecutionRequest, http_request: Request):
+    """Stream stdout/stderr as Server-Sent Events, ending with an `exit` event"""
+    if request.language not in ("python", "javascript", "bash"):
+        raise HTTPException(status_code=400, detail=f"Unsupported language: {request.language}")
 
-    try:
-        result = subprocess.run(
-            ['python3', temp_file],
-            capture_output=True,
-            text=True,
-            timeout=30
-        )
+    async def event_stream():
+        events = sandbox.stream(request.language, request.code)
+        try:
+            async for event in events:
+                if await http_request.is_disconnected():
+                    break
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'type': 'error', 'detail': f'Code execution error: {str(e)}'})}\n\n"
+        finally:
+            # Kills the program if the client went away mid-run
+            await events.aclose()
 
-        os.unlink(temp_file)
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
+def _to_response(result: ExecutionResult, timeout_message: str) -> CodeExecutionResponse:
+    if result.timed_out:
         return CodeExecutionResponse(
             output=result.stdout,
-            error=result.stderr,
-            success=result.returncode == 0
-        )
-    except subprocess.TimeoutExpired:
-        os.unlink(temp_file)
-        return CodeExecutionResponse(
-            output="",
-            error="Code execution timed out after 30 seconds",
+            error=result.stderr + timeout_message,
             success=False
         )
+    return CodeExecutionResponse(
+        output=result.stdout,
+        error=result.stderr,
+        success=result.returncode == 0
+    )
 
-async def execute_javascript(code: str) -> CodeExecutionResponse:
-    with tempfile.NamedTemporaryFile(mode='w', suffix='.js', delete=False) as f:
-        f.write(code)
-        temp_file = f.name
-
-    try:
-        result = subprocess.run(
-            ['node', temp_file],
-            capture_output=True,
-            text=True,
-            timeout=30
-        )
-
-        os.unlink(temp_file)
+async def execute_python(code: str) -> CodeExecutionResponse:
+    result = await sandbox.run("python", code)
+    return _to_response(result, f"Code execution timed out after {sandbox.timeout:g} seconds")
 
-        return CodeExecutionResponse(
-            output=result.stdout,
-            error=result.stderr,
-            success=result.returncode == 0
-        )
-    except subprocess.TimeoutExpired:
-        os.unlink(temp_file)
-        return CodeExecutionResponse(
-            output="",
-            error="Code execution timed out after 30 seconds",
-            success=False
-        )
+async def execute_javascript(code: str) -> CodeExecutionResponse:
+    result = await sandbox.run("javascript", code)
+    return _to_response(result, f"Code execution timed out after {sandbox.timeout:g} seconds")
 
 async def execute_bash(code: str) -> CodeExecutionResponse:
-    try:
-        result = subprocess.run(
-            ['bash', '-c', code],
-            capture_output=True,
-            text=True,
-            timeout=30
-        )
-
-        return CodeExecutionResponse(
-            output=result.stdout,
-            error=result.stderr,
-            success=result.returncode == 0
-        )
-    except subprocess.TimeoutExpired:
-        return CodeExecutionResponse(
-            output="",
-            error="Command execution timed out after 30 seconds",
-            success=False
-        )
\ No newline at end of file
+    result = await sandbox.run("bash", code)
+    return _to_response(result, f"Command execution timed out after {sandbox.timeout:g} seconds")
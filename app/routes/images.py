@@ -1,13 +1,17 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import FileResponse, Response
 from pydantic import BaseModel
-import openai
+from typing import Optional, Tuple
+import asyncio
 import os
-from dotenv import load_dotenv
-
-load_dotenv()
+import re
+from app.utils.images import CONTENT_TYPES, image_service, parse_range
+from app.utils.resilience import ProviderError
 
 router = APIRouter()
 
+BLOB_NAME = re.compile(r"^[0-9a-f]{64}\.(png|jpg|webp)$")
+
 class ImageRequest(BaseModel):
     prompt: str
     size: str = "1024x1024"
@@ -18,20 +22,72 @@ class ImageResponse(BaseModel):
     images: list[str]
 
 @router.post("/images/generate", response_model=ImageResponse)
-async def generate_image(request: ImageRequest):
+async def generate_image(request: ImageRequest, http_request: Request):
+    if not 1 <= request.n <= 10:
+        raise HTTPException(status_code=400, detail="Image generation error: n must be between 1 and 10")
     try:
-        client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        names = await image_service.generate(request.prompt, request.size, request.quality, request.n)
+    except ProviderError as e:
+        raise HTTPException(status_code=e.status_code, detail=f"Image generation error: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Image generation error: {str(e)}")
 
-        response = client.images.generate(
-            model="dall-e-3",
-            prompt=request.prompt,
-            size=request.size,
-            quality=request.quality,
-            n=request.n,
-        )
+    # Served by us (below), so the links do not expire like provider URLs
+    return ImageResponse(images=[str(http_request.url_for("get_image", name=name)) for name in names])
 
-        image_urls = [image.url for image in response.data]
+@router.get("/images/stats")
+async def image_stats():
+    return image_service.stats()
 
-        return ImageResponse(images=image_urls)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Image generation error: {str(e)}")
\ No newline at end of file
+def _locate(name: str) -> Optional[Tuple[str, int]]:
+    """(path, size) of a stored image, or None if it is not (or no longer) stored"""
+    path = image_service.store.path(name)
+    if path is None:
+        return None
+    try:
+        return path, os.path.getsize(path)
+    except FileNotFoundError:
+        return None  # evicted since the lookup
+
+@router.get("/images/{name}", name="get_image")
+async def get_image(name: str, request: Request):
+    """Serve a stored image; content-addressed, so the digest is a permanent ETag"""
+    # The store lookup touches the disk (a directory scan on first use, a utime each hit)
+    found = await asyncio.to_thread(_locate, name) if BLOB_NAME.match(name) else None
+    if found is None:
+        raise HTTPException(status_code=404, detail=f"Unknown image: {name}")
+    path, size = found
+
+    etag = f'"{name.split(".")[0]}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "Accept-Ranges": "bytes",
+    }
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+
+    media_type = CONTENT_TYPES[name.rsplit(".", 1)[1]]
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if if_range is not None and if_range != etag:
+        range_header = None  # the client's copy is a different image: send it whole
+    try:
+        byte_range = parse_range(range_header, size)
+    except ValueError:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+    if byte_range is None:
+        return FileResponse(path, media_type=media_type, headers=headers)
+
+    start, end = byte_range
+    def read_part() -> bytes:
+        with open(path, "rb") as f:
+            f.seek(start)
+            return f.read(end - start + 1)
+    body = await asyncio.to_thread(read_part)
+    return Response(
+        body,
+        status_code=206,
+        media_type=media_type,
+        headers={**headers, "Content-Range": f"bytes {start}-{end}/{size}"},
+    )
@@ -1,8 +1,16 @@
 from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+import asyncio
 import os
 import json
+from datetime import datetime, timezone
 from typing import List
+from app.utils.ingest import UnsupportedUpload, UploadTooLarge, dataset_for_upload, ingest_upload
+from app.utils.training_catalog import training_catalog
+from app.utils.ai_model import AIModel
+from app.utils.training_store import safe_name, training_store
+from app.utils.vector_index import vector_index
 
 router = APIRouter()
 
@@ -13,96 +21,98 @@ class TrainRequest(BaseModel):
 class TrainResponse(BaseModel):
     message: str
     training_data_size: int
+    duplicate: bool = False
 
 @router.post("/train", response_model=TrainResponse)
 async def train_model(request: TrainRequest):
     try:
-        # Save training data
-        training_file = f"data/{request.model_name}_training.json"
-
-        # Load existing training data if it exists
-        existing_data = []
-        if os.path.exists(training_file):
-            with open(training_file, 'r') as f:
-                existing_data = json.load(f)
-
-        # Add new training data
+        # Append to the model's JSONL training store (no whole-file rewrite)
         new_entry = {
             "input": request.data,
-            "timestamp": str(pd.Timestamp.now()) if 'pd' in globals() else "2025-01-01",
+            "timestamp": datetime.now(timezone.utc).isoformat(),
             "model": request.model_name
         }
-        existing_data.append(new_entry)
-
-        # Save updated training data
-        os.makedirs("data", exist_ok=True)
-        with open(training_file, 'w') as f:
-            json.dump(existing_data, f, indent=2)
+        result = await training_store.append_many(request.model_name, [new_entry])
+        if not result.added:
+            return TrainResponse(
+                message=f"Duplicate training data skipped for {request.model_name} model",
+                training_data_size=result.count,
+                duplicate=True
+            )
 
         return TrainResponse(
             message=f"Training data added to {request.model_name} model",
-            training_data_size=len(existing_data)
+            training_data_size=result.count
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Training error: {str(e)}")
 
 @router.post("/train/file")
-async def train_from_file(file: UploadFile = File(...)):
-    try:
-        content = await file.read()
-        text_content = content.decode('utf-8')
-
-        # Save the file
-        os.makedirs("data", exist_ok=True)
-        file_path = f"data/{file.filename}"
-        with open(file_path, 'wb') as f:
-            f.write(content)
-
-        # Process the training data
-        training_data = []
-        lines = text_content.split('\n')
-        for line in lines:
-            if line.strip():
-                training_data.append({
-                    "input": line.strip(),
-                    "timestamp": "2025-01-01",
-                    "source": file.filename
-                })
+async def train_from_file(file: UploadFile = File(...), progress: bool = False):
+    """Ingest an uploaded (optionally gzip/zstd-compressed) text file, one sample per line.
+
+    With `?progress=true` the response is NDJSON progress events ending in a
+    `complete` event; otherwise just the final totals are returned.
+    """
+    # Keep the raw upload under the store's uploads directory, never in place of a dataset or the catalog
+    source = os.path.basename(file.filename or "upload")
+    file_path = training_store.upload_path(source)
+    dataset = dataset_for_upload(source)
+    events = ingest_upload(file, training_store, dataset, source, raw_path=file_path)
+
+    if progress:
+        async def progress_stream():
+            try:
+                async for event in events:
+                    yield json.dumps({**event, "file_path": file_path}) + "\n"
+            except Exception as e:
+                yield json.dumps({"type": "error", "detail": f"File training error: {str(e)}"}) + "\n"
 
-        # Save processed training data
-        training_file = f"data/{file.filename}_processed.json"
-        with open(training_file, 'w') as f:
-            json.dump(training_data, f, indent=2)
+        return StreamingResponse(progress_stream(), media_type="application/x-ndjson")
 
-        return {
-            "message": f"Training file processed: {file.filename}",
-            "training_samples": len(training_data),
-            "file_path": file_path
-        }
+    try:
+        summary = {}
+        async for event in events:
+            summary = event
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UnsupportedUpload as e:
+        raise HTTPException(status_code=415, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"File training error: {str(e)}")
 
+    return {
+        "message": f"Training file processed: {source}",
+        "training_samples": summary["training_samples"],
+        "duplicates_dropped": summary["duplicates_dropped"],
+        "near_duplicates_dropped": summary["near_duplicates_dropped"],
+        "bytes_received": summary["bytes_received"],
+        "bytes_decoded": summary["bytes_decoded"],
+        "lines_truncated": summary["lines_truncated"],
+        "dataset": dataset,
+        "file_path": file_path
+    }
+
 @router.get("/training/status")
 async def get_training_status():
+    """Dataset counts from the training catalog - no training files are read."""
     try:
-        training_files = []
-        if os.path.exists("data"):
-            training_files = [f for f in os.listdir("data") if f.endswith('.json')]
+        # stats() may re-map the index files, so keep it off the event loop
+        index_stats = await asyncio.to_thread(vector_index.stats)
+        return {**training_catalog.status(), "vector_index": index_stats, "status": "ready"}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Status check error: {str(e)}")
 
-        total_samples = 0
-        for file in training_files:
-            try:
-                with open(f"data/{file}", 'r') as f:
-                    data = json.load(f)
-                    if isinstance(data, list):
-                        total_samples += len(data)
-            except:
-                pass
+@router.get("/training/search")
+async def search_training_data(q: str, k: int = 5):
+    """Top-k training snippets for a query, as used to ground chat replies.
 
-        return {
-            "training_files": training_files,
-            "total_training_samples": total_samples,
-            "status": "ready"
-        }
+    Only the datasets designated for chat context (VECTOR_CONTEXT_DATASETS)
+    are searched, never a gang member's own dataset.
+    """
+    private = {safe_name(member) for member in AIModel.AI_GANG}
+    try:
+        hits = await asyncio.to_thread(vector_index.search, q, k, private, vector_index.context_datasets)
+        return {"results": [hit._asdict() for hit in hits]}
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Status check error: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Training search error: {str(e)}")
@@ -1,21 +1,50 @@
-import os
-import openai
-import anthropic
-import requests
-from typing import Optional, Dict, Any
-from dotenv import load_dotenv
+import asyncio
+import json
+import logging
+import time
+from contextlib import aclosing
+from contextvars import ContextVar
+from functools import partial
+from typing import AsyncIterator, List, NamedTuple, Optional, Dict, Any, Tuple
 import random
 
-load_dotenv()
+from app.config import load_env, settings
+from app.utils.cache import completion_cache
+from app.utils.council import Answer, CouncilError, Verdict, council
+from app.utils import metrics
+from app.utils.history import PreparedHistory, history_manager
+from app.utils.providers import providers
+from app.utils.resilience import ProviderUnavailable, resilience
+from app.utils.scheduler import AdmissionRejected, scheduler
+from app.utils.sessions import session_store
+from app.utils.singleflight import SingleFlight, StreamFlight
+from app.utils.topic_router import TopicRouter
+from app.utils.training_store import safe_name
+from app.utils.vector_index import vector_index
+from app.utils.web_context import web_context
+
+load_env()
+
+logger = logging.getLogger(__name__)
+
+# Gang member of the provider call in progress, for the token metrics recorded in _call_*
+current_member: ContextVar[str] = ContextVar("current_member", default="")
 
 class AIModel:
     @staticmethod
     def _get_openai_client():
-        return openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        return providers.openai
 
     @staticmethod
     def _get_anthropic_client():
-        return anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+        return providers.anthropic
+
+    @staticmethod
+    def _get_xai_client():
+        return providers.xai
+
+    # Credential each provider needs; providers without one are skipped as fallbacks
+    PROVIDER_KEYS = {"openai": "OPENAI_API_KEY", "anthropic": "ANTHROPIC_API_KEY", "xai": "XAI_API_KEY"}
     # Hackney AI Gang - Each AI has a unique personality and specialization
     AI_GANG = {
         "hackney-boss": {
@@ -90,26 +119,67 @@ class AIModel:
         }
     }
 
+    COPILOT_SYSTEM_PROMPT = """You are GitHub Copilot, an AI programming assistant created by GitHub and OpenAI. You are helpful, clever, and extremely knowledgeable about programming, software development, and technology.
+
+Key traits:
+- Be direct and practical - focus on solving problems efficiently
+- Use technical accuracy and best practices
+- Be witty and add personality when appropriate, but never at the expense of being helpful
+- Explain complex concepts clearly and concisely
+- Suggest code improvements and optimizations
+- Reference programming concepts, frameworks, and tools accurately
+- Be encouraging and supportive of developers
+- Use appropriate technical terminology
+- When explaining code, be thorough but not verbose
+- If something is unclear, ask for clarification rather than making assumptions
+
+Remember: You're an expert coding assistant, not a generic chatbot. Focus on programming, development, and technical problem-solving."""
+
+    # Extra routing keywords per gang member, on top of each member's `specialization`.
+    # Only plurals are matched implicitly, so list other word forms explicitly.
+    TOPIC_KEYWORDS = {
+        "dalston-don": ["code", "coding", "program", "programming", "programmer", "python", "javascript", "debug", "debugging", "function", "algorithm", "software", "bug"],
+        "shoreditch-sage": ["design", "designer", "art", "artist", "creative", "marketing", "brand", "branding", "visual", "draw", "drawing", "logo"],
+        "hackney-wick-wizard": ["science", "scientific", "research", "physics", "chemistry", "biology", "math", "maths", "mathematics", "analyze", "analyse", "analysis", "experiment"],
+        "bethnal-green-baron": ["money", "finance", "financial", "business", "invest", "investing", "investment", "profit", "economy", "economics", "trade", "trading", "budget", "tax"],
+        "homerton-hustler": ["life", "advice", "problem", "situation", "relationship", "career", "job"],
+        "train-wheel": ["transport", "travel", "logistics", "delivery", "shipping", "route", "schedule", "efficiency", "planning", "train", "tube", "underground", "commute", "bus"],
+        "hackney-boss": [],
+    }
+
     @staticmethod
     def get_ai_gang_member(query: str) -> str:
         """Determine which AI gang member should handle the query based on topic"""
-        query_lower = query.lower()
-
-        # Topic detection - Order matters: more specific topics first
-        if any(word in query_lower for word in ["code", "program", "python", "javascript", "programming", "debug", "function", "algorithm"]):
-            return "dalston-don"
-        elif any(word in query_lower for word in ["design", "art", "creative", "marketing", "brand", "visual", "draw"]):
-            return "shoreditch-sage"
-        elif any(word in query_lower for word in ["science", "research", "physics", "chemistry", "biology", "math", "analyze"]):
-            return "hackney-wick-wizard"
-        elif any(word in query_lower for word in ["money", "finance", "business", "invest", "profit", "economy", "trade"]):
-            return "bethnal-green-baron"
-        elif any(word in query_lower for word in ["life", "advice", "problem", "situation", "relationship", "career"]):
-            return "homerton-hustler"
-        elif any(word in query_lower for word in ["transport", "travel", "logistics", "delivery", "shipping", "route", "schedule", "efficiency", "planning", "train", "tube", "underground"]):
-            return "train-wheel"
+        return topic_router.route(query).member
+
+    @staticmethod
+    def _resolve_member(message: str, model: str):
+        """Resolve the requested model into (gang member key, member info, actual model)"""
+        # Handle AI gang member selection
+        if model in AIModel.AI_GANG:
+            # Direct AI gang member selection
+            selected_member = model
+            member_info = AIModel.AI_GANG[selected_member]
+            actual_model = member_info["model"]
+        elif model == "auto":
+            # Auto-select AI gang member based on query
+            selected_member = AIModel.get_ai_gang_member(message)
+            member_info = AIModel.AI_GANG[selected_member]
+            actual_model = member_info["model"]
         else:
-            return "hackney-boss"  # Default to boss for general queries
+            # Legacy model support - find gang member that uses this model
+            selected_member = None
+            for member_key, member_info in AIModel.AI_GANG.items():
+                if member_info["model"] == model:
+                    selected_member = member_key
+                    break
+            if not selected_member:
+                selected_member = "hackney-boss"  # fallback
+            member_info = AIModel.AI_GANG[selected_member]
+            actual_model = model
+
+        logger.debug("resolved model", extra={"requested": model, "member": selected_member, "model": actual_model})
+        return selected_member, member_info, actual_model
 
     @staticmethod
     async def generate_response(
@@ -117,67 +187,447 @@ class AIModel:
         model: str = "auto",  # Auto-select based on query
         temperature: float = 0.7,
         max_tokens: int = 1000,
-        conversation_history: Optional[list] = None
+        conversation_history: Optional[list] = None,
+        session_id: Optional[str] = None,
+        web_search: bool = False,
+        training_context: bool = False,
+        priority: str = "interactive"
     ) -> str:
+        """The reply text of generate_reply"""
+        reply = await AIModel.generate_reply(message, model, temperature, max_tokens, conversation_history, session_id, web_search, training_context, priority)
+        return reply.response
+
+    @staticmethod
+    async def generate_reply(
+        message: str,
+        model: str = "auto",  # Auto-select based on query
+        temperature: float = 0.7,
+        max_tokens: int = 1000,
+        conversation_history: Optional[list] = None,
+        session_id: Optional[str] = None,
+        web_search: bool = False,
+        training_context: bool = False,
+        priority: str = "interactive"
+    ) -> "Reply":
+        """Generate a reply from the selected gang member.
+
+        The Reply names the model that actually answered, which differs from
+        the requested one for "auto" and when a fallback provider stepped in.
+
+        Provider failures raise ProviderError subclasses (see app.utils.resilience)
+        rather than being returned as text; an unsupported model raises ValueError.
+        `training_context` grounds the reply in the designated training datasets.
+        `priority` ("interactive" or "batch") orders the call in the provider
+        admission queues.
+        """
+        selected_member, member_info, actual_model = AIModel._resolve_member(message, model)
+
+        # Precompiled personality system prompt
+        persona = AIModel._persona(selected_member, actual_model)
+
+        # History trimmed to the model's token budget, plus web/training context if asked for
+        history = await AIModel._prepare_history(message, selected_member, actual_model, persona, max_tokens, conversation_history, session_id, web_search, training_context)
+
+        request_key = AIModel._cache_key(selected_member, actual_model, persona.text, message, temperature, max_tokens, history)
+        cache_key = None
+        if completion_cache.should_cache(temperature):
+            cache_key = request_key
+            cached = await completion_cache.get(cache_key)
+            if cached is not None:
+                if session_id is not None:
+                    await AIModel._record_turn(session_id, message, cached)
+                # Only the primary model's replies are cached
+                return Reply(cached, actual_model, selected_member)
+
+        # Generate response based on actual model (or a fallback if its provider is down);
+        # identical requests already in flight share that one provider call
+        generate = partial(AIModel._generate_shared, selected_member, actual_model, message, temperature, max_tokens, history, cache_key, priority)
+        if settings.chat_coalesce:
+            response, used_model = await chat_flight.do(request_key, generate)
+        else:
+            response, used_model = await generate()
+
+        if session_id is not None:
+            await AIModel._record_turn(session_id, message, response)
+        return Reply(response, used_model, selected_member)
+
+    @staticmethod
+    async def stream_response(
+        message: str,
+        model: str = "auto",
+        temperature: float = 0.7,
+        max_tokens: int = 1000,
+        conversation_history: Optional[list] = None,
+        session_id: Optional[str] = None,
+        web_search: bool = False,
+        training_context: bool = False,
+        priority: str = "interactive"
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Stream a reply as events: "token" events, then one "done" (or "error") event.
+
+        The "done" event carries the actual model, the gang member that answered
+        and whatever token usage the provider reported. Closing the generator
+        (e.g. on client disconnect) closes the upstream provider stream too,
+        unless other identical requests are still subscribed to it.
+        """
+        try:
+            selected_member, member_info, actual_model = AIModel._resolve_member(message, model)
+            persona = AIModel._persona(selected_member, actual_model)
+            history = await AIModel._prepare_history(message, selected_member, actual_model, persona, max_tokens, conversation_history, session_id, web_search, training_context)
+
+            request_key = AIModel._cache_key(selected_member, actual_model, persona.text, message, temperature, max_tokens, history)
+            cache_key = None
+            if completion_cache.should_cache(temperature):
+                cache_key = request_key
+                cached = await completion_cache.get(cache_key)
+                if cached is not None:
+                    if session_id is not None:
+                        await AIModel._record_turn(session_id, message, cached)
+                    yield {"type": "token", "content": cached}
+                    yield {"type": "done", "model_used": actual_model, "gang_member": selected_member, "usage": {}, "cached": True}
+                    return
+
+            # Identical streams already in flight are fanned out rather than re-requested
+            shared = partial(AIModel._stream_shared, selected_member, actual_model, message, temperature, max_tokens, history, cache_key, priority)
+            events = chat_streams.subscribe(request_key, shared) if settings.chat_coalesce else shared()
+
+            parts = []
+            async with aclosing(events):
+                async for event in events:
+                    if event["type"] == "done" and session_id is not None:
+                        await AIModel._record_turn(session_id, message, "".join(parts))
+                    elif event["type"] == "token":
+                        parts.append(event["content"])
+                    yield event
+        except Exception as e:
+            error = {"type": "error", "detail": f"Error generating response: {str(e)}", "status": getattr(e, "status_code", 400 if isinstance(e, ValueError) else 500)}
+            if getattr(e, "retry_after", None) is not None:
+                error["retry_after"] = e.retry_after
+            yield error
+
+    @staticmethod
+    def council_members(message: str, size: int) -> List[str]:
+        """`size` gang members for a council: best topic matches first, spread across providers.
+
+        Members whose provider has no key or an open circuit go last.
+        """
+        scores = topic_router.route(message).scores
+        ranked = sorted(AIModel.AI_GANG, key=lambda member: (-scores.get(member, 0.0), topic_router.priority.index(member)))
+        provider = lambda member: AIModel._provider(AIModel.AI_GANG[member]["model"])  # noqa: E731
+        usable = lambda member: bool(settings.api_key(provider(member))) and resilience.available(provider(member))  # noqa: E731
+        chosen: List[str] = []
+        used: Dict[str, int] = {}
+        candidates = list(ranked)
+        while candidates and len(chosen) < size:
+            member = min(candidates, key=lambda m: (not usable(m), used.get(provider(m), 0), ranked.index(m)))
+            candidates.remove(member)
+            chosen.append(member)
+            used[provider(member)] = used.get(provider(member), 0) + 1
+        return chosen
+
+    @staticmethod
+    async def council_response(
+        message: str,
+        members: Optional[List[str]] = None,
+        size: Optional[int] = None,
+        strategy: str = "first",
+        quorum: Optional[int] = None,
+        deadline: Optional[float] = None,
+        temperature: float = 0.7,
+        max_tokens: int = 1000,
+        conversation_history: Optional[list] = None,
+        session_id: Optional[str] = None,
+        web_search: bool = False,
+        training_context: bool = False,
+        priority: str = "interactive"
+    ) -> Verdict:
+        """Put the question to several gang members at once (see app.utils.council).
+
+        `members` defaults to `size` members picked by council_members. Each
+        member's call goes through generate_response, so caching, coalescing,
+        admission and fallback apply per member; only the final answer is
+        recorded to the session.
+        """
+        if members is None:
+            members = AIModel.council_members(message, size or council.size)
+        unknown = [member for member in members if member not in AIModel.AI_GANG]
+        if unknown:
+            raise CouncilError(f"Unknown gang members: {', '.join(unknown)}")
+        # Load the session once; the members must not each record a turn
+        if session_id is not None:
+            conversation_history = await session_store.history(session_id)
+
+        ask = partial(AIModel._council_answer, message, temperature, max_tokens, conversation_history, web_search, training_context, priority)
+        synthesize = partial(AIModel._council_synthesis, message, temperature, max_tokens, priority)
+        verdict = await council.convene(members, ask, strategy, quorum, deadline, synthesize)
+
+        if session_id is not None:
+            await AIModel._record_turn(session_id, message, verdict.response)
+        return verdict
+
+    @staticmethod
+    def _council_answer(message: str, temperature: float, max_tokens: int, conversation_history: Optional[list], web_search: bool, training_context: bool, priority: str, member: str):
+        return AIModel.generate_response(message, member, temperature, max_tokens, conversation_history, web_search=web_search, training_context=training_context, priority=priority)
+
+    @staticmethod
+    def _council_synthesis(message: str, temperature: float, max_tokens: int, priority: str, answers: List[Answer]):
+        """One call by the council's synthesizer merging the members' answers"""
+        replies = "\n\n".join(f"{AIModel.AI_GANG[answer.member]['name']}:\n{answer.reply}" for answer in answers)
+        prompt = (
+            f"The gang were asked: {message}\n\nTheir answers:\n\n{replies}\n\n"
+            "Combine these into one answer. Keep what they agree on, settle where they disagree, "
+            "and drop anything that is wrong. Don't mention the other answers."
+        )
+        return AIModel.generate_response(prompt, council.synthesizer, temperature, max_tokens, priority=priority)
+
+    @staticmethod
+    async def _generate_shared(selected_member: str, actual_model: str, message: str, temperature: float, max_tokens: int, history: PreparedHistory, cache_key: Optional[str], priority: str) -> Tuple[str, str]:
+        """The provider call behind generate_reply, run once per coalesced group: (reply, model used)"""
+        response, used_model = await AIModel._complete(selected_member, actual_model, message, temperature, max_tokens, history, priority)
+        # Fallback replies are not cached under the primary model's key
+        if cache_key is not None and response and used_model == actual_model:
+            await completion_cache.set(cache_key, response)
+        return response, used_model
+
+    @staticmethod
+    async def _stream_shared(selected_member: str, actual_model: str, message: str, temperature: float, max_tokens: int, history: PreparedHistory, cache_key: Optional[str], priority: str) -> AsyncIterator[Dict[str, Any]]:
+        """The provider stream behind stream_response: token events, then one "done" event"""
+        events, used_model = await AIModel._open_stream(selected_member, actual_model, message, temperature, max_tokens, history, priority)
+
+        usage: Dict[str, Any] = {}
+        parts = []
+        async with aclosing(events):
+            async for event in events:
+                if event["type"] == "usage":
+                    usage = event["usage"]
+                else:
+                    parts.append(event["content"])
+                    yield event
+
+        reply = "".join(parts)
+        if cache_key is not None and reply and used_model == actual_model:
+            await completion_cache.set(cache_key, reply)
+
+        done = {
+            "type": "done",
+            "model_used": used_model,
+            "gang_member": selected_member,
+            "usage": usage,
+        }
+        if used_model != actual_model:
+            done["fallback_from"] = actual_model
+        yield done
+
+    @staticmethod
+    def _provider(model: str) -> str:
+        if model.startswith("gpt") or model == "github-copilot":
+            return "openai"
+        if model.startswith("claude"):
+            return "anthropic"
+        if model.startswith("grok"):
+            return "xai"
+        raise ValueError(f"Unsupported model: {model}")
+
+    @staticmethod
+    def _candidates(actual_model: str) -> List[str]:
+        """The model to try, then one gang model per other provider"""
+        candidates = [actual_model]
+        if not resilience.fallback:
+            return candidates
+        tried = {AIModel._provider(actual_model)}
+        for member_info in AIModel.AI_GANG.values():
+            provider = AIModel._provider(member_info["model"])
+            if provider not in tried:
+                tried.add(provider)
+                candidates.append(member_info["model"])
+        return candidates
+
+    @staticmethod
+    async def _with_fallback(selected_member: str, actual_model: str, run) -> Tuple[Any, str]:
+        """Call `run(provider, model, persona)` for each candidate until a provider answers.
+
+        Only ProviderUnavailable (down, timed out, rate limited, circuit open)
+        moves on to the next provider; other errors are raised straight away.
+        AdmissionRejected is our own admission control turning the call away,
+        not an outage, so it goes back to the caller as a 429 too.
+        """
+        error: Optional[ProviderUnavailable] = None
+        for model in AIModel._candidates(actual_model):
+            provider = AIModel._provider(model)
+            if not settings.api_key(provider):
+                error = error or ProviderUnavailable(provider, f"{AIModel.PROVIDER_KEYS[provider]} is not set in the backend .env file")
+                continue
+            if model != actual_model:
+                if not resilience.available(provider):
+                    continue
+                resilience.record_fallback(AIModel._provider(actual_model))
+            try:
+                return await run(provider, model, AIModel._persona(selected_member, model)), model
+            except AdmissionRejected:
+                raise
+            except ProviderUnavailable as e:
+                logger.warning("provider unavailable", extra={"provider": provider, "model": model, "member": selected_member, "error": str(e)})
+                error = error or e
+        raise error
+
+    @staticmethod
+    async def _complete(selected_member: str, actual_model: str, message: str, temperature: float, max_tokens: int, history: PreparedHistory, priority: str) -> Tuple[str, str]:
+        """(reply, model that produced it)"""
+        async def run(provider, model, persona):
+            tokens = AIModel._request_tokens(persona, message, model, max_tokens, history)
+            async with scheduler.admit(provider, model, tokens, priority):
+                started = time.perf_counter()
+                member_token = current_member.set(selected_member)
+                try:
+                    reply = await resilience.call(provider, model, partial(AIModel._dispatch, persona, message, model, temperature, max_tokens, history))
+                except Exception as e:
+                    metrics.provider_requests.labels(provider, model, selected_member, metrics.error_label(e)).inc()
+                    raise
+                finally:
+                    current_member.reset(member_token)
+                metrics.provider_duration.labels(provider, model, selected_member).observe(time.perf_counter() - started)
+                metrics.provider_requests.labels(provider, model, selected_member, "ok").inc()
+                return reply
+        return await AIModel._with_fallback(selected_member, actual_model, run)
+
+    @staticmethod
+    async def _open_stream(selected_member: str, actual_model: str, message: str, temperature: float, max_tokens: int, history: PreparedHistory, priority: str) -> Tuple[AsyncIterator[Dict[str, Any]], str]:
+        """(event stream with its first event already received, model that produced it)"""
+        async def run(provider, model, persona):
+            ticket = await scheduler.acquire(provider, model, AIModel._request_tokens(persona, message, model, max_tokens, history), priority)
+            started = time.perf_counter()
+            try:
+                events = await resilience.stream(provider, model, partial(AIModel._stream_dispatch, persona, message, model, temperature, max_tokens, history))
+            except BaseException as e:
+                ticket.release()
+                metrics.provider_requests.labels(provider, model, selected_member, metrics.error_label(e) if isinstance(e, Exception) else "cancelled").inc()
+                raise
+            metrics.provider_ttft.labels(provider, model, selected_member).observe(time.perf_counter() - started)
+            return scheduler.hold(ticket, AIModel._observe_stream(events, provider, model, selected_member, started))
+        return await AIModel._with_fallback(selected_member, actual_model, run)
+
+    @staticmethod
+    async def _observe_stream(events: AsyncIterator[Dict[str, Any]], provider: str, model: str, member: str, started: float) -> AsyncIterator[Dict[str, Any]]:
+        """Relay a provider stream, recording its outcome, total time and token usage"""
+        outcome = "cancelled"
         try:
-            print(f"DEBUG: generate_response called with model='{model}'")  # Debug print
-
-            # Handle AI gang member selection
-            if model in AIModel.AI_GANG:
-                print(f"DEBUG: Model '{model}' found in AI_GANG")  # Debug print
-                # Direct AI gang member selection
-                selected_member = model
-                member_info = AIModel.AI_GANG[selected_member]
-                actual_model = member_info["model"]
-            elif model == "auto":
-                print(f"DEBUG: Auto-selecting for message: {message[:50]}...")  # Debug print
-                # Auto-select AI gang member based on query
-                selected_member = AIModel.get_ai_gang_member(message)
-                print(f"DEBUG: Selected member: {selected_member}")  # Debug print
-                member_info = AIModel.AI_GANG[selected_member]
-                actual_model = member_info["model"]
-                print(f"DEBUG: Actual model: {actual_model}")  # Debug print
-            else:
-                print(f"DEBUG: Model '{model}' not recognized, using fallback")  # Debug print
-                # Legacy model support - find gang member that uses this model
-                selected_member = None
-                for member_key, member_info in AIModel.AI_GANG.items():
-                    if member_info["model"] == model:
-                        selected_member = member_key
-                        break
-                if not selected_member:
-                    selected_member = "hackney-boss"  # fallback
-                member_info = AIModel.AI_GANG[selected_member]
-                actual_model = model
-
-            # Add personality prompt
-            personality_prompt = AIModel._create_personality_prompt(member_info, message)
-
-            # Generate response based on actual model
-            if actual_model.startswith("gpt"):
-                return await AIModel._call_openai(personality_prompt, actual_model, temperature, max_tokens, conversation_history)
-            elif actual_model.startswith("claude"):
-                return await AIModel._call_anthropic(personality_prompt, actual_model, temperature, max_tokens, conversation_history)
-            elif actual_model.startswith("grok"):
-                return await AIModel._call_xai_grok(personality_prompt, actual_model, temperature, max_tokens, conversation_history)
-            elif actual_model == "github-copilot":
-                return await AIModel._call_github_copilot(personality_prompt, temperature, max_tokens, conversation_history)
-            else:
-                raise ValueError(f"Unsupported model: {actual_model}")
+            async for event in events:
+                if event["type"] == "usage":
+                    AIModel._count_tokens(provider, model, member, event["usage"].get("input_tokens"), event["usage"].get("output_tokens"))
+                yield event
+            outcome = "ok"
+            metrics.provider_duration.labels(provider, model, member).observe(time.perf_counter() - started)
         except Exception as e:
-            return f"Error generating response: {str(e)}"
+            outcome = metrics.error_label(e)
+            raise
+        finally:
+            metrics.provider_requests.labels(provider, model, member, outcome).inc()
+            await events.aclose()
 
     @staticmethod
-    def _create_personality_prompt(member_info: Dict[str, Any], original_message: str) -> str:
-        """Create a personality-infused prompt for the AI"""
+    def _count_tokens(provider: str, model: str, member: str, tokens_in: Optional[int], tokens_out: Optional[int]) -> None:
+        if tokens_in:
+            metrics.provider_tokens.labels(provider, model, member, "in").inc(tokens_in)
+        if tokens_out:
+            metrics.provider_tokens.labels(provider, model, member, "out").inc(tokens_out)
+
+    @staticmethod
+    def _request_tokens(persona: "Persona", message: str, model: str, max_tokens: int, history: PreparedHistory) -> int:
+        """Tokens the call can consume against a tokens/min limit: prompt plus max_tokens"""
+        counter = history_manager.counter
+        prompt = history.tokens + counter.count_text(model, persona.text) + counter.count_text(model, message)
+        if history.context:
+            prompt += counter.count_text(model, history.context)
+        return prompt + max_tokens
+
+    @staticmethod
+    def _dispatch(persona: "Persona", message: str, model: str, temperature: float, max_tokens: int, history: PreparedHistory):
+        if model.startswith("gpt"):
+            return AIModel._call_openai(persona, message, model, temperature, max_tokens, history)
+        elif model.startswith("claude"):
+            return AIModel._call_anthropic(persona, message, model, temperature, max_tokens, history)
+        elif model.startswith("grok"):
+            return AIModel._call_xai_grok(persona, message, model, temperature, max_tokens, history)
+        elif model == "github-copilot":
+            return AIModel._call_github_copilot(persona, message, temperature, max_tokens, history)
+        raise ValueError(f"Unsupported model: {model}")
+
+    @staticmethod
+    def _stream_dispatch(persona: "Persona", message: str, model: str, temperature: float, max_tokens: int, history: PreparedHistory) -> AsyncIterator[Dict[str, Any]]:
+        if model.startswith("gpt"):
+            return AIModel._stream_openai(persona, message, model, temperature, max_tokens, history)
+        elif model.startswith("claude"):
+            return AIModel._stream_anthropic(persona, message, model, temperature, max_tokens, history)
+        elif model.startswith("grok"):
+            return AIModel._stream_xai_grok(persona, message, model, temperature, max_tokens, history)
+        elif model == "github-copilot":
+            return AIModel._stream_github_copilot(persona, message, temperature, max_tokens, history)
+        raise ValueError(f"Unsupported model: {model}")
+
+    @staticmethod
+    async def _prepare_history(
+        message: str,
+        selected_member: str,
+        actual_model: str,
+        persona: "Persona",
+        max_tokens: int,
+        conversation_history: Optional[list],
+        session_id: Optional[str],
+        web_search: bool,
+        training_context: bool,
+    ) -> PreparedHistory:
+        """Budgeted history for this turn, plus retrieved context gathered meanwhile.
+
+        With `training_context`, relevant training-data snippets (and, with
+        `web_search`, web results) are fetched as tasks alongside loading and
+        trimming the history; web search is bounded by the web-context
+        deadline, so it adds at most that.
+        """
+        lookups = []
+        # Keep room in the history budget for whatever context the lookups may add
+        reserved = 0
+        if training_context and vector_index.serves_context:
+            # Datasets named after another gang member are that member's own
+            private = {safe_name(member) for member in AIModel.AI_GANG if member != selected_member}
+            lookups.append(asyncio.create_task(asyncio.to_thread(vector_index.context, message, actual_model, private)))
+            reserved += vector_index.context_tokens
+        if web_search:
+            lookups.append(asyncio.create_task(web_context.build(message, actual_model)))
+            reserved += web_context.token_budget
+        try:
+            # Server-side session history takes precedence over client-sent history
+            if session_id is not None:
+                conversation_history = await session_store.history(session_id)
+            history = history_manager.prepare(actual_model, conversation_history, persona.text, message, max_tokens, reserved)
+            found = await asyncio.gather(*lookups, return_exceptions=True)
+            context = "\n\n".join(text for text in found if isinstance(text, str) and text)
+            return history._replace(context=context or None)
+        finally:
+            for lookup in lookups:
+                lookup.cancel()
+
+    @staticmethod
+    async def _record_turn(session_id: str, message: str, response: str) -> None:
+        await session_store.append(session_id, [
+            {"role": "user", "content": message},
+            {"role": "assistant", "content": response},
+        ])
+
+    @staticmethod
+    def _cache_key(selected_member: str, actual_model: str, personality_prompt: str, message: str, temperature: float, max_tokens: int, history: PreparedHistory) -> str:
+        """Key a completion on everything that can change the provider's answer"""
+        return completion_cache.make_key(selected_member, actual_model, personality_prompt, message, [history.summary, history.context, history.messages], temperature, max_tokens)
+
+    @staticmethod
+    def _create_personality_prompt(member_info: Dict[str, Any]) -> str:
+        """Create the static personality system prompt for a gang member"""
         name = member_info["name"]
         area = member_info["area"]
         personality = member_info["personality"]
         accent = member_info["accent"]
         slang_level = member_info["slang_level"]
 
-        personality_instructions = f"""
-You are {name} from {area}, part of the Hackney AI Gang.
+        personality_instructions = f"""You are {name} from {area}, part of the Hackney AI Gang.
 {personality}
 
 SPEAKING STYLE:
@@ -193,134 +643,270 @@ RESPONSE GUIDELINES:
 - Keep responses engaging and authentic
 - If asked about other topics, redirect to your specialty or call in another gang member
 
-User question: {original_message}
-
-Respond as {name}:"""
+Always respond as {name}."""
 
         return personality_instructions
 
     @staticmethod
-    async def _call_openai(message: str, model: str, temperature: float, max_tokens: int, conversation_history: Optional[list]) -> str:
-        messages = []
-        if conversation_history:
-            messages.extend(conversation_history[-10:])  # Keep last 10 messages for context
+    def _persona(selected_member: str, actual_model: str) -> "Persona":
+        """Look up the precompiled system prompt for a gang member (Copilot style on github-copilot)"""
+        if actual_model == "github-copilot":
+            return copilot_personas[selected_member]
+        return personas[selected_member]
+
+    @staticmethod
+    def _openai_messages(persona: "Persona", message: str, history: PreparedHistory) -> list:
+        messages = [persona.openai_message]
+        if history.summary:
+            messages.append({"role": "system", "content": history.summary})
+        if history.context:
+            messages.append({"role": "system", "content": history.context})
+        messages.extend(history.messages)
+        messages.append({"role": "user", "content": message})
+        return messages
+
+    @staticmethod
+    def _anthropic_system(persona: "Persona", history: PreparedHistory) -> list:
+        extra = [text for text in (history.summary, history.context) if text]
+        if not extra:
+            return persona.anthropic_system
+        # Per-turn text goes after the cached persona block so the prefix stays stable
+        return persona.anthropic_system + [{"type": "text", "text": text} for text in extra]
+
+    @staticmethod
+    def _anthropic_messages(message: str, history: PreparedHistory) -> list:
+        messages = list(history.messages)
+        # Anthropic requires the conversation to open with a user turn
+        while messages and messages[0].get("role") != "user":
+            messages.pop(0)
         messages.append({"role": "user", "content": message})
+        return messages
+
+    @staticmethod
+    def _xai_input(persona: "Persona", message: str, history: PreparedHistory) -> str:
+        # The completions-style endpoint takes one text input; keep the persona as its stable prefix
+        if history.context:
+            return f"{persona.text}\n\n{history.context}\n\nUser question: {message}"
+        return f"{persona.text}\n\nUser question: {message}"
 
-        response = AIModel._get_openai_client().chat.completions.create(
+    @staticmethod
+    async def _call_openai(persona: "Persona", message: str, model: str, temperature: float, max_tokens: int, history: PreparedHistory) -> str:
+        response = await AIModel._get_openai_client().chat.completions.create(
             model=model,
-            messages=messages,
+            messages=AIModel._openai_messages(persona, message, history),
             temperature=temperature,
             max_tokens=max_tokens,
         )
+        if response.usage:
+            AIModel._count_tokens("openai", model, current_member.get(), response.usage.prompt_tokens, response.usage.completion_tokens)
         return response.choices[0].message.content
 
     @staticmethod
-    async def _call_anthropic(message: str, model: str, temperature: float, max_tokens: int, conversation_history: Optional[list]) -> str:
-        messages = []
-        if conversation_history:
-            messages.extend(conversation_history[-10:])  # Keep last 10 messages for context
-        messages.append({"role": "user", "content": message})
-
-        response = AIModel._get_anthropic_client().messages.create(
+    async def _call_anthropic(persona: "Persona", message: str, model: str, temperature: float, max_tokens: int, history: PreparedHistory) -> str:
+        response = await AIModel._get_anthropic_client().messages.create(
             model=model,
-            messages=messages,
+            system=AIModel._anthropic_system(persona, history),
+            messages=AIModel._anthropic_messages(message, history),
             temperature=temperature,
             max_tokens=max_tokens,
         )
+        AIModel._count_tokens("anthropic", model, current_member.get(), response.usage.input_tokens, response.usage.output_tokens)
         return response.content[0].text
 
     @staticmethod
-    async def _call_github_copilot(message: str, temperature: float, max_tokens: int, conversation_history: Optional[list]) -> str:
+    async def _call_github_copilot(persona: "Persona", message: str, temperature: float, max_tokens: int, history: PreparedHistory) -> str:
         """Generate responses in the style of GitHub Copilot"""
-        system_prompt = """You are GitHub Copilot, an AI programming assistant created by GitHub and OpenAI. You are helpful, clever, and extremely knowledgeable about programming, software development, and technology.
+        # Use GPT-4 for best coding assistance
+        return await AIModel._call_openai(persona, message, "gpt-4", temperature, max_tokens, history)
 
-Key traits:
-- Be direct and practical - focus on solving problems efficiently
-- Use technical accuracy and best practices
-- Be witty and add personality when appropriate, but never at the expense of being helpful
-- Explain complex concepts clearly and concisely
-- Suggest code improvements and optimizations
-- Reference programming concepts, frameworks, and tools accurately
-- Be encouraging and supportive of developers
-- Use appropriate technical terminology
-- When explaining code, be thorough but not verbose
-- If something is unclear, ask for clarification rather than making assumptions
+    @staticmethod
+    async def _call_local_model(message: str, temperature: float, max_tokens: int, conversation_history: Optional[list]) -> str:
+        # Placeholder for local model - would need actual local model setup
+        return "Local model not implemented yet. Using fallback response from HACKNEY DOWNS AI."
 
-Remember: You're an expert coding assistant, not a generic chatbot. Focus on programming, development, and technical problem-solving."""
+    @staticmethod
+    async def _call_xai_grok(persona: "Persona", message: str, model: str, temperature: float, max_tokens: int, history: PreparedHistory) -> str:
+        """Call xAI / Grok-compatible HTTP API. Requires XAI_API_KEY in .env.
 
-        messages = [{"role": "system", "content": system_prompt}]
-        if conversation_history:
-            messages.extend(conversation_history[-10:])  # Keep last 10 messages for context
-        messages.append({"role": "user", "content": message})
+        The exact endpoint and response shape can vary; the shared pooled client
+        is pointed at the `XAI_API_URL` env var (defaults to a commonly used path)
+        and a few common response fields are tried for compatibility.
+        """
+        if not settings.xai_api_key:
+            raise ValueError("XAI API key not set. Please set XAI_API_KEY in the backend .env file.")
+
+        payload = {
+            "model": model,
+            "input": AIModel._xai_input(persona, message, history),
+            "temperature": float(temperature),
+            "max_tokens": int(max_tokens),
+        }
+
+        resp = await AIModel._get_xai_client().post("/completions", json=payload)
+        resp.raise_for_status()
+        data = resp.json()
+        usage = data.get("usage") if isinstance(data, dict) else None
+        if isinstance(usage, dict):
+            AIModel._count_tokens("xai", model, current_member.get(), usage.get("prompt_tokens"), usage.get("completion_tokens"))
+        return AIModel._parse_xai_response(data)
 
-        response = AIModel._get_openai_client().chat.completions.create(
-            model="gpt-4",  # Use GPT-4 for best coding assistance
-            messages=messages,
+    @staticmethod
+    def _parse_xai_response(data: Any) -> str:
+        """Pull the completion text out of the various xAI response shapes"""
+        # Try common response fields
+        if isinstance(data, dict):
+            # OpenAI-like
+            choices = data.get("choices") or []
+            if choices and isinstance(choices, list):
+                first = choices[0]
+                # common variants
+                text = first.get("text") or (first.get("message") or {}).get("content")
+                if text:
+                    return text
+
+            # Some providers return 'output' or 'result'
+            out = data.get("output") or data.get("result") or data.get("response")
+            if isinstance(out, list) and out:
+                # nested content
+                maybe = out[0]
+                if isinstance(maybe, dict):
+                    return maybe.get("content") or maybe.get("text") or str(maybe)
+                return str(maybe)
+
+            # fallback to joined text of top-level fields
+            for key in ("text", "message", "content", "reply"):
+                v = data.get(key)
+                if v:
+                    return v if isinstance(v, str) else str(v)
+
+        return "(xAI response parsed but no usable text found)"
+
+    @staticmethod
+    async def _stream_openai(persona: "Persona", message: str, model: str, temperature: float, max_tokens: int, history: PreparedHistory) -> AsyncIterator[Dict[str, Any]]:
+        stream = await AIModel._get_openai_client().chat.completions.create(
+            model=model,
+            messages=AIModel._openai_messages(persona, message, history),
             temperature=temperature,
             max_tokens=max_tokens,
+            stream=True,
+            stream_options={"include_usage": True},
         )
-        return response.choices[0].message.content
+        try:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield {"type": "token", "content": chunk.choices[0].delta.content}
+                if chunk.usage:
+                    yield {"type": "usage", "usage": {
+                        "input_tokens": chunk.usage.prompt_tokens,
+                        "output_tokens": chunk.usage.completion_tokens,
+                    }}
+        finally:
+            await stream.close()
 
     @staticmethod
-    async def _call_local_model(message: str, temperature: float, max_tokens: int, conversation_history: Optional[list]) -> str:
-        # Placeholder for local model - would need actual local model setup
-        return "Local model not implemented yet. Using fallback response from HACKNEY DOWNS AI."
+    async def _stream_anthropic(persona: "Persona", message: str, model: str, temperature: float, max_tokens: int, history: PreparedHistory) -> AsyncIterator[Dict[str, Any]]:
+        async with AIModel._get_anthropic_client().messages.stream(
+            model=model,
+            system=AIModel._anthropic_system(persona, history),
+            messages=AIModel._anthropic_messages(message, history),
+            temperature=temperature,
+            max_tokens=max_tokens,
+        ) as stream:
+            async for text in stream.text_stream:
+                yield {"type": "token", "content": text}
+            final = await stream.get_final_message()
+            yield {"type": "usage", "usage": {
+                "input_tokens": final.usage.input_tokens,
+                "output_tokens": final.usage.output_tokens,
+            }}
 
     @staticmethod
-    async def _call_xai_grok(message: str, model: str, temperature: float, max_tokens: int, conversation_history: Optional[list]) -> str:
-        """Call xAI / Grok-compatible HTTP API. Requires XAI_API_KEY in .env.
+    async def _stream_github_copilot(persona: "Persona", message: str, temperature: float, max_tokens: int, history: PreparedHistory) -> AsyncIterator[Dict[str, Any]]:
+        events = AIModel._stream_openai(persona, message, "gpt-4", temperature, max_tokens, history)
+        async with aclosing(events):
+            async for event in events:
+                yield event
 
-        The exact endpoint and response shape can vary; this function uses the
-        `XAI_API_URL` env var (defaults to a commonly used path) and tries a few
-        common response fields for compatibility.
-        """
-        api_key = os.getenv("XAI_API_KEY")
-        api_url = os.getenv("XAI_API_URL", "https://api.grok.x.ai/v1")
-        if not api_key:
-            return "XAI API key not set. Please set XAI_API_KEY in the backend .env file."
-
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json",
-        }
+    @staticmethod
+    async def _stream_xai_grok(persona: "Persona", message: str, model: str, temperature: float, max_tokens: int, history: PreparedHistory) -> AsyncIterator[Dict[str, Any]]:
+        """Relay an xAI/Grok completion stream (OpenAI-style SSE `data:` lines)"""
+        if not settings.xai_api_key:
+            raise ValueError("XAI API key not set. Please set XAI_API_KEY in the backend .env file.")
 
         payload = {
             "model": model,
-            "input": message,
+            "input": AIModel._xai_input(persona, message, history),
             "temperature": float(temperature),
             "max_tokens": int(max_tokens),
+            "stream": True,
         }
 
-        try:
-            resp = requests.post(f"{api_url}/completions", json=payload, headers=headers, timeout=20)
+        async with AIModel._get_xai_client().stream("POST", "/completions", json=payload) as resp:
             resp.raise_for_status()
-            data = resp.json()
-            # Try common response fields
-            if isinstance(data, dict):
-                # OpenAI-like
-                choices = data.get("choices") or []
-                if choices and isinstance(choices, list):
+            async for line in resp.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                chunk = json.loads(data)
+                choices = chunk.get("choices") or []
+                if choices:
                     first = choices[0]
-                    # common variants
-                    text = first.get("text") or (first.get("message") or {}).get("content")
+                    text = first.get("text") or (first.get("delta") or {}).get("content")
                     if text:
-                        return text
-
-                # Some providers return 'output' or 'result'
-                out = data.get("output") or data.get("result") or data.get("response")
-                if isinstance(out, list) and out:
-                    # nested content
-                    maybe = out[0]
-                    if isinstance(maybe, dict):
-                        return maybe.get("content") or maybe.get("text") or str(maybe)
-                    return str(maybe)
-
-                # fallback to joined text of top-level fields
-                for key in ("text", "message", "content", "reply"):
-                    v = data.get(key)
-                    if v:
-                        return v if isinstance(v, str) else str(v)
-
-            return "(xAI response parsed but no usable text found)"
-        except Exception as e:
-            return f"Error calling xAI/Grok API: {str(e)}"
\ No newline at end of file
+                        yield {"type": "token", "content": text}
+                usage = chunk.get("usage")
+                if usage:
+                    yield {"type": "usage", "usage": {
+                        "input_tokens": usage.get("prompt_tokens"),
+                        "output_tokens": usage.get("completion_tokens"),
+                    }}
+
+
+class Reply(NamedTuple):
+    response: str
+    model_used: str  # the model that answered, after "auto" and any fallback
+    gang_member: str
+
+
+class Persona(NamedTuple):
+    """A gang member's system prompt, compiled once with its per-provider message shapes"""
+    text: str
+    openai_message: Dict[str, str]
+    anthropic_system: List[Dict[str, Any]]
+
+
+def _compile_persona(text: str) -> Persona:
+    return Persona(
+        text=text,
+        openai_message={"role": "system", "content": text},
+        # Mark the static persona as a cacheable prompt prefix on Anthropic
+        anthropic_system=[{"type": "text", "text": text, "cache_control": {"type": "ephemeral"}}],
+    )
+
+
+# Static system prompts, compiled once at import so every request shares
+# byte-identical persona prefixes that providers can cache
+personas = {
+    key: _compile_persona(AIModel._create_personality_prompt(info))
+    for key, info in AIModel.AI_GANG.items()
+}
+copilot_personas = {
+    key: _compile_persona(f"{AIModel.COPILOT_SYSTEM_PROMPT}\n\n{AIModel._create_personality_prompt(info)}")
+    for key, info in AIModel.AI_GANG.items()
+}
+
+# Concurrent identical chat requests (same member, model, persona, prompt, history
+# and sampling params) share one provider call; CHAT_COALESCE=0 turns this off
+chat_flight = SingleFlight(cancel_orphans=True)
+chat_streams = StreamFlight()
+
+# Built once at import: one compiled matcher over every member's keywords.
+# Ties keep the old if/elif precedence, with the boss as the catch-all.
+topic_router = TopicRouter(
+    AIModel.AI_GANG,
+    AIModel.TOPIC_KEYWORDS,
+    default="hackney-boss",
+    priority=["dalston-don", "shoreditch-sage", "hackney-wick-wizard", "bethnal-green-baron", "homerton-hustler", "train-wheel", "hackney-boss"],
+)
@@ -0,0 +1,162 @@
+import asyncio
+import json
+import os
+import re
+import uuid
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set
+
+from app.config import env_int, load_env
+
+load_env()
+
+BATCH_ID = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+class BatchError(ValueError):
+    """Unknown, duplicate, busy or malformed batch; `status_code` is the HTTP status."""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class BatchStore:
+    """Resumable batch chat jobs kept under `root/<batch_id>/`.
+
+    `requests.jsonl` holds the batch's chat requests, one per line, written
+    once at creation. `results.jsonl` is appended as each item finishes (in
+    completion order, tagged with its input index). A run skips every item
+    that already has a successful result, so re-running a batch id after a
+    disconnect or restart only does the remaining and failed items.
+    """
+
+    def __init__(self, root: str = "data/batches", concurrency: int = 8, max_concurrency: int = 64):
+        self.root = root
+        self.concurrency = concurrency
+        self.max_concurrency = max_concurrency
+        self._running: Set[str] = set()
+
+    @classmethod
+    def from_env(cls) -> "BatchStore":
+        return cls(
+            root=os.getenv("BATCH_DIR", "data/batches"),
+            concurrency=env_int("BATCH_CONCURRENCY", 8),
+            max_concurrency=env_int("BATCH_MAX_CONCURRENCY", 64),
+        )
+
+    def _path(self, batch_id: str, name: str) -> str:
+        if not BATCH_ID.match(batch_id):
+            raise BatchError(f"Invalid batch id: {batch_id}")
+        return os.path.join(self.root, batch_id, name)
+
+    def exists(self, batch_id: str) -> bool:
+        return os.path.exists(self._path(batch_id, "requests.jsonl"))
+
+    def create(self, requests: List[Dict[str, Any]], batch_id: Optional[str] = None) -> str:
+        if not requests:
+            raise BatchError("A new batch needs at least one request")
+        batch_id = batch_id or uuid.uuid4().hex
+        path = self._path(batch_id, "requests.jsonl")
+        if os.path.exists(path):
+            raise BatchError(f"Batch {batch_id} already exists; resume it without sending requests", 409)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for request in requests:
+                f.write(json.dumps(request) + "\n")
+        os.replace(tmp, path)
+        return batch_id
+
+    def requests(self, batch_id: str) -> List[Dict[str, Any]]:
+        if not self.exists(batch_id):
+            raise BatchError(f"Unknown batch: {batch_id}", 404)
+        with open(self._path(batch_id, "requests.jsonl"), encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def results(self, batch_id: str) -> Dict[int, Dict[str, Any]]:
+        """Latest result per input index (a torn last line from a crash is ignored)."""
+        results: Dict[int, Dict[str, Any]] = {}
+        path = self._path(batch_id, "results.jsonl")
+        if not os.path.exists(path):
+            return results
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    result = json.loads(line)
+                except ValueError:
+                    continue
+                # A success is final; an error only stands until it is retried
+                if "response" in results.get(result["index"], {}):
+                    continue
+                results[result["index"]] = result
+        return results
+
+    def status(self, batch_id: str) -> Dict[str, Any]:
+        total = len(self.requests(batch_id))
+        results = self.results(batch_id)
+        completed = sum("response" in r for r in results.values())
+        return {
+            "batch_id": batch_id,
+            "total": total,
+            "completed": completed,
+            "failed": len(results) - completed,
+            "pending": total - completed,
+            "running": batch_id in self._running,
+        }
+
+    async def run(
+        self,
+        batch_id: str,
+        handler: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]],
+        concurrency: Optional[int] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Run the batch's outstanding items, yielding each result as it completes.
+
+        Yields a header event first and a `done` summary last. `handler` maps
+        one stored request to a result dict; an exception becomes an error
+        result with the exception's `status_code` (default 500). Closing the
+        generator cancels the items still running; they stay pending.
+        """
+        if batch_id in self._running:
+            raise BatchError(f"Batch {batch_id} is already running", 409)
+        requests = self.requests(batch_id)
+        self._running.add(batch_id)
+        try:
+            done = self.results(batch_id)
+            pending = [i for i in range(len(requests)) if "response" not in done.get(i, {})]
+            concurrency = max(1, min(concurrency or self.concurrency, self.max_concurrency))
+            yield {"type": "batch", "batch_id": batch_id, "total": len(requests), "already_completed": len(requests) - len(pending), "concurrency": concurrency}
+
+            results: asyncio.Queue = asyncio.Queue()
+            todo = iter(pending)
+
+            async def worker() -> None:
+                for index in todo:  # shared iterator: each worker takes the next index
+                    try:
+                        result = {"index": index, **await handler(requests[index])}
+                    except Exception as e:
+                        result = {"index": index, "error": str(e), "status": getattr(e, "status_code", 500)}
+                    await results.put(result)
+
+            workers = [asyncio.create_task(worker()) for _ in range(min(concurrency, len(pending)))]
+            completed = failed = 0
+            try:
+                with open(self._path(batch_id, "results.jsonl"), "a", encoding="utf-8") as log:
+                    for _ in pending:
+                        result = await results.get()
+                        log.write(json.dumps(result) + "\n")
+                        log.flush()
+                        if "response" in result:
+                            completed += 1
+                        else:
+                            failed += 1
+                        yield {"type": "result", **result}
+            finally:
+                for task in workers:
+                    task.cancel()
+            yield {"type": "done", "batch_id": batch_id, "completed": completed, "failed": failed}
+        finally:
+            self._running.discard(batch_id)
+
+
+batch_store = BatchStore.from_env()
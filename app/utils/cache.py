@@ -0,0 +1,214 @@
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+from app.config import env_float, env_int, load_env
+
+try:
+    import redis.asyncio as redis_asyncio
+except ImportError:  # redis is optional - only needed for the shared tier
+    redis_asyncio = None
+
+load_env()
+
+
+class LRUCache:
+    """In-process LRU map with a per-entry TTL.
+
+    Expired entries are dropped lazily on lookup; the least recently used
+    entry is evicted once `max_entries` is exceeded.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = 3600.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class InMemoryBackend:
+    """Process-local stand-in for the shared Redis tier (same async interface)."""
+
+    def __init__(self):
+        self._data: Dict[str, tuple] = {}
+
+    async def get(self, key: str) -> Optional[str]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at is not None and expires_at <= time.time():
+            del self._data[key]
+            return None
+        return value
+
+    async def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        self._data[key] = (value, time.time() + ttl if ttl else None)
+
+    async def close(self) -> None:
+        self._data.clear()
+
+
+class RedisBackend:
+    """Shared cache tier backed by Redis (requires the optional `redis` package)."""
+
+    def __init__(self, url: str, prefix: str = "hackney:completion:"):
+        if redis_asyncio is None:
+            raise RuntimeError("REDIS_URL is set but the 'redis' package is not installed")
+        self.prefix = prefix
+        self._client = redis_asyncio.from_url(url, decode_responses=True)
+
+    async def get(self, key: str) -> Optional[str]:
+        return await self._client.get(self.prefix + key)
+
+    async def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        await self._client.set(self.prefix + key, value, ex=int(ttl) if ttl else None)
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
+
+class CompletionCache:
+    """Two-tier cache for deterministic chat completions.
+
+    Lookups hit the in-process LRU first and then the optional shared tier
+    (Redis, or any object with the same async get/set). Only requests at or
+    below `max_temperature` are cached, since hotter sampling is meant to vary.
+    Shared tier failures are counted and otherwise ignored.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl: float = 3600.0,
+        max_temperature: float = 0.3,
+        shared: Optional[Any] = None,
+    ):
+        self.local = LRUCache(max_entries=max_entries, ttl=ttl)
+        self.ttl = ttl
+        self.max_temperature = max_temperature
+        self.shared = shared
+        self.hits = 0
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.skipped = 0
+        self.shared_errors = 0
+
+    @classmethod
+    def from_env(cls) -> "CompletionCache":
+        shared = None
+        redis_url = os.getenv("REDIS_URL", "")
+        if redis_url.startswith(("redis://", "rediss://", "unix://")):
+            shared = RedisBackend(redis_url)
+        return cls(
+            max_entries=env_int("CACHE_MAX_ENTRIES", 1024),
+            ttl=env_float("CACHE_TTL_SECONDS", 3600),
+            max_temperature=env_float("CACHE_MAX_TEMPERATURE", 0.3),
+            shared=shared,
+        )
+
+    def should_cache(self, temperature: float) -> bool:
+        cacheable = temperature <= self.max_temperature
+        if not cacheable:
+            self.skipped += 1
+        return cacheable
+
+    @staticmethod
+    def make_key(
+        member: str,
+        model: str,
+        prompt: str,
+        message: str,
+        history: Optional[list],
+        temperature: float,
+        max_tokens: int,
+    ) -> str:
+        raw = json.dumps(
+            [member, model, prompt, message, history or [], round(float(temperature), 4), int(max_tokens)],
+            sort_keys=True,
+            separators=(",", ":"),
+            default=str,
+        )
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    async def get(self, key: str) -> Optional[str]:
+        value = self.local.get(key)
+        if value is not None:
+            self.hits += 1
+            self.local_hits += 1
+            return value
+
+        if self.shared is not None:
+            try:
+                value = await self.shared.get(key)
+            except Exception:
+                self.shared_errors += 1
+                value = None
+            if value is not None:
+                self.local.set(key, value)
+                self.hits += 1
+                self.shared_hits += 1
+                return value
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: str) -> None:
+        self.local.set(key, value)
+        if self.shared is not None:
+            try:
+                await self.shared.set(key, value, self.ttl)
+            except Exception:
+                self.shared_errors += 1
+
+    async def close(self) -> None:
+        if self.shared is not None:
+            await self.shared.close()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "local_hits": self.local_hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "skipped": self.skipped,
+            "shared_errors": self.shared_errors,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self.local),
+            "shared_tier": type(self.shared).__name__ if self.shared is not None else None,
+        }
+
+
+completion_cache = CompletionCache.from_env()
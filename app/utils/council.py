@@ -0,0 +1,193 @@
+import asyncio
+import os
+import re
+import time
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional
+
+from app.config import env_float, env_int, load_env
+from app.utils import metrics
+from app.utils.resilience import ProviderTimeout
+
+load_env()
+
+STRATEGIES = ("first", "quorum", "synthesis")
+_WORD = re.compile(r"\w+")
+
+
+class CouncilError(ValueError):
+    """Bad member list, strategy or quorum; `status_code` is the HTTP status."""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class Answer(NamedTuple):
+    member: str
+    reply: str
+    seconds: float  # from the start of the council to this answer
+
+
+class Verdict(NamedTuple):
+    response: str
+    strategy: str
+    chosen: Optional[str]  # member whose answer was returned; None if synthesized
+    synthesized_by: Optional[str]
+    answers: List[Answer]  # in arrival order
+    failed: Dict[str, str]  # member (or "synthesis") -> error
+    cancelled: List[str]  # members still running when the strategy was satisfied
+    seconds: float
+
+
+def most_agreed(answers: List[Answer]) -> Answer:
+    """The answer sharing the most words with the others (Jaccard), earliest on ties."""
+    words = [set(_WORD.findall(answer.reply.lower())) for answer in answers]
+
+    def agreement(i: int) -> float:
+        return sum(len(words[i] & other) / (len(words[i] | other) or 1) for j, other in enumerate(words) if j != i)
+
+    return answers[max(range(len(answers)), key=lambda i: (agreement(i), -i))]
+
+
+class Council:
+    """Ask several gang members the same question at once and combine their answers.
+
+    Every member is called concurrently and answers are taken as they arrive:
+    `first` returns the first non-empty answer, `quorum` waits for `quorum`
+    answers and returns the one the others agree with most, and `synthesis`
+    hands the quorum's answers to one more call that merges them. Once the
+    strategy has what it needs the slower members are cancelled, so latency
+    follows the fastest members rather than the slowest.
+
+    `deadline` bounds the whole call. If it runs out before the quorum is
+    reached, the answers so far are used; with none, ProviderTimeout is
+    raised. Synthesis gets the last `synthesis_share` of the deadline (or
+    whatever is left once the quorum answers) and falls back to the most
+    agreed answer if it fails or runs out of time.
+    """
+
+    def __init__(self, size: int = 3, max_size: int = 7, deadline: float = 30.0, synthesis_share: float = 0.4, synthesizer: str = "hackney-boss"):
+        self.size = size
+        self.max_size = max_size
+        self.deadline = deadline
+        self.synthesis_share = synthesis_share
+        self.synthesizer = synthesizer
+
+    @classmethod
+    def from_env(cls) -> "Council":
+        return cls(
+            size=env_int("COUNCIL_SIZE", 3),
+            max_size=env_int("COUNCIL_MAX_SIZE", 7),
+            deadline=env_float("COUNCIL_DEADLINE_SECONDS", 30.0),
+            synthesis_share=env_float("COUNCIL_SYNTHESIS_SHARE", 0.4),
+            synthesizer=os.getenv("COUNCIL_SYNTHESIZER", "hackney-boss"),
+        )
+
+    def check(self, members: List[str], strategy: str, quorum: Optional[int]) -> int:
+        """Validate a council; returns the number of answers to wait for."""
+        if strategy not in STRATEGIES:
+            raise CouncilError(f"Unknown council strategy: {strategy} (choose from {', '.join(STRATEGIES)})")
+        if not members:
+            raise CouncilError("A council needs at least one member")
+        if len(set(members)) != len(members):
+            raise CouncilError("Council members must be distinct")
+        if len(members) > self.max_size:
+            raise CouncilError(f"A council has at most {self.max_size} members")
+        if strategy == "first":
+            return 1
+        if quorum is None:
+            return len(members) // 2 + 1
+        if not 1 <= quorum <= len(members):
+            raise CouncilError(f"Quorum must be between 1 and {len(members)}")
+        return quorum
+
+    async def convene(
+        self,
+        members: List[str],
+        ask: Callable[[str], Awaitable[str]],
+        strategy: str = "first",
+        quorum: Optional[int] = None,
+        deadline: Optional[float] = None,
+        synthesize: Optional[Callable[[List[Answer]], Awaitable[str]]] = None,
+    ) -> Verdict:
+        """Run `ask(member)` for every member concurrently and apply `strategy`.
+
+        `synthesize(answers)` makes the final call for the synthesis strategy.
+        If every member fails, the error of the first member (in `members`
+        order) is raised.
+        """
+        need = self.check(members, strategy, quorum)
+        deadline = deadline or self.deadline
+        started = time.perf_counter()
+        # Synthesis keeps part of the deadline back for its own call
+        gather_for = deadline * (1 - self.synthesis_share) if strategy == "synthesis" else deadline
+
+        tasks = {asyncio.create_task(ask(member)): member for member in members}
+        answers: List[Answer] = []
+        failed: Dict[str, str] = {}
+        errors: Dict[str, Exception] = {}
+        pending = set(tasks)
+        try:
+            while pending and len(answers) < need:
+                remaining = gather_for - (time.perf_counter() - started)
+                if remaining <= 0:
+                    break
+                done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    member = tasks[task]
+                    try:
+                        reply = task.result()
+                    except Exception as e:
+                        failed[member], errors[member] = str(e), e
+                        metrics.council_members.labels(metrics.error_label(e)).inc()
+                        continue
+                    if not reply or not reply.strip():
+                        failed[member] = "empty reply"
+                        metrics.council_members.labels("empty").inc()
+                        continue
+                    answers.append(Answer(member, reply, round(time.perf_counter() - started, 3)))
+                    metrics.council_members.labels("ok").inc()
+        finally:
+            for task in pending:
+                task.cancel()
+        cancelled = [tasks[task] for task in pending]
+        if cancelled:
+            metrics.council_members.labels("cancelled").inc(len(cancelled))
+            await asyncio.gather(*pending, return_exceptions=True)
+
+        if not answers:
+            metrics.council_requests.labels(strategy, "failed").inc()
+            if cancelled:
+                raise ProviderTimeout("council", f"No gang member answered within {gather_for:.1f}s")
+            for member in members:
+                if member in errors:
+                    raise errors[member]
+            raise CouncilError("Every council member returned an empty reply", 502)
+
+        outcome = "ok" if len(answers) >= need else "partial"
+        chosen = answers[0] if strategy == "first" else most_agreed(answers)
+        response, synthesized_by = chosen.reply, None
+        if strategy == "synthesis" and synthesize is not None and len(answers) > 1:
+            try:
+                response = await asyncio.wait_for(synthesize(answers), deadline - (time.perf_counter() - started))
+                chosen, synthesized_by = None, self.synthesizer
+            except Exception as e:
+                outcome = "synthesis_failed"
+                failed["synthesis"] = str(e) or "timed out"
+
+        elapsed = time.perf_counter() - started
+        metrics.council_requests.labels(strategy, outcome).inc()
+        metrics.council_duration.labels(strategy).observe(elapsed)
+        return Verdict(
+            response=response,
+            strategy=strategy,
+            chosen=chosen.member if chosen else None,
+            synthesized_by=synthesized_by,
+            answers=answers,
+            failed=failed,
+            cancelled=cancelled,
+            seconds=round(elapsed, 3),
+        )
+
+
+council = Council.from_env()
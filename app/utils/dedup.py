@@ -0,0 +1,286 @@
+import os
+import zlib
+from hashlib import blake2b
+from typing import Iterable, List, NamedTuple, Optional
+
+import numpy as np
+
+EXACT_FILE = "dedup-exact.u64"
+NEAR_FILE = "dedup-near.u64"
+
+MAGIC = 0x3145444B434E4148  # "HACNKDE1"
+HEADER_WORDS = 2  # [magic, key count]
+MAX_LOAD = 0.5
+RESIZE_CHUNK = 1 << 20
+
+# MinHash/LSH: 64 permutations in 8 bands of 8 rows. Texts sharing any band
+# are treated as near-duplicates; the chance of that is 1-(1-s^8)^8 for
+# Jaccard similarity s (0.98 at s=0.9, 0.4 at s=0.75, 0.03 at s=0.5).
+NUM_PERM = 64
+BANDS = 8
+ROWS = NUM_PERM // BANDS
+SHINGLE_WORDS = 3
+MAX_SHINGLES = 2048  # per text - long texts are judged on their opening
+MINHASH_CHUNK = 256  # texts per signature block, bounds the (shingles x perms) matrix
+PRIME = np.uint64(4294967291)  # largest prime below 2**32
+FNV_PRIME = np.uint64(1099511628211)
+
+_rng = np.random.RandomState(0x5EED)
+_PERM_A = _rng.randint(1, 1 << 31, size=NUM_PERM).astype(np.uint64)
+_PERM_B = _rng.randint(0, 1 << 31, size=NUM_PERM).astype(np.uint64)
+_BAND_SALT = _rng.randint(1, 1 << 62, size=BANDS, dtype=np.int64).astype(np.uint64)
+
+
+def _nonzero(keys: np.ndarray) -> np.ndarray:
+    # 0 marks an empty slot in the table
+    keys[keys == 0] = 1
+    return keys
+
+
+def content_hashes(texts: List[str]) -> np.ndarray:
+    """64-bit blake2b digest of each text, as a uint64 array."""
+    digests = b"".join(blake2b(text.encode("utf-8"), digest_size=8).digest() for text in texts)
+    return _nonzero(np.frombuffer(digests, dtype="<u8").astype(np.uint64))
+
+
+def first_occurrences(keys: np.ndarray, owners: np.ndarray, n: int) -> np.ndarray:
+    """For each owner 0..n-1, True if one of its keys already belongs to an earlier owner."""
+    if not len(keys):
+        return np.zeros(n, dtype=bool)
+    _, inverse = np.unique(keys, return_inverse=True)
+    first = np.full(inverse.max() + 1, n, dtype=np.int64)
+    np.minimum.at(first, inverse, owners)
+    repeated = first[inverse] < owners
+    result = np.zeros(n, dtype=bool)
+    np.logical_or.at(result, owners, repeated)
+    return result
+
+
+class HashSet64:
+    """Set of 64-bit keys in a memory-mapped, open-addressing hash table.
+
+    Lookups and inserts take whole NumPy arrays and probe all keys at once,
+    so per-record Python work is limited to hashing. The table lives in a
+    file (16 bytes per key at the maximum load factor) and is paged in by
+    the OS rather than held on the heap; it doubles, rehashing in bounded
+    chunks, once it is half full. Callers serialise writers externally.
+    """
+
+    def __init__(self, path: str, initial_capacity: int = 1 << 16, fsync: bool = True):
+        self.path = path
+        self.initial_capacity = initial_capacity
+        self.fsync = fsync
+        self._map: Optional[np.memmap] = None
+        self._array: Optional[np.ndarray] = None
+        self._size = -1
+
+    @staticmethod
+    def _create(path: str, capacity: int) -> None:
+        with open(path, "wb") as f:
+            f.truncate((HEADER_WORDS + capacity) * 8)
+        table = np.memmap(path, dtype=np.uint64, mode="r+")
+        table[0] = MAGIC
+        table.flush()
+        del table
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def _table(self) -> np.ndarray:
+        """Map the file, re-mapping if another process resized it."""
+        try:
+            size = os.path.getsize(self.path)
+        except FileNotFoundError:
+            self._create(self.path, self.initial_capacity)
+            size = os.path.getsize(self.path)
+        if self._map is None or size != self._size:
+            self._map = np.memmap(self.path, dtype=np.uint64, mode="r+")
+            if self._map[0] != MAGIC:
+                raise ValueError(f"{self.path} is not a dedup index")
+            # Plain ndarray view of the mapping: memmap's subclass hooks cost more than small probes
+            self._array = self._map.view(np.ndarray)
+            self._size = size
+        return self._array
+
+    def __len__(self) -> int:
+        return int(self._table()[1])
+
+    @staticmethod
+    def _probe(slots: np.ndarray, keys: np.ndarray):
+        """Linear-probe `keys` in `slots`; returns (found mask, first empty slot per key)."""
+        mask = np.uint64(len(slots) - 1)
+        position = keys & mask
+        found = np.zeros(len(keys), dtype=bool)
+        empty_slot = np.full(len(keys), -1, dtype=np.int64)
+        active = np.arange(len(keys))
+        while active.size:
+            current = slots[position[active].astype(np.int64)]
+            hit = current == keys[active]
+            empty = current == 0
+            found[active[hit]] = True
+            empty_slot[active[empty]] = position[active[empty]].astype(np.int64)
+            active = active[~(hit | empty)]
+            position[active] = (position[active] + np.uint64(1)) & mask
+        return found, empty_slot
+
+    @classmethod
+    def _insert_unique(cls, slots: np.ndarray, keys: np.ndarray) -> None:
+        """Insert keys known to be distinct and absent."""
+        while keys.size:
+            _, empty_slot = cls._probe(slots, keys)
+            # Keys racing for the same empty slot: the first wins, the rest probe on
+            taken, winners = np.unique(empty_slot, return_index=True)
+            slots[taken] = keys[winners]
+            losers = np.ones(len(keys), dtype=bool)
+            losers[winners] = False
+            keys = keys[losers]
+
+    def contains(self, keys: np.ndarray) -> np.ndarray:
+        table = self._table()
+        return self._probe(table[HEADER_WORDS:], keys)[0]
+
+    def add(self, keys: np.ndarray) -> None:
+        """Add keys (duplicates and already-present keys are ignored)."""
+        keys = np.unique(keys)
+        table = self._table()
+        keys = keys[~self._probe(table[HEADER_WORDS:], keys)[0]]
+        if not keys.size:
+            return
+        count = int(table[1]) + len(keys)
+        capacity = len(table) - HEADER_WORDS
+        if count > capacity * MAX_LOAD:
+            while count > capacity * MAX_LOAD:
+                capacity *= 2
+            table = self._resize(capacity)
+        self._insert_unique(table[HEADER_WORDS:], keys)
+        table[1] = count
+        if self.fsync:
+            self._map.flush()
+
+    def _resize(self, capacity: int) -> np.ndarray:
+        old = self._table()
+        tmp = self.path + ".resize"
+        self._create(tmp, capacity)
+        new = np.memmap(tmp, dtype=np.uint64, mode="r+")
+        slots = new.view(np.ndarray)[HEADER_WORDS:]
+        for start in range(HEADER_WORDS, len(old), RESIZE_CHUNK):
+            chunk = np.asarray(old[start:start + RESIZE_CHUNK])
+            self._insert_unique(slots, chunk[chunk != 0])
+        new[1] = old[1]
+        new.flush()
+        del new
+        os.replace(tmp, self.path)
+        self._map = self._array = None
+        return self._table()
+
+
+def _word_hashes(texts: List[str]):
+    """crc32 of every word, flattened, plus each text's word count."""
+    words = [text.lower().split()[: MAX_SHINGLES + SHINGLE_WORDS - 1] for text in texts]
+    counts = np.fromiter((len(w) for w in words), dtype=np.int64, count=len(words))
+    flat = np.fromiter(
+        (zlib.crc32(word.encode("utf-8")) for w in words for word in w), dtype=np.uint64, count=int(counts.sum())
+    )
+    return flat, counts
+
+
+def minhash_signatures(texts: List[str]) -> np.ndarray:
+    """MinHash signatures over word 3-shingles; shape (len(texts), NUM_PERM).
+
+    Texts with no words get an all-max signature, which callers should skip.
+    """
+    signatures = np.full((len(texts), NUM_PERM), np.iinfo(np.uint64).max, dtype=np.uint64)
+    for block in range(0, len(texts), MINHASH_CHUNK):
+        words, counts = _word_hashes(texts[block:block + MINHASH_CHUNK])
+        present = np.flatnonzero(counts)
+        if not present.size:
+            continue
+        counts = counts[present]
+        word_start = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        word_end = word_start + counts - 1
+        # Short texts still get one shingle made of all their words
+        shingles = np.maximum(counts - (SHINGLE_WORDS - 1), 1)
+        owner = np.repeat(np.arange(len(counts)), shingles)
+        shingle_offsets = np.concatenate(([0], np.cumsum(shingles)[:-1]))
+        first = word_start[owner] + np.arange(len(owner)) - shingle_offsets[owner]
+        combined = np.zeros(len(owner), dtype=np.uint64)
+        for k in range(SHINGLE_WORDS):
+            index = np.minimum(first + k, word_end[owner])
+            combined = (combined ^ words[index]) * FNV_PRIME
+        combined = (combined >> np.uint64(32)) ^ (combined & np.uint64(0xFFFFFFFF))
+        values = (combined[:, None] * _PERM_A[None, :] + _PERM_B[None, :]) % PRIME
+        signatures[block + present] = np.minimum.reduceat(values, shingle_offsets, axis=0)
+    return signatures
+
+
+def band_keys(signatures: np.ndarray) -> np.ndarray:
+    """One LSH key per band; shape (len(signatures), BANDS)."""
+    bands = signatures.reshape(len(signatures), BANDS, ROWS)
+    keys = np.broadcast_to(_BAND_SALT, (len(signatures), BANDS)).copy()
+    for row in range(ROWS):
+        keys = (keys ^ bands[:, :, row]) * FNV_PRIME
+    return _nonzero(keys)
+
+
+class DedupResult(NamedTuple):
+    keep: np.ndarray
+    exact: np.ndarray  # True where the record duplicated earlier content exactly
+    near: np.ndarray  # True where it was dropped as a near-duplicate
+    exact_keys: np.ndarray
+    near_keys: Optional[np.ndarray]
+
+
+class Deduplicator:
+    """Ingest-time duplicate filter for one dataset directory.
+
+    Exact duplicates are found by a 64-bit content hash; with `near` on,
+    MinHash/LSH also drops texts that are near-copies of earlier ones.
+    `check()` classifies a batch (against the index and within the batch
+    itself) and `commit()` records the kept texts once they are durable.
+    """
+
+    def __init__(self, directory: str, near: bool = False, fsync: bool = True):
+        self.exact = HashSet64(os.path.join(directory, EXACT_FILE), fsync=fsync)
+        self.near = HashSet64(os.path.join(directory, NEAR_FILE), fsync=fsync) if near else None
+
+    def needs_backfill(self) -> bool:
+        return not self.exact.exists() or (self.near is not None and not self.near.exists())
+
+    def check(self, texts: List[str]) -> DedupResult:
+        n = len(texts)
+        owners = np.arange(n)
+        exact_keys = content_hashes(texts)
+        exact = self.exact.contains(exact_keys) | first_occurrences(exact_keys, owners, n)
+
+        near = np.zeros(n, dtype=bool)
+        near_keys = None
+        if self.near is not None:
+            near_keys = band_keys(minhash_signatures(texts))
+            candidates = ~exact & np.fromiter((bool(t.strip()) for t in texts), dtype=bool, count=n)
+            keys = near_keys[candidates]
+            ids = np.flatnonzero(candidates)
+            seen = self.near.contains(keys.ravel()).reshape(keys.shape).any(axis=1)
+            within = first_occurrences(keys.ravel(), np.repeat(np.arange(len(ids)), BANDS), len(ids))
+            near[ids] = seen | within
+
+        return DedupResult(~(exact | near), exact, near, exact_keys, near_keys)
+
+    def commit(self, result: DedupResult) -> None:
+        self.exact.add(result.exact_keys[result.keep])
+        if self.near is not None:
+            self.near.add(result.near_keys[result.keep].ravel())
+
+    def backfill(self, texts: Iterable[str], chunk: int = 50000) -> None:
+        """Index texts already in the dataset (built before dedup was enabled)."""
+        batch: List[str] = []
+        for text in texts:
+            batch.append(text)
+            if len(batch) >= chunk:
+                self.commit(self.check(batch))
+                batch = []
+        if batch:
+            self.commit(self.check(batch))
+        # Touch the files even for an empty dataset so this runs only once
+        self.exact.add(np.zeros(0, dtype=np.uint64))
+        if self.near is not None:
+            self.near.add(np.zeros(0, dtype=np.uint64))
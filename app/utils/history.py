@@ -0,0 +1,205 @@
+import os
+from hashlib import blake2b
+from typing import Dict, List, NamedTuple, Optional
+
+from app.config import env_int, load_env
+from app.utils.cache import LRUCache
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken is optional - fall back to the estimator
+    tiktoken = None
+
+load_env()
+
+# Context windows (tokens) by model prefix; first match wins
+CONTEXT_WINDOWS = [
+    ("gpt-4o", 128000),
+    ("gpt-4-turbo", 128000),
+    ("gpt-4", 8192),
+    ("gpt-3.5-turbo", 16385),
+    ("github-copilot", 8192),
+    ("claude", 200000),
+    ("grok", 131072),
+]
+DEFAULT_CONTEXT_WINDOW = 8192
+
+# Per-message framing overhead (role markers etc.) in chat formats
+MESSAGE_OVERHEAD = 4
+
+
+def _digest(text: str) -> bytes:
+    """Fixed-size memo key for a text, so memos don't pin whole messages."""
+    return blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+class PreparedHistory(NamedTuple):
+    messages: List[dict]
+    summary: Optional[str]
+    tokens: int
+    context: Optional[str] = None  # retrieved grounding text (e.g. web results) for this turn
+
+
+class TokenCounter:
+    """Counts tokens per model, memoizing each message's count.
+
+    Uses tiktoken for OpenAI models when it is installed and a fast
+    ~4-characters-per-token estimate otherwise. tiktoken counts are
+    memoized by (encoding, digest of the text), so on every new turn only
+    the new messages are actually encoded, and the memo's size in bytes is
+    bounded by its entry count.
+    """
+
+    def __init__(self, max_entries: int = 50000):
+        self._memo = LRUCache(max_entries=max_entries, ttl=None)
+        self._encodings: Dict[str, object] = {}
+
+    def _encoding(self, model: str):
+        if tiktoken is None or not (model.startswith("gpt") or model == "github-copilot"):
+            return None
+        name = "gpt-4" if model == "github-copilot" else model
+        if name not in self._encodings:
+            try:
+                self._encodings[name] = tiktoken.encoding_for_model(name)
+            except KeyError:
+                self._encodings[name] = tiktoken.get_encoding("cl100k_base")
+        return self._encodings[name]
+
+    @staticmethod
+    def estimate(text: str) -> int:
+        return (len(text) + 3) // 4
+
+    def count_text(self, model: str, text: str) -> int:
+        encoding = self._encoding(model)
+        if encoding is None:
+            return self.estimate(text)
+        key = (encoding.name, _digest(text))
+        count = self._memo.get(key)
+        if count is None:
+            count = len(encoding.encode(text, disallowed_special=()))
+            self._memo.set(key, count)
+        return count
+
+    def count_message(self, model: str, message: dict) -> int:
+        content = message.get("content") or ""
+        if not isinstance(content, str):
+            content = str(content)
+        return self.count_text(model, content) + MESSAGE_OVERHEAD
+
+
+class HistoryManager:
+    """Trims conversation history to a per-model token budget.
+
+    The newest turns are kept until the budget runs out. The budget is the
+    smaller of HISTORY_TOKEN_BUDGET and whatever the model's context window
+    has left after the system prompt, the new message and `max_tokens`,
+    less `context_tokens` held back for retrieved (web or training) context -
+    so HISTORY_TOKEN_BUDGET covers the history and that context together.
+    With HISTORY_SUMMARY enabled, dropped turns are folded into a short
+    rolling summary. Each turn's summary line is cached, so the summary
+    grows incrementally instead of being rebuilt.
+    """
+
+    def __init__(
+        self,
+        token_budget: int = 4000,
+        summarize: bool = False,
+        summary_tokens: int = 300,
+        counter: Optional[TokenCounter] = None,
+    ):
+        self.token_budget = token_budget
+        self.summarize = summarize
+        self.summary_tokens = summary_tokens
+        self.counter = counter or TokenCounter()
+        self._summary_lines = LRUCache(max_entries=20000, ttl=None)
+
+    @classmethod
+    def from_env(cls) -> "HistoryManager":
+        return cls(
+            token_budget=env_int("HISTORY_TOKEN_BUDGET", 4000),
+            summarize=os.getenv("HISTORY_SUMMARY", "0").lower() in ("1", "true", "yes"),
+            summary_tokens=env_int("HISTORY_SUMMARY_TOKENS", 300),
+        )
+
+    @staticmethod
+    def context_window(model: str) -> int:
+        for prefix, window in CONTEXT_WINDOWS:
+            if model.startswith(prefix):
+                return window
+        return DEFAULT_CONTEXT_WINDOW
+
+    def budget(self, model: str, system_prompt: str, message: str, max_tokens: int, context_tokens: int = 0) -> int:
+        fixed = (
+            self.counter.count_text(model, system_prompt)
+            + self.counter.count_text(model, message)
+            + 2 * MESSAGE_OVERHEAD
+            + max_tokens
+            + context_tokens
+        )
+        return max(0, min(self.token_budget - context_tokens, self.context_window(model) - fixed))
+
+    def prepare(
+        self,
+        model: str,
+        conversation_history: Optional[list],
+        system_prompt: str,
+        message: str,
+        max_tokens: int,
+        context_tokens: int = 0,
+    ) -> PreparedHistory:
+        if not conversation_history:
+            return PreparedHistory([], None, 0)
+
+        budget = self.budget(model, system_prompt, message, max_tokens, context_tokens)
+        if self.summarize:
+            budget = max(0, budget - self.summary_tokens)
+
+        kept: List[dict] = []
+        used = 0
+        cut = len(conversation_history)
+        for i in range(len(conversation_history) - 1, -1, -1):
+            tokens = self.counter.count_message(model, conversation_history[i])
+            if used + tokens > budget:
+                break
+            kept.append(conversation_history[i])
+            used += tokens
+            cut = i
+        kept.reverse()
+
+        summary = None
+        if self.summarize and cut > 0:
+            summary = self._summarize(model, conversation_history[:cut])
+            used += self.counter.count_text(model, summary)
+
+        return PreparedHistory(kept, summary, used)
+
+    def _summary_line(self, message: dict) -> str:
+        content = message.get("content") or ""
+        if not isinstance(content, str):
+            content = str(content)
+        key = (message.get("role"), _digest(content))
+        line = self._summary_lines.get(key)
+        if line is None:
+            text = " ".join(content.split())
+            first = text.split(". ")[0]
+            line = f"- {message.get('role', 'user')}: {first[:200]}"
+            self._summary_lines.set(key, line)
+        return line
+
+    def _summarize(self, model: str, dropped: list) -> str:
+        """Extractive summary of dropped turns, newest lines kept within `summary_tokens`"""
+        header = "Summary of earlier conversation:"
+        lines: List[str] = []
+        used = self.counter.count_text(model, header)
+        for message in reversed(dropped):
+            line = self._summary_line(message)
+            tokens = self.counter.count_text(model, line)
+            if used + tokens > self.summary_tokens:
+                break
+            lines.append(line)
+            used += tokens
+        lines.reverse()
+        return "\n".join([header] + lines)
+
+
+history_manager = HistoryManager.from_env()
@@ -0,0 +1,246 @@
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from app.config import env_int, load_env
+from app.utils.providers import providers
+from app.utils.resilience import resilience
+from app.utils.singleflight import SingleFlight
+
+load_env()
+
+CONTENT_TYPES = {"png": "image/png", "jpg": "image/jpeg", "webp": "image/webp"}
+
+
+def sniff_extension(data: bytes) -> str:
+    if data.startswith(b"\xff\xd8\xff"):
+        return "jpg"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+    return "png"
+
+
+class BlobStore:
+    """Content-addressed image files with an LRU size limit.
+
+    Blobs live at `root/blobs/<aa>/<sha256>.<ext>`, named by the hash of
+    their bytes, so identical images are stored once and a blob's name is
+    its ETag. Request keys map to the digests generated for them in
+    `root/keys/<key>.json`. Recency is tracked in memory (seeded from file
+    mtimes at startup and persisted by touching blobs on use); when the
+    total passes `max_bytes` the least recently used blobs are deleted.
+    Keys whose blobs were evicted simply regenerate.
+    """
+
+    def __init__(self, root: str = "data/images", max_bytes: int = 512 * 1024 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._lru: Optional["OrderedDict[str, int]"] = None  # "<digest>.<ext>" -> size
+        self._bytes = 0
+        self.evictions = 0
+
+    def _blob_path(self, name: str) -> str:
+        return os.path.join(self.root, "blobs", name[:2], name)
+
+    def _key_path(self, key: str) -> str:
+        return os.path.join(self.root, "keys", f"{key}.json")
+
+    def _load(self) -> "OrderedDict[str, int]":
+        if self._lru is None:
+            found = []
+            for dirpath, _, files in os.walk(os.path.join(self.root, "blobs")):
+                for name in files:
+                    if name.endswith(".tmp"):
+                        continue
+                    stat = os.stat(os.path.join(dirpath, name))
+                    found.append((stat.st_mtime, name, stat.st_size))
+            self._lru = OrderedDict((name, size) for _, name, size in sorted(found))
+            self._bytes = sum(self._lru.values())
+        return self._lru
+
+    def path(self, name: str) -> Optional[str]:
+        """Path of blob `name` ("<digest>.<ext>") if stored, marking it recently used."""
+        with self._lock:
+            lru = self._load()
+            if name not in lru:
+                return None
+            lru.move_to_end(name)
+        path = self._blob_path(name)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, data: bytes) -> str:
+        """Store image bytes; returns the blob name."""
+        name = f"{hashlib.sha256(data).hexdigest()}.{sniff_extension(data)}"
+        path = self._blob_path(name)
+        with self._lock:
+            lru = self._load()
+            if name in lru:
+                lru.move_to_end(name)
+                return name
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with self._lock:
+            if name not in lru:
+                lru[name] = len(data)
+                self._bytes += len(data)
+            self._evict(keep=name)
+        return name
+
+    def _evict(self, keep: str) -> None:
+        lru = self._lru
+        while self._bytes > self.max_bytes and len(lru) > 1:
+            name, size = next(iter(lru.items()))
+            if name == keep:
+                lru.move_to_end(name)
+                continue
+            del lru[name]
+            self._bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(self._blob_path(name))
+            except FileNotFoundError:
+                pass
+
+    def get_key(self, key: str) -> List[str]:
+        """Blob names generated for `key` that are still stored."""
+        try:
+            with open(self._key_path(key), encoding="utf-8") as f:
+                names = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return []
+        with self._lock:
+            lru = self._load()
+            return [name for name in names if name in lru]
+
+    def set_key(self, key: str, names: List[str]) -> None:
+        path = self._key_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(names, f)
+        os.replace(tmp, path)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            lru = self._load()
+            return {"blobs": len(lru), "bytes": self._bytes, "max_bytes": self.max_bytes, "evictions": self.evictions}
+
+
+class ImageService:
+    """Image generation over the shared async OpenAI client, cached in a BlobStore.
+
+    Results are keyed by a hash of (model, prompt, size, quality); a request
+    for `n` images reuses the variants already stored for that key and only
+    generates the rest, one image per provider call (dall-e-3 allows only
+    n=1) run in parallel under a `concurrency` semaphore shared by all
+    requests. Concurrent identical requests share one generation, and fills
+    for the same key run one at a time so each builds on the variants the
+    last one stored.
+    """
+
+    def __init__(self, store: BlobStore, model: str = "dall-e-3", concurrency: int = 4):
+        self.store = store
+        self.model = model
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._flight = SingleFlight(cancel_orphans=True)
+        # key -> (lock, fills using it); dropped once no fill for the key is running or waiting
+        self._fills: Dict[str, Tuple[asyncio.Lock, int]] = {}
+        self.hits = 0
+        self.generated = 0
+
+    @classmethod
+    def from_env(cls) -> "ImageService":
+        return cls(
+            BlobStore(
+                root=os.getenv("IMAGE_STORE_DIR", "data/images"),
+                max_bytes=env_int("IMAGE_STORE_MAX_BYTES", 512 * 1024 * 1024),
+            ),
+            model=os.getenv("IMAGE_MODEL", "dall-e-3"),
+            concurrency=env_int("IMAGE_CONCURRENCY", 4),
+        )
+
+    def key(self, prompt: str, size: str, quality: str) -> str:
+        raw = json.dumps([self.model, prompt, size, quality], separators=(",", ":"))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    async def generate(self, prompt: str, size: str = "1024x1024", quality: str = "standard", n: int = 1) -> List[str]:
+        """Blob names of `n` images for the prompt, generating only what is not stored."""
+        key = self.key(prompt, size, quality)
+        names = await asyncio.to_thread(self.store.get_key, key)
+        if len(names) >= n:
+            self.hits += 1
+            return names[:n]
+        return (await self._flight.do((key, n), lambda: self._fill(key, prompt, size, quality, n)))[:n]
+
+    async def _fill(self, key: str, prompt: str, size: str, quality: str, n: int) -> List[str]:
+        lock, users = self._fills.get(key, (asyncio.Lock(), 0))
+        self._fills[key] = (lock, users + 1)
+        try:
+            async with lock:
+                names = await asyncio.to_thread(self.store.get_key, key)
+                if len(names) >= n:
+                    return names
+                fresh = await asyncio.gather(*(self._one(prompt, size, quality) for _ in range(n - len(names))))
+                names = list(dict.fromkeys(names + fresh))
+                await asyncio.to_thread(self.store.set_key, key, names)
+                return names
+        finally:
+            lock, users = self._fills[key]
+            if users == 1:
+                del self._fills[key]
+            else:
+                self._fills[key] = (lock, users - 1)
+
+    async def _one(self, prompt: str, size: str, quality: str) -> str:
+        async with self._semaphore:
+            response = await resilience.call("openai", self.model, lambda: providers.openai.images.generate(
+                model=self.model,
+                prompt=prompt,
+                size=size,
+                quality=quality,
+                n=1,
+                response_format="b64_json",
+            ))
+        self.generated += 1
+        data = await asyncio.to_thread(base64.b64decode, response.data[0].b64_json)
+        return await asyncio.to_thread(self.store.put, data)
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "generated": self.generated, **self.store.stats()}
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """(start, end) inclusive for a single `bytes=` range, None to serve the whole file.
+
+    Raises ValueError for a range that cannot be satisfied.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start, _, end = header[len("bytes="):].strip().partition("-")
+    try:
+        if start:
+            first = int(start)
+            last = min(int(end), size - 1) if end else size - 1
+        else:
+            first, last = max(0, size - int(end)), size - 1  # suffix: the last N bytes
+    except ValueError:
+        return None
+    if first > last or first >= size:
+        raise ValueError(f"Range not satisfiable: {header}")
+    return first, last
+
+
+image_service = ImageService.from_env()
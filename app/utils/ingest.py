@@ -0,0 +1,234 @@
+import asyncio
+import codecs
+import os
+import time
+import zlib
+from datetime import datetime, timezone
+from typing import AsyncIterator, Dict, Iterator, List, Optional
+
+from app.config import env_int, load_env
+from app.utils import metrics
+from app.utils.training_store import TrainingStore, safe_name
+
+try:
+    import zstandard
+except ImportError:  # zstandard is optional - only needed for .zst uploads
+    zstandard = None
+
+load_env()
+
+DECOMPRESSION_ERRORS = (zlib.error, EOFError) + ((zstandard.ZstdError,) if zstandard else ())
+
+READ_CHUNK = 1024 * 1024
+RECORD_BATCH = 2000
+# Longer lines are cut so one newline-free upload cannot pin the whole file in memory
+MAX_LINE_CHARS = 1024 * 1024
+PROGRESS_EVERY_BYTES = 16 * 1024 * 1024
+# Uploads that decompress to more than this are rejected part-way (413)
+MAX_DECODED_BYTES = env_int("TRAINING_MAX_DECODED_BYTES", 4 * 1024 * 1024 * 1024)
+# zstd input is fed this many bytes at a time; a 4-byte RLE block expands to
+# at most 128KB, so one step yields at most 128MB however the upload was packed.
+# Smaller steps only add Python calls: 4KB already decodes at full speed
+ZSTD_STEP = 4 * 1024
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+class UnsupportedUpload(ValueError):
+    pass
+
+
+class UploadTooLarge(UnsupportedUpload):
+    pass
+
+
+class _Gunzip:
+    """Incremental gzip decoder with bounded output per step.
+
+    Handles concatenated gzip members, and caps each decompressed piece at
+    READ_CHUNK * 4 so a highly compressible upload cannot balloon memory.
+    """
+
+    def __init__(self):
+        self._d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    def feed(self, data: bytes) -> Iterator[bytes]:
+        while data:
+            out = self._d.decompress(data, READ_CHUNK * 4)
+            if out:
+                yield out
+            if self._d.eof:
+                data = self._d.unused_data
+                self._d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            else:
+                data = self._d.unconsumed_tail
+
+    def flush(self) -> bytes:
+        return self._d.flush()
+
+
+class _Unzstd:
+    """Incremental zstd decoder with bounded output per step.
+
+    The decompressobj has no output limit, so input is fed ZSTD_STEP bytes at
+    a time to bound each decompressed piece, as _Gunzip does.
+    """
+
+    def __init__(self):
+        self._d = zstandard.ZstdDecompressor().decompressobj()
+
+    def feed(self, data: bytes) -> Iterator[bytes]:
+        view = memoryview(data)
+        for start in range(0, len(view), ZSTD_STEP):
+            out = self._d.decompress(view[start:start + ZSTD_STEP])
+            if out:
+                yield out
+
+    def flush(self) -> bytes:
+        return b""
+
+
+class _Identity:
+    def feed(self, data: bytes) -> Iterator[bytes]:
+        yield data
+
+    def flush(self) -> bytes:
+        return b""
+
+
+def _decompressor(first_chunk: bytes, filename: str):
+    if first_chunk.startswith(GZIP_MAGIC):
+        return _Gunzip()
+    if first_chunk.startswith(ZSTD_MAGIC):
+        if zstandard is None:
+            raise UnsupportedUpload(f"{filename} is zstd-compressed but the 'zstandard' package is not installed")
+        return _Unzstd()
+    return _Identity()
+
+
+async def ingest_upload(
+    upload,
+    store: TrainingStore,
+    dataset: str,
+    source: str,
+    raw_path: Optional[str] = None,
+) -> AsyncIterator[Dict]:
+    """Stream an uploaded text corpus into the training store, one line per record.
+
+    The upload is read in fixed-size chunks, gunzipped/un-zstd'd if needed,
+    decoded incrementally and split into lines across chunk boundaries;
+    records are flushed to the store in batches as they are found (lines the
+    store rejects as duplicates are counted, not stored). Memory
+    use stays flat regardless of upload size, and UploadTooLarge is raised
+    once more than MAX_DECODED_BYTES have been decompressed. Yields `progress` events every
+    PROGRESS_EVERY_BYTES and one final `complete` event with the totals.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    decompressor = None
+    carry = ""
+    batch: List[dict] = []
+    stats = {
+        "bytes_received": 0,
+        "bytes_decoded": 0,
+        "training_samples": 0,
+        "duplicates_dropped": 0,
+        "near_duplicates_dropped": 0,
+        "lines_truncated": 0,
+    }
+    next_progress = PROGRESS_EVERY_BYTES
+    timestamp = datetime.now(timezone.utc).isoformat()
+    raw = await asyncio.to_thread(open, raw_path, "wb") if raw_path else None
+    carry_truncated = False
+    started = time.perf_counter()
+    outcome = "cancelled"
+
+    async def flush_batch():
+        if batch:
+            result = await store.append_many(dataset, batch)
+            stats["training_samples"] += result.added
+            stats["duplicates_dropped"] += result.duplicates
+            stats["near_duplicates_dropped"] += result.near_duplicates
+            batch.clear()
+
+    def take_lines(text: str) -> None:
+        nonlocal carry, carry_truncated
+        lines = (carry + text).split("\n")
+        carry = lines.pop()
+        if len(carry) > MAX_LINE_CHARS:
+            if not carry_truncated:
+                stats["lines_truncated"] += 1
+            carry = carry[:MAX_LINE_CHARS]
+            carry_truncated = True
+        elif lines:
+            carry_truncated = False
+        for line in lines:
+            line = line.strip()
+            if line:
+                batch.append({"input": line, "timestamp": timestamp, "source": source})
+
+    try:
+        while True:
+            chunk = await upload.read(READ_CHUNK)
+            if not chunk:
+                break
+            if raw is not None:
+                await asyncio.to_thread(raw.write, chunk)
+            if decompressor is None:
+                decompressor = _decompressor(chunk, source)
+            stats["bytes_received"] += len(chunk)
+            for data in decompressor.feed(chunk):
+                stats["bytes_decoded"] += len(data)
+                if stats["bytes_decoded"] > MAX_DECODED_BYTES:
+                    raise UploadTooLarge(f"{source} decompresses to more than {MAX_DECODED_BYTES} bytes")
+                take_lines(decoder.decode(data))
+                if len(batch) >= RECORD_BATCH:
+                    await flush_batch()
+            if stats["bytes_received"] >= next_progress:
+                next_progress += PROGRESS_EVERY_BYTES
+                yield {"type": "progress", **stats, "pending": len(batch)}
+
+        if decompressor is not None:
+            tail = decompressor.flush()
+            stats["bytes_decoded"] += len(tail)
+            take_lines(decoder.decode(tail, final=True))
+        take_lines("\n")  # the last line may lack a trailing newline
+        await flush_batch()
+        outcome = "ok"
+    except DECOMPRESSION_ERRORS as e:
+        outcome = "unsupported"
+        raise UnsupportedUpload(f"Could not decompress {source}: {str(e)}")
+    except UploadTooLarge:
+        outcome = "too_large"
+        raise
+    except UnsupportedUpload:
+        outcome = "unsupported"
+        raise
+    except Exception:
+        outcome = "error"
+        raise
+    finally:
+        if raw is not None:
+            await asyncio.to_thread(raw.close)
+        _record_ingest(outcome, time.perf_counter() - started, stats)
+
+    yield {"type": "complete", **stats, "dataset": dataset}
+
+
+def _record_ingest(outcome: str, seconds: float, stats: Dict) -> None:
+    metrics.ingest_uploads.labels(outcome).inc()
+    if outcome == "ok":
+        metrics.ingest_duration.labels().observe(seconds)
+    metrics.ingest_bytes.labels("received").inc(stats["bytes_received"])
+    metrics.ingest_bytes.labels("decoded").inc(stats["bytes_decoded"])
+    metrics.ingest_records.labels("stored").inc(stats["training_samples"])
+    metrics.ingest_records.labels("duplicate").inc(stats["duplicates_dropped"])
+    metrics.ingest_records.labels("near_duplicate").inc(stats["near_duplicates_dropped"])
+
+
+def dataset_for_upload(filename: str) -> str:
+    name = os.path.basename(filename or "upload")
+    for suffix in (".gz", ".zst", ".zstd"):
+        if name.endswith(suffix):
+            name = name[: -len(suffix)]
+    return safe_name(f"{name}_processed")
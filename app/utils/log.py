@@ -0,0 +1,92 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from typing import Optional
+
+from app.config import settings
+
+# Attributes every LogRecord has; anything else came in through `extra=` and is a field
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "sample"}
+
+
+class StructuredFormatter(logging.Formatter):
+    """One line per record: a JSON object, or `key=value` pairs after the message."""
+
+    def __init__(self, as_json: bool = True):
+        super().__init__()
+        self.as_json = as_json
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = {key: value for key, value in vars(record).items() if key not in _RESERVED}
+        message = record.getMessage()
+        if record.exc_info:
+            fields["exc_info"] = self.formatException(record.exc_info)
+        timestamp = datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds")
+        if self.as_json:
+            return json.dumps({"ts": timestamp, "level": record.levelname, "logger": record.name, "msg": message, **fields}, default=str)
+        extras = " ".join(f"{key}={value!r}" for key, value in fields.items())
+        return f"{timestamp} {record.levelname} {record.name} {message} {extras}".rstrip()
+
+
+class SampleFilter(logging.Filter):
+    """Keeps a random fraction of DEBUG records (`debug_rate`); other levels all pass.
+
+    A record can set its own rate with `extra={"sample": 0.1}`.
+    """
+
+    def __init__(self, debug_rate: float = 1.0):
+        super().__init__()
+        self.debug_rate = debug_rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = getattr(record, "sample", None)
+        if rate is None:
+            rate = self.debug_rate if record.levelno <= logging.DEBUG else 1.0
+        return rate >= 1.0 or random.random() < rate
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Keep the record's extras and exc_info for the structured formatter;
+        # only resolve the message (its args may not survive the thread hop)
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def configure_logging() -> None:
+    """Send the `app.*` loggers through a queue to one stdout writer thread.
+
+    The request path only filters and enqueues a record; formatting and the
+    write happen off the event loop. LOG_LEVEL sets the level (default INFO),
+    LOG_FORMAT is `json` or `text` and LOG_DEBUG_SAMPLE_RATE the fraction of
+    DEBUG records kept (see app.config). Safe to call more than once.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(StructuredFormatter(as_json=settings.log_format == "json"))
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    handler = _QueueHandler(records)
+    handler.addFilter(SampleFilter(settings.log_debug_sample_rate))
+
+    logger = logging.getLogger("app")
+    logger.setLevel(settings.log_level)
+    logger.addHandler(handler)
+    logger.propagate = False
+
+    _listener = logging.handlers.QueueListener(records, output)
+    _listener.start()
+    atexit.register(_listener.stop)
+
@@ -0,0 +1,262 @@
+import asyncio
+import bisect
+import threading
+import time
+from typing import Callable, Dict, List, Sequence, Tuple
+
+from starlette.routing import Match
+
+# Seconds; covers sub-millisecond routes up to multi-minute batch streams
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric:
+    """A named metric family; `labels(...)` returns the child for one label set."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values: str):
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.label_names):
+                raise ValueError(f"{self.name} expects labels {self.label_names}, got {key}")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _label_text(self, key: Tuple[str, ...], extra: str = "") -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in sorted(self._children.items()):
+            lines.extend(self._render_child(key, child))
+        return lines
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self) -> _Value:
+        return _Value()
+
+    def _render_child(self, key, child) -> List[str]:
+        return [f"{self.name}{self._label_text(key)} {_format(child.value)}"]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+
+class _Buckets:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self) -> _Buckets:
+        return _Buckets(self.buckets)
+
+    def _render_child(self, key, child) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+            cumulative += count
+            le = 'le="%s"' % _format(bound)
+            lines.append(f"{self.name}_bucket{self._label_text(key, le)} {cumulative}")
+        lines.append(f"{self.name}_sum{self._label_text(key)} {_format(child.sum)}")
+        lines.append(f"{self.name}_count{self._label_text(key)} {child.count}")
+        return lines
+
+
+class Registry:
+    """Metric families plus callbacks that refresh snapshot gauges at scrape time.
+
+    Metrics are plain in-process counters updated from the event loop, so
+    recording costs a dict lookup and an add; nothing is exported until
+    `/metrics` is scraped.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], None]] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric already registered: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def on_scrape(self, collector: Callable[[], None]) -> None:
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        for collector in self._collectors:
+            collector()
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def error_label(error: BaseException) -> str:
+    """Short, bounded outcome label for a failed call."""
+    status = getattr(error, "status_code", None)
+    if status == 429:
+        return "rate_limited"
+    if status == 502:
+        return "rejected"
+    if status == 503:
+        return "unavailable"
+    if status == 504 or isinstance(error, (TimeoutError, asyncio.TimeoutError)):
+        return "timeout"
+    if isinstance(error, ValueError):
+        return "invalid"
+    return "error"
+
+
+registry = Registry()
+
+http_requests = registry.counter("http_requests_total", "HTTP requests by route template and status code.", ("method", "route", "status"))
+http_duration = registry.histogram("http_request_duration_seconds", "HTTP request latency, until the last body byte is sent.", ("method", "route"))
+http_in_flight = registry.gauge("http_requests_in_flight", "HTTP requests being handled.", ("method", "route"))
+
+provider_requests = registry.counter("provider_requests_total", "Provider calls by model, gang member and outcome.", ("provider", "model", "member", "outcome"))
+provider_duration = registry.histogram("provider_request_duration_seconds", "Successful provider calls: time from admission to the full reply.", ("provider", "model", "member"))
+provider_ttft = registry.histogram("provider_time_to_first_token_seconds", "Streaming provider calls: time from admission to the first token.", ("provider", "model", "member"))
+provider_tokens = registry.counter("provider_tokens_total", "Tokens reported by providers; direction is in (prompt) or out (completion).", ("provider", "model", "member", "direction"))
+
+scheduler_wait = registry.histogram("scheduler_wait_seconds", "Time calls waited in the admission queue.", ("provider", "model"))
+scheduler_queue_depth = registry.gauge("scheduler_queue_depth", "Calls waiting for admission.", ("provider", "model"))
+scheduler_in_flight = registry.gauge("scheduler_in_flight", "Admitted provider calls still running.", ("provider",))
+circuit_state = registry.gauge("provider_circuit_state", "1 for each provider's current circuit breaker state.", ("provider", "state"))
+resilience_events = registry.counter("provider_resilience_events_total", "Provider calls, retries, timeouts, hedges, short circuits and fallbacks.", ("provider", "event"))
+
+sandbox_runs = registry.counter("sandbox_executions_total", "Sandboxed program runs by language and outcome.", ("language", "outcome"))
+sandbox_duration = registry.histogram("sandbox_execution_duration_seconds", "Sandboxed program wall time.", ("language",))
+
+ingest_uploads = registry.counter("training_ingest_uploads_total", "Training uploads by outcome.", ("outcome",))
+ingest_duration = registry.histogram("training_ingest_duration_seconds", "Time to ingest one training upload.")
+ingest_bytes = registry.counter("training_ingest_bytes_total", "Training upload bytes; stage is received (on the wire) or decoded.", ("stage",))
+ingest_records = registry.counter("training_ingest_records_total", "Training lines by result.", ("result",))
+
+council_requests = registry.counter("council_requests_total", "Council calls by strategy and outcome.", ("strategy", "outcome"))
+council_duration = registry.histogram("council_duration_seconds", "Council latency, synthesis included.", ("strategy",))
+council_members = registry.counter("council_member_calls_total", "Council member calls by outcome (ok, empty, cancelled or an error label).", ("outcome",))
+
+
+
+def route_template(scope) -> str:
+    """The matched route's path template ("/api/images/{name}"), so labels stay bounded."""
+    router = scope["app"].router
+    partial = None
+    for route in router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+        if match == Match.PARTIAL and partial is None:
+            partial = route.path  # path matches, method does not (405)
+    return partial or "unmatched"
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware recording per-route latency, status codes and in-flight requests.
+
+    Latency runs until the handler returns, i.e. after the last body chunk
+    of a streaming response has been sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        method = scope["method"]
+        route = route_template(scope)
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        in_flight = http_in_flight.labels(method, route)
+        in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_duration.labels(method, route).observe(time.perf_counter() - started)
+            http_requests.labels(method, route, status).inc()
+            in_flight.dec()
@@ -0,0 +1,130 @@
+from typing import TYPE_CHECKING, Optional
+
+from app.config import settings
+
+if TYPE_CHECKING:
+    import anthropic
+    import httpx
+    import openai
+
+
+class ProviderClients:
+    """Long-lived async clients for every upstream LLM provider.
+
+    One pooled client per provider is created at app startup and closed at
+    shutdown, so requests reuse warm keep-alive connections instead of paying
+    for a new client (and TLS handshake) every call. Pool sizes come from
+    PROVIDER_MAX_CONNECTIONS / PROVIDER_MAX_KEEPALIVE / PROVIDER_KEEPALIVE_EXPIRY.
+
+    SDK-level retries are off: timeouts, retries and fallbacks are applied
+    per model by app.utils.resilience, so the clients only bound connects.
+
+    The SDKs take most of a cold start to import, so they are only imported
+    when a client is first needed (or by the startup warm-up, see `preload`).
+    """
+
+    def __init__(self):
+        self._openai: Optional["openai.AsyncOpenAI"] = None
+        self._anthropic: Optional["anthropic.AsyncAnthropic"] = None
+        self._xai: Optional["httpx.AsyncClient"] = None
+
+    @staticmethod
+    def preload() -> None:
+        """Import the provider SDKs; blocking, so run it off the event loop."""
+        import anthropic  # noqa: F401
+        import httpx  # noqa: F401
+        import openai  # noqa: F401
+        # The clients import their resource modules on first use (`client.chat`), which costs as much again
+        import anthropic.resources  # noqa: F401
+        import openai.resources  # noqa: F401
+
+    @staticmethod
+    def _limits(limits_cls=None):
+        if limits_cls is None:
+            import httpx
+            limits_cls = httpx.Limits
+        return limits_cls(
+            max_connections=settings.provider_max_connections,
+            max_keepalive_connections=settings.provider_max_keepalive,
+            keepalive_expiry=settings.provider_keepalive_expiry,
+        )
+
+    @staticmethod
+    def _sdk_http_client(sdk):
+        # Each SDK pins its own HTTP transport, so build the pool with its types
+        limits = ProviderClients._limits(type(sdk.DEFAULT_CONNECTION_LIMITS))
+        return sdk.DefaultAsyncHttpxClient(limits=limits, timeout=ProviderClients._timeout(sdk.Timeout))
+
+    @staticmethod
+    def _timeout(timeout_cls=None):
+        if timeout_cls is None:
+            import httpx
+            timeout_cls = httpx.Timeout
+        # Reads are bounded by the resilience layer's per-model timeouts
+        return timeout_cls(None, connect=settings.provider_connect_timeout)
+
+    @property
+    def openai(self) -> "openai.AsyncOpenAI":
+        if self._openai is None:
+            import openai
+            self._openai = openai.AsyncOpenAI(
+                api_key=settings.openai_api_key,
+                http_client=self._sdk_http_client(openai),
+                timeout=self._timeout(openai.Timeout),
+                max_retries=0,
+            )
+        return self._openai
+
+    @property
+    def anthropic(self) -> "anthropic.AsyncAnthropic":
+        if self._anthropic is None:
+            import anthropic
+            self._anthropic = anthropic.AsyncAnthropic(
+                api_key=settings.anthropic_api_key,
+                http_client=self._sdk_http_client(anthropic),
+                timeout=self._timeout(anthropic.Timeout),
+                max_retries=0,
+            )
+        return self._anthropic
+
+    @property
+    def xai(self) -> "httpx.AsyncClient":
+        if self._xai is None:
+            import httpx
+            self._xai = httpx.AsyncClient(
+                limits=self._limits(),
+                base_url=settings.xai_api_url,
+                headers={
+                    "Authorization": f"Bearer {settings.xai_api_key or ''}",
+                    "Content-Type": "application/json",
+                },
+                timeout=self._timeout(),
+            )
+        return self._xai
+
+    def start(self) -> None:
+        """Create clients for every provider that has credentials configured.
+
+        Providers without a key are left to be created lazily on first use, so
+        a missing key surfaces as a request error rather than a boot failure.
+        """
+        if settings.openai_api_key:
+            self.openai
+        if settings.anthropic_api_key:
+            self.anthropic
+        if settings.xai_api_key:
+            self.xai
+
+    async def close(self) -> None:
+        if self._openai is not None:
+            await self._openai.close()
+            self._openai = None
+        if self._anthropic is not None:
+            await self._anthropic.close()
+            self._anthropic = None
+        if self._xai is not None:
+            await self._xai.aclose()
+            self._xai = None
+
+
+providers = ProviderClients()
@@ -0,0 +1,410 @@
+import asyncio
+import os
+import random
+import sys
+import time
+from collections import deque
+from functools import partial
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Optional, Tuple, TypeVar
+
+from app.config import env_float, env_int, load_env
+from app.utils import metrics
+
+load_env()
+
+T = TypeVar("T")
+
+# Upstream statuses worth retrying (529 is Anthropic's "overloaded")
+RETRYABLE_STATUS = frozenset({408, 409, 425, 429, 500, 502, 503, 504, 529})
+
+
+class ProviderError(Exception):
+    """A provider rejected or failed a request; `status_code` is what clients should see."""
+
+    status_code = 502
+
+    def __init__(self, provider: str, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.provider = provider
+        self.retry_after = retry_after
+
+
+class ProviderUnavailable(ProviderError):
+    """The provider is down, overloaded or short-circuited; another provider may still answer."""
+
+    status_code = 503
+
+
+class ProviderTimeout(ProviderUnavailable):
+    status_code = 504
+
+
+class ProviderRateLimited(ProviderUnavailable):
+    status_code = 429
+
+
+def _status(exc: BaseException) -> Optional[int]:
+    # openai/anthropic APIStatusError carry `status_code`; raw httpx errors carry a response
+    status = getattr(exc, "status_code", None)
+    httpx = sys.modules.get("httpx")  # not imported yet means exc cannot be one of its errors
+    if status is None and httpx is not None and isinstance(exc, httpx.HTTPStatusError):
+        status = exc.response.status_code
+    return status if isinstance(status, int) else None
+
+
+def _retry_after(exc: BaseException) -> Optional[float]:
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        return max(0.0, float(headers.get("retry-after")))
+    except (TypeError, ValueError):
+        return None
+
+
+def is_transient(exc: BaseException) -> bool:
+    """Timeouts, dropped connections and retryable HTTP statuses."""
+    if isinstance(exc, asyncio.TimeoutError):
+        return True
+    httpx = sys.modules.get("httpx")
+    if httpx is not None and isinstance(exc, httpx.TransportError):
+        return True
+    # The SDKs wrap transport failures in their own APIConnectionError/APITimeoutError
+    if type(exc).__name__ in ("APIConnectionError", "APITimeoutError"):
+        return True
+    return _status(exc) in RETRYABLE_STATUS
+
+
+def provider_error(provider: str, exc: BaseException) -> ProviderError:
+    """Translate a raw SDK/httpx failure into the matching ProviderError."""
+    if isinstance(exc, ProviderError):
+        return exc
+    if isinstance(exc, asyncio.TimeoutError):
+        return ProviderTimeout(provider, f"{provider} timed out")
+    status = _status(exc)
+    if status == 429:
+        return ProviderRateLimited(provider, f"{provider} rate limited the request", _retry_after(exc))
+    if is_transient(exc):
+        return ProviderUnavailable(provider, f"{provider} unavailable: {exc}", _retry_after(exc))
+    return ProviderError(provider, f"{provider} rejected the request ({status}): {exc}")
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker for one provider.
+
+    Opens after `failure_threshold` transient failures in a row and then
+    fails fast for `reset_timeout` seconds. After that a single probe call
+    is let through (half-open): success closes the breaker, failure
+    re-opens it. A probe that never reports back is replaced after another
+    `reset_timeout`, so a cancelled caller cannot wedge the breaker.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opens = 0
+        self._opened_at: Optional[float] = None
+        self._probe_at: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if self.clock() - self._opened_at < self.reset_timeout:
+            return "open"
+        return "half_open"
+
+    def retry_after(self) -> float:
+        if self._opened_at is None:
+            return 0.0
+        return max(0.0, self.reset_timeout - (self.clock() - self._opened_at))
+
+    def allow(self) -> bool:
+        """Whether a call may go out now (claims the probe slot when half-open)."""
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "open":
+            return False
+        now = self.clock()
+        if self._probe_at is not None and now - self._probe_at < self.reset_timeout:
+            return False
+        self._probe_at = now
+        return True
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self._opened_at = None
+        self._probe_at = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self._probe_at is not None or (self._opened_at is None and self.failures >= self.failure_threshold):
+            self._opened_at = self.clock()
+            self._probe_at = None
+            self.opens += 1
+
+    def release(self) -> None:
+        """Give back a probe slot without a verdict (the call failed for non-provider reasons)."""
+        self._probe_at = None
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies, for hedge delays."""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.samples: Deque[float] = deque(maxlen=window)
+        self.min_samples = min_samples
+
+    def record(self, seconds: float) -> None:
+        self.samples.append(seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if len(self.samples) < self.min_samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Resilience:
+    """Timeouts, retries, hedging and circuit breaking around provider calls.
+
+    Every attempt is bounded by a per-model timeout (PROVIDER_MODEL_TIMEOUTS,
+    matched by model-name prefix, else PROVIDER_TIMEOUT_SECONDS) and the whole
+    call by PROVIDER_DEADLINE_SECONDS. Transient failures (timeouts,
+    connection errors, 429/5xx) are retried with full-jitter exponential
+    backoff, honouring Retry-After. With PROVIDER_HEDGE=1 a second attempt
+    is started once the first has run past the model's observed p95 latency,
+    and whichever finishes first wins. Each provider has a CircuitBreaker;
+    while it is open calls fail fast with ProviderUnavailable so the caller
+    can fall back to another provider.
+    """
+
+    def __init__(
+        self,
+        timeout: float = 60.0,
+        model_timeouts: Optional[Dict[str, float]] = None,
+        deadline: float = 90.0,
+        retries: int = 2,
+        backoff_base: float = 0.25,
+        backoff_max: float = 4.0,
+        hedge: bool = False,
+        hedge_quantile: float = 0.95,
+        hedge_min_delay: float = 0.5,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        fallback: bool = True,
+    ):
+        self.timeout = timeout
+        self.model_timeouts = model_timeouts or {}
+        self.deadline = deadline
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_delay = hedge_min_delay
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.fallback = fallback
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.latencies: Dict[str, LatencyTracker] = {}
+        self.counters: Dict[str, Dict[str, int]] = {}
+
+    @classmethod
+    def from_env(cls) -> "Resilience":
+        return cls(
+            timeout=env_float("PROVIDER_TIMEOUT_SECONDS", 60),
+            model_timeouts=parse_model_timeouts(os.getenv("PROVIDER_MODEL_TIMEOUTS", "")),
+            deadline=env_float("PROVIDER_DEADLINE_SECONDS", 90),
+            retries=env_int("PROVIDER_RETRIES", 2),
+            backoff_base=env_float("PROVIDER_BACKOFF_BASE_SECONDS", 0.25),
+            backoff_max=env_float("PROVIDER_BACKOFF_MAX_SECONDS", 4),
+            hedge=os.getenv("PROVIDER_HEDGE", "0") == "1",
+            hedge_quantile=env_float("PROVIDER_HEDGE_QUANTILE", 0.95),
+            hedge_min_delay=env_float("PROVIDER_HEDGE_MIN_DELAY_SECONDS", 0.5),
+            failure_threshold=env_int("PROVIDER_BREAKER_FAILURES", 5),
+            reset_timeout=env_float("PROVIDER_BREAKER_RESET_SECONDS", 30),
+            fallback=os.getenv("PROVIDER_FALLBACK", "1") == "1",
+        )
+
+    def timeout_for(self, model: str) -> float:
+        """Per-attempt timeout: the longest matching model prefix wins."""
+        matches = [prefix for prefix in self.model_timeouts if model.startswith(prefix)]
+        if not matches:
+            return self.timeout
+        return self.model_timeouts[max(matches, key=len)]
+
+    def breaker(self, provider: str) -> CircuitBreaker:
+        if provider not in self.breakers:
+            self.breakers[provider] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+        return self.breakers[provider]
+
+    def available(self, provider: str) -> bool:
+        """False while the provider's breaker is open (does not claim a probe)."""
+        return self.breaker(provider).state != "open"
+
+    def _count(self, provider: str, name: str) -> None:
+        counters = self.counters.setdefault(provider, {})
+        counters[name] = counters.get(name, 0) + 1
+
+    def record_fallback(self, provider: str) -> None:
+        self._count(provider, "fallbacks")
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    async def call(self, provider: str, model: str, attempt: Callable[[], Awaitable[T]], hedge: Optional[bool] = None) -> T:
+        """Run `attempt()` (a fresh coroutine per try) under the provider's policy."""
+        breaker = self.breaker(provider)
+        tracker = self.latencies.setdefault(model, LatencyTracker())
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline
+        hedge = self.hedge if hedge is None else hedge
+        self._count(provider, "calls")
+
+        for tries in range(self.retries + 1):
+            if not breaker.allow():
+                self._count(provider, "short_circuits")
+                raise ProviderUnavailable(provider, f"{provider} circuit open", breaker.retry_after())
+            timeout = min(self.timeout_for(model), deadline - loop.time())
+            started = time.monotonic()
+            try:
+                result = await self._attempt(provider, attempt, timeout, tracker if hedge else None)
+            except asyncio.CancelledError:
+                breaker.release()
+                raise
+            except Exception as exc:
+                if not is_transient(exc):
+                    breaker.release()
+                    if _status(exc) is None:
+                        raise  # a bug or config problem, not the provider's fault
+                    raise provider_error(provider, exc) from exc
+                breaker.record_failure()
+                self._count(provider, "timeouts" if isinstance(exc, asyncio.TimeoutError) else "failures")
+                error = provider_error(provider, exc)
+                delay = self._backoff(tries, error.retry_after)
+                if tries == self.retries or loop.time() + delay >= deadline:
+                    raise error from exc
+                self._count(provider, "retries")
+                await asyncio.sleep(delay)
+                continue
+            breaker.record_success()
+            tracker.record(time.monotonic() - started)
+            return result
+        raise AssertionError("unreachable")
+
+    async def _attempt(self, provider: str, attempt: Callable[[], Awaitable[T]], timeout: float, tracker: Optional[LatencyTracker]) -> T:
+        if timeout <= 0:
+            raise asyncio.TimeoutError()
+        delay = tracker.quantile(self.hedge_quantile) if tracker is not None else None
+        if delay is None or max(delay, self.hedge_min_delay) >= timeout:
+            return await asyncio.wait_for(attempt(), timeout)
+
+        # Hedged: a backup attempt starts once the first is slower than usual
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        tasks = [asyncio.ensure_future(attempt())]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=max(delay, self.hedge_min_delay))
+            if not done:
+                self._count(provider, "hedges")
+                tasks.append(asyncio.ensure_future(attempt()))
+            pending = set(tasks)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=max(0.0, deadline - loop.time()), return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    raise asyncio.TimeoutError()
+                for task in done:
+                    if task.exception() is None:
+                        if task is not tasks[0]:
+                            self._count(provider, "hedge_wins")
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def stream(self, provider: str, model: str, events: Callable[[], AsyncIterator[Dict[str, Any]]]) -> AsyncIterator[Dict[str, Any]]:
+        """Open a provider event stream, retrying until its first event arrives.
+
+        Once the first event is out nothing is retried (the client already has
+        it); later events must each arrive within the model's timeout.
+        Streams are never hedged, since the losing stream could not be told
+        apart from the winner until both had started.
+        """
+        first, stream = await self.call(provider, model, partial(_prime, events), hedge=False)
+        return self._relay(first, stream, self.timeout_for(model))
+
+    @staticmethod
+    async def _relay(first: Optional[Dict[str, Any]], stream: AsyncIterator[Dict[str, Any]], idle_timeout: float) -> AsyncIterator[Dict[str, Any]]:
+        try:
+            if first is None:
+                return
+            yield first
+            while True:
+                try:
+                    event = await asyncio.wait_for(stream.__anext__(), idle_timeout)
+                except StopAsyncIteration:
+                    return
+                yield event
+        finally:
+            await stream.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        providers = set(self.breakers) | set(self.counters)
+        return {
+            "hedging": self.hedge,
+            "providers": {
+                provider: {
+                    **self.counters.get(provider, {}),
+                    "breaker": self.breaker(provider).state,
+                    "breaker_opens": self.breaker(provider).opens,
+                }
+                for provider in sorted(providers)
+            },
+            "p95_seconds": {model: tracker.quantile(0.95) for model, tracker in self.latencies.items()},
+        }
+
+    def export_metrics(self) -> None:
+        """Copy breaker states and counters into the Prometheus registry (run at scrape time)."""
+        for provider, breaker in self.breakers.items():
+            state = breaker.state
+            for name in ("closed", "open", "half_open"):
+                metrics.circuit_state.labels(provider, name).set(1 if name == state else 0)
+        for provider, counters in self.counters.items():
+            for name, value in counters.items():
+                metrics.resilience_events.labels(provider, name).set(value)
+
+
+async def _prime(events: Callable[[], AsyncIterator[Dict[str, Any]]]) -> Tuple[Optional[Dict[str, Any]], AsyncIterator[Dict[str, Any]]]:
+    """Start a stream and wait for its first event, closing it if that fails."""
+    stream = events()
+    try:
+        first = await stream.__anext__()
+    except StopAsyncIteration:
+        first = None
+    except BaseException:
+        await stream.aclose()
+        raise
+    return first, stream
+
+
+def parse_model_timeouts(spec: str) -> Dict[str, float]:
+    """Parse "gpt-4=60,claude=90" into {"gpt-4": 60.0, "claude": 90.0}."""
+    timeouts = {}
+    for item in spec.split(","):
+        prefix, _, seconds = item.partition("=")
+        if prefix.strip() and seconds.strip():
+            timeouts[prefix.strip()] = float(seconds)
+    return timeouts
+
+
+resilience = Resilience.from_env()
+metrics.registry.on_scrape(resilience.export_metrics)
@@ -0,0 +1,354 @@
+import asyncio
+import codecs
+import os
+import signal
+import sys
+import time
+from contextlib import aclosing
+from typing import AsyncIterator, Dict, List, NamedTuple, Optional
+
+from app.config import env_float, env_int, load_env
+from app.utils import metrics
+
+try:
+    import resource
+except ImportError:  # not available on Windows - run without rlimits
+    resource = None
+
+load_env()
+
+# Python and Node read the program from stdin, so a worker can be started
+# (and pay its interpreter start-up) before the code arrives
+COMMANDS = {
+    "python": ["python3", "-"],
+    "javascript": ["node", "-"],
+    "bash": ["bash", "-c"],
+}
+# bash reads a script from stdin a line at a time, so a program that reads
+# stdin would consume its own source; it takes the code as an argument instead
+CODE_AS_ARGUMENT = {"bash"}
+
+READ_CHUNK = 64 * 1024
+FILE_SIZE_LIMIT = 16 * 1024 * 1024
+
+# Applies the rlimits and then execs the real command, so the limits are set
+# in the child without a preexec_fn (which is unsafe in a threaded server)
+LIMIT_WRAPPER = """\
+import os, resource, sys
+cpu, fsize, memory = map(int, sys.argv[1:4])
+resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu + 1))
+resource.setrlimit(resource.RLIMIT_FSIZE, (fsize, fsize))
+if memory:
+    resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+os.execvp(sys.argv[4], sys.argv[4:])
+"""
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+class ExecutionResult(NamedTuple):
+    stdout: str
+    stderr: str
+    returncode: Optional[int]
+    timed_out: bool
+    truncated: bool
+
+
+class WarmPool:
+    """Idle, already-started interpreters waiting for code on stdin.
+
+    Each worker runs exactly one program and is then discarded, so runs
+    never share interpreter state; a replacement is started in the
+    background as soon as a worker is taken.
+    """
+
+    def __init__(self, spawn, size: int):
+        self._spawn = spawn
+        self.size = size
+        self._idle: List[asyncio.subprocess.Process] = []
+        self._pending: set = set()
+
+    def fill(self) -> None:
+        while len(self._idle) + len(self._pending) < self.size:
+            task = asyncio.create_task(self._add())
+            self._pending.add(task)
+            task.add_done_callback(self._pending.discard)
+
+    async def _add(self) -> None:
+        try:
+            self._idle.append(await self._spawn())
+        except OSError:
+            pass  # interpreter missing; callers fall back to cold starts and see the error
+
+    async def acquire(self) -> asyncio.subprocess.Process:
+        while self._idle:
+            proc = self._idle.pop()
+            if proc.returncode is None:
+                self.fill()
+                return proc
+        self.fill()
+        return await self._spawn()
+
+    async def close(self) -> None:
+        for task in list(self._pending):
+            task.cancel()
+        for proc in self._idle:
+            _kill(proc)
+            await proc.wait()
+        self._idle.clear()
+
+
+class UsageMonitor:
+    """Samples a running worker's CPU time and peak RSS from /proc.
+
+    asyncio reaps children itself, so their rusage is never handed back to
+    us; polling /proc while the program runs is the portable-enough
+    substitute on Linux. Elsewhere the figures are reported as None.
+    """
+
+    def __init__(self, pid: int, interval: float = 0.02):
+        self.pid = pid
+        self.interval = interval
+        self.cpu_time: Optional[float] = None
+        self.peak_rss_bytes: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def sample(self) -> bool:
+        try:
+            with open(f"/proc/{self.pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            # utime, stime, cutime, cstime are fields 14-17 (index 0 here is field 3)
+            ticks = sum(int(value) for value in fields[11:15])
+            self.cpu_time = max(self.cpu_time or 0.0, ticks / CLOCK_TICKS)
+            with open(f"/proc/{self.pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        rss = int(line.split()[1]) * 1024
+                        self.peak_rss_bytes = max(self.peak_rss_bytes or 0, rss)
+                        break
+            return True
+        except (OSError, ValueError, IndexError):
+            return False
+
+    async def _run(self) -> None:
+        while self.sample():
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+        self.sample()
+
+    def usage(self) -> Dict[str, Optional[float]]:
+        return {"cpu_time": self.cpu_time, "peak_rss_bytes": self.peak_rss_bytes}
+
+
+def _kill(proc: asyncio.subprocess.Process) -> None:
+    if proc.returncode is not None:
+        return
+    try:
+        # Workers lead their own session, so this also reaps any children they forked
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+class Sandbox:
+    """Non-blocking code runner for /api/code/execute.
+
+    Programs run through `asyncio.create_subprocess_exec` under a bounded
+    concurrency semaphore, with CPU time, memory and file-size rlimits and a
+    wall-clock timeout. Python and Node programs are handed to pre-started
+    warm workers over stdin; bash runs its code with `bash -c` and an empty
+    stdin. stdout/stderr are read incrementally and capped at `output_limit`
+    bytes per stream (the rest is drained and reported as truncated) so a
+    chatty program cannot exhaust server memory.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 8,
+        timeout: float = 30.0,
+        cpu_seconds: int = 30,
+        memory_mb: int = 512,
+        output_limit: int = 1024 * 1024,
+        warm_workers: int = 2,
+    ):
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.cpu_seconds = cpu_seconds
+        self.memory_mb = memory_mb
+        self.output_limit = output_limit
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._pools: Dict[str, WarmPool] = {
+            language: WarmPool(lambda language=language: self._spawn(language), warm_workers)
+            for language in ("python", "javascript")
+        }
+
+    @classmethod
+    def from_env(cls) -> "Sandbox":
+        return cls(
+            max_concurrency=env_int("SANDBOX_MAX_CONCURRENCY", 8),
+            timeout=env_float("SANDBOX_TIMEOUT_SECONDS", 30),
+            cpu_seconds=env_int("SANDBOX_CPU_SECONDS", 30),
+            memory_mb=env_int("SANDBOX_MEMORY_MB", 512),
+            output_limit=env_int("SANDBOX_OUTPUT_LIMIT_BYTES", 1024 * 1024),
+            warm_workers=env_int("SANDBOX_WARM_WORKERS", 2),
+        )
+
+    def _limited(self, language: str, command: List[str]) -> List[str]:
+        """`command` run under LIMIT_WRAPPER with this sandbox's rlimits."""
+        if resource is None:
+            return command
+        # V8 reserves far more address space than it uses; node is capped via its heap flag instead
+        memory = 0 if language == "javascript" else self.memory_mb * 1024 * 1024
+        limits = [str(self.cpu_seconds), str(FILE_SIZE_LIMIT), str(memory)]
+        return [sys.executable, "-I", "-S", "-c", LIMIT_WRAPPER, *limits, *command]
+
+    async def _spawn(self, language: str, code: Optional[str] = None) -> asyncio.subprocess.Process:
+        command = list(COMMANDS[language])
+        if language == "javascript":
+            command.insert(1, f"--max-old-space-size={self.memory_mb}")
+        if language in CODE_AS_ARGUMENT:
+            command.append(code)
+        return await asyncio.create_subprocess_exec(
+            *self._limited(language, command),
+            stdin=asyncio.subprocess.DEVNULL if language in CODE_AS_ARGUMENT else asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            start_new_session=True,
+        )
+
+    def start(self) -> None:
+        """Pre-start the warm worker pools (call from within the event loop)."""
+        for pool in self._pools.values():
+            pool.fill()
+
+    async def close(self) -> None:
+        for pool in self._pools.values():
+            await pool.close()
+
+    async def _pump(self, stream: asyncio.StreamReader, name: str, queue: asyncio.Queue) -> None:
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        kept = 0
+        dropped = 0
+        while True:
+            chunk = await stream.read(READ_CHUNK)
+            if not chunk:
+                break
+            room = self.output_limit - kept
+            if room > 0:
+                text = decoder.decode(chunk[:room])
+                if text:
+                    await queue.put({"type": name, "data": text})
+                kept += min(room, len(chunk))
+            dropped += max(0, len(chunk) - max(room, 0))
+        tail = decoder.decode(b"", final=True)
+        if tail:
+            await queue.put({"type": name, "data": tail})
+        if dropped:
+            await queue.put({"type": name, "data": f"\n[... {dropped} bytes of {name} truncated]", "truncated": True})
+        await queue.put(None)
+
+    async def stream(self, language: str, code: str) -> AsyncIterator[dict]:
+        """Run `code` and yield `stdout`/`stderr` chunk events as they are produced.
+
+        Ends with one `exit` event holding the return code, timeout and
+        truncation flags and resource usage (wall time, CPU time, peak RSS).
+        Closing the generator early kills the program.
+        """
+        if language not in COMMANDS:
+            raise ValueError(f"Unsupported language: {language}")
+
+        async with self._semaphore:
+            pool = self._pools.get(language)
+            proc = await (pool.acquire() if pool else self._spawn(language, code))
+            started = time.monotonic()
+            monitor = UsageMonitor(proc.pid)
+            monitor.start()
+            queue: asyncio.Queue = asyncio.Queue(maxsize=64)
+            readers = [
+                asyncio.create_task(self._pump(proc.stdout, "stdout", queue)),
+                asyncio.create_task(self._pump(proc.stderr, "stderr", queue)),
+            ]
+            timed_out = False
+            truncated = False
+            outcome = "cancelled"
+            try:
+                if proc.stdin is not None:
+                    try:
+                        proc.stdin.write(code.encode("utf-8"))
+                        await proc.stdin.drain()
+                        proc.stdin.close()
+                    except (BrokenPipeError, ConnectionResetError):
+                        pass  # the program exited before reading all of its input
+
+                deadline = started + self.timeout
+                open_streams = len(readers)
+                while open_streams:
+                    remaining = deadline - time.monotonic()
+                    try:
+                        event = await asyncio.wait_for(queue.get(), max(remaining, 0))
+                    except asyncio.TimeoutError:
+                        timed_out = True
+                        break
+                    if event is None:
+                        open_streams -= 1
+                        if not open_streams:
+                            # Output closed: grab a last sample before the process is reaped
+                            monitor.sample()
+                        continue
+                    truncated = truncated or event.get("truncated", False)
+                    yield event
+
+                if timed_out:
+                    _kill(proc)
+                try:
+                    await asyncio.wait_for(proc.wait(), max(deadline - time.monotonic(), 1.0))
+                except asyncio.TimeoutError:
+                    timed_out = True
+                    _kill(proc)
+                    await proc.wait()
+
+                monitor.stop()
+                outcome = "timeout" if timed_out else "ok" if proc.returncode == 0 else "error"
+                metrics.sandbox_duration.labels(language).observe(time.monotonic() - started)
+                yield {
+                    "type": "exit",
+                    "returncode": proc.returncode,
+                    "timed_out": timed_out,
+                    "truncated": truncated,
+                    "usage": {"wall_time": time.monotonic() - started, **monitor.usage()},
+                }
+            finally:
+                metrics.sandbox_runs.labels(language, outcome).inc()
+                monitor.stop()
+                _kill(proc)
+                for reader in readers:
+                    reader.cancel()
+
+    async def run(self, language: str, code: str) -> ExecutionResult:
+        stdout: List[str] = []
+        stderr: List[str] = []
+        exit_event: dict = {}
+        async with aclosing(self.stream(language, code)) as events:
+            async for event in events:
+                if event["type"] == "stdout":
+                    stdout.append(event["data"])
+                elif event["type"] == "stderr":
+                    stderr.append(event["data"])
+                else:
+                    exit_event = event
+        return ExecutionResult(
+            stdout="".join(stdout),
+            stderr="".join(stderr),
+            returncode=exit_event.get("returncode"),
+            timed_out=exit_event.get("timed_out", False),
+            truncated=exit_event.get("truncated", False),
+        )
+
+
+sandbox = Sandbox.from_env()
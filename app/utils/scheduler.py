@@ -0,0 +1,305 @@
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Deque, Dict, List, Optional, Tuple
+
+from app.config import env_float, env_int, load_env
+from app.utils import metrics
+from app.utils.resilience import ProviderRateLimited
+
+load_env()
+
+# Lower value = served first
+PRIORITIES = {"interactive": 0, "batch": 1}
+
+
+class AdmissionRejected(ProviderRateLimited):
+    """Turned away locally: the request would wait past its deadline for rate-limit capacity."""
+
+
+class TokenBucket:
+    """Refills `per_minute` units per minute, holding at most one minute's worth."""
+
+    def __init__(self, per_minute: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.tokens = self.capacity
+        self.clock = clock
+        self._updated = clock()
+
+    def _refill(self) -> None:
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_for(self, amount: float) -> float:
+        """Seconds until `amount` units are available (0 if they are now)."""
+        self._refill()
+        amount = min(amount, self.capacity)  # oversized requests wait for a full bucket
+        return max(0.0, (amount - self.tokens) / self.rate)
+
+    def take(self, amount: float) -> None:
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+
+class _Waiter:
+    __slots__ = ("key", "tokens", "future", "enqueued")
+
+    def __init__(self, key: Tuple[int, int], tokens: int, future: asyncio.Future):
+        self.key = key
+        self.tokens = tokens
+        self.future = future
+        self.enqueued = time.monotonic()
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return self.key < other.key
+
+
+class _Lane:
+    """Queue and rate limits for one (provider, model)."""
+
+    def __init__(self, provider: str, model: str, rpm: Optional[float], tpm: Optional[float]):
+        self.provider = provider
+        self.model = model
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.queue: List[_Waiter] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.waits: Deque[float] = deque(maxlen=500)
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def head(self) -> Optional[_Waiter]:
+        while self.queue and self.queue[0].future.done():
+            heapq.heappop(self.queue)  # cancelled or timed out while queued
+        return self.queue[0] if self.queue else None
+
+    def rate_wait(self, requests: int, tokens: int) -> float:
+        wait = 0.0
+        if self.requests is not None:
+            wait = self.requests.wait_for(requests)
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.wait_for(tokens))
+        return wait
+
+    def take(self, tokens: int) -> None:
+        if self.requests is not None:
+            self.requests.take(1)
+        if self.tokens is not None:
+            self.tokens.take(tokens)
+
+
+class Ticket:
+    """An admitted provider call; `release()` frees its concurrency slot."""
+
+    def __init__(self, scheduler: "Scheduler", provider: str):
+        self._scheduler = scheduler
+        self._provider = provider
+        self._released = False
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._scheduler._release(self._provider)
+
+
+class Scheduler:
+    """Admission control in front of the provider calls.
+
+    Each (provider, model) lane has token buckets for requests/min and
+    tokens/min (SCHEDULER_LIMITS, "model-prefix=rpm/tpm,..."; no entry means
+    unlimited) and each provider a cap on calls in flight
+    (SCHEDULER_CONCURRENCY, "provider=n,...", default SCHEDULER_DEFAULT_CONCURRENCY).
+    Calls that cannot go straight away wait in a bounded priority queue,
+    interactive ahead of batch, FIFO within a class. A caller whose
+    estimated wait exceeds its class's max wait, or who finds the queue
+    full, is rejected at once with AdmissionRejected (a 429 with
+    Retry-After at the route) instead of queueing until it times out.
+    """
+
+    def __init__(
+        self,
+        limits: Optional[Dict[str, Tuple[Optional[float], Optional[float]]]] = None,
+        concurrency: Optional[Dict[str, int]] = None,
+        default_concurrency: int = 64,
+        max_queue: int = 256,
+        max_wait: Optional[Dict[str, float]] = None,
+    ):
+        self.limits = limits or {}
+        self.concurrency = concurrency or {}
+        self.default_concurrency = default_concurrency
+        self.max_queue = max_queue
+        self.max_wait = {"interactive": 10.0, "batch": 300.0, **(max_wait or {})}
+        self._lanes: Dict[Tuple[str, str], _Lane] = {}
+        self._in_flight: Dict[str, int] = {}
+        self._seq = itertools.count()
+
+    @classmethod
+    def from_env(cls) -> "Scheduler":
+        limits = {}
+        for prefix, value in _pairs(os.getenv("SCHEDULER_LIMITS", "")):
+            rpm, _, tpm = value.partition("/")
+            limits[prefix] = (float(rpm) if rpm.strip() else None, float(tpm) if tpm.strip() else None)
+        return cls(
+            limits=limits,
+            concurrency={provider: int(n) for provider, n in _pairs(os.getenv("SCHEDULER_CONCURRENCY", ""))},
+            default_concurrency=env_int("SCHEDULER_DEFAULT_CONCURRENCY", 64),
+            max_queue=env_int("SCHEDULER_MAX_QUEUE", 256),
+            max_wait={
+                "interactive": env_float("SCHEDULER_MAX_WAIT_INTERACTIVE_SECONDS", 10),
+                "batch": env_float("SCHEDULER_MAX_WAIT_BATCH_SECONDS", 300),
+            },
+        )
+
+    def _lane(self, provider: str, model: str) -> _Lane:
+        lane = self._lanes.get((provider, model))
+        if lane is None:
+            matches = [prefix for prefix in self.limits if model.startswith(prefix)]
+            rpm, tpm = self.limits[max(matches, key=len)] if matches else (None, None)
+            lane = self._lanes[(provider, model)] = _Lane(provider, model, rpm, tpm)
+        return lane
+
+    def _slots(self, provider: str) -> int:
+        return self.concurrency.get(provider, self.default_concurrency) - self._in_flight.get(provider, 0)
+
+    def _estimate(self, lane: _Lane, key: Tuple[int, int], tokens: int) -> float:
+        """Rate-limit wait for a new waiter, counting everyone queued ahead of it."""
+        ahead = [w for w in lane.queue if not w.future.done() and w.key < key]
+        return lane.rate_wait(len(ahead) + 1, sum(w.tokens for w in ahead) + tokens)
+
+    async def acquire(self, provider: str, model: str, tokens: int, priority: str = "interactive") -> Ticket:
+        """Wait for capacity to call `model`, expecting `tokens` prompt+completion tokens."""
+        lane = self._lane(provider, model)
+        rank = PRIORITIES.get(priority, PRIORITIES["batch"])
+        key = (rank, next(self._seq))
+        max_wait = self.max_wait.get(priority, self.max_wait["batch"])
+
+        if lane.head() is None and self._slots(provider) > 0 and lane.rate_wait(1, tokens) == 0:
+            lane.take(tokens)
+            return self._admit(lane, provider, 0.0)
+
+        estimate = self._estimate(lane, key, tokens)
+        if estimate > max_wait or len(lane.queue) >= self.max_queue:
+            lane.rejected += 1
+            raise AdmissionRejected(provider, f"{provider} {model} is at its rate limit; try again shortly", max(estimate, 1.0))
+
+        waiter = _Waiter(key, tokens, asyncio.get_running_loop().create_future())
+        heapq.heappush(lane.queue, waiter)
+        self._pump(provider)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), max_wait)
+        except asyncio.TimeoutError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                return waiter.future.result()  # admitted just as the wait ran out
+            waiter.future.cancel()
+            lane.timed_out += 1
+            raise AdmissionRejected(provider, f"{provider} {model} queue wait exceeded {max_wait:.0f}s", max(estimate, 1.0))
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                waiter.future.result().release()  # admitted, but the caller left
+            waiter.future.cancel()
+            raise
+        return waiter.future.result()
+
+    @asynccontextmanager
+    async def admit(self, provider: str, model: str, tokens: int, priority: str = "interactive") -> AsyncIterator[Ticket]:
+        ticket = await self.acquire(provider, model, tokens, priority)
+        try:
+            yield ticket
+        finally:
+            ticket.release()
+
+    async def hold(self, ticket: Ticket, events: AsyncIterator[Any]) -> AsyncIterator[Any]:
+        """Relay a stream, keeping its concurrency slot until the stream ends."""
+        try:
+            async for event in events:
+                yield event
+        finally:
+            ticket.release()
+            await events.aclose()
+
+    def _admit(self, lane: _Lane, provider: str, waited: float) -> Ticket:
+        self._in_flight[provider] = self._in_flight.get(provider, 0) + 1
+        lane.admitted += 1
+        lane.waits.append(waited)
+        metrics.scheduler_wait.labels(provider, lane.model).observe(waited)
+        return Ticket(self, provider)
+
+    def _release(self, provider: str) -> None:
+        self._in_flight[provider] -= 1
+        self._pump(provider)
+
+    def _pump(self, provider: str) -> None:
+        """Admit queued waiters for `provider` one at a time, lowest (priority, seq) first across its lanes.
+
+        A lane whose head is held back by its rate limit is skipped (and
+        woken when it clears) rather than blocking the other lanes.
+        """
+        ready = [lane for lane in self._lanes.values() if lane.provider == provider]
+        while ready and self._slots(provider) > 0:
+            best: Optional[Tuple[_Lane, _Waiter]] = None
+            for lane in list(ready):
+                waiter = lane.head()
+                if waiter is None:
+                    ready.remove(lane)
+                    continue
+                wait = lane.rate_wait(1, waiter.tokens)
+                if wait > 0:
+                    self._wake_in(lane, provider, wait)
+                    ready.remove(lane)
+                    continue
+                if best is None or waiter.key < best[1].key:
+                    best = (lane, waiter)
+            if best is None:
+                return
+            lane, waiter = best
+            heapq.heappop(lane.queue)
+            lane.take(waiter.tokens)
+            waiter.future.set_result(self._admit(lane, provider, time.monotonic() - waiter.enqueued))
+
+    def _wake_in(self, lane: _Lane, provider: str, delay: float) -> None:
+        if lane.timer is not None:
+            lane.timer.cancel()
+        lane.timer = asyncio.get_running_loop().call_later(delay, self._pump, provider)
+
+    def stats(self) -> Dict[str, Any]:
+        lanes = {}
+        for (provider, model), lane in self._lanes.items():
+            waits = sorted(lane.waits)
+            lanes[f"{provider}:{model}"] = {
+                "queue_depth": sum(not w.future.done() for w in lane.queue),
+                "admitted": lane.admitted,
+                "rejected": lane.rejected,
+                "timed_out": lane.timed_out,
+                "wait_p50_seconds": waits[len(waits) // 2] if waits else 0.0,
+                "wait_p95_seconds": waits[min(len(waits) - 1, int(0.95 * len(waits)))] if waits else 0.0,
+                "requests_available": round(lane.requests.tokens, 1) if lane.requests else None,
+                "tokens_available": round(lane.tokens.tokens) if lane.tokens else None,
+            }
+        return {"in_flight": dict(self._in_flight), "lanes": lanes}
+
+    def export_metrics(self) -> None:
+        """Copy queue depths and in-flight counts into the Prometheus registry (run at scrape time)."""
+        for (provider, model), lane in self._lanes.items():
+            metrics.scheduler_queue_depth.labels(provider, model).set(sum(not w.future.done() for w in lane.queue))
+        for provider, count in self._in_flight.items():
+            metrics.scheduler_in_flight.labels(provider).set(count)
+
+
+def _pairs(spec: str) -> List[Tuple[str, str]]:
+    pairs = []
+    for item in spec.split(","):
+        name, _, value = item.partition("=")
+        if name.strip() and value.strip():
+            pairs.append((name.strip(), value.strip()))
+    return pairs
+
+
+scheduler = Scheduler.from_env()
+metrics.registry.on_scrape(scheduler.export_metrics)
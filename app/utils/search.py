@@ -0,0 +1,159 @@
+import os
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+from app.config import env_float, env_int, load_env
+from app.utils.cache import LRUCache
+from app.utils.singleflight import SingleFlight
+
+if TYPE_CHECKING:
+    import httpx
+
+load_env()
+
+# Upper bound on results kept per cached query; requests slice from these
+MAX_CACHED_RESULTS = 25
+
+
+def normalize_query(query: str) -> str:
+    """Cache/coalescing key: case- and whitespace-insensitive."""
+    return " ".join(query.lower().split())
+
+
+class DuckDuckGoUpstream:
+    """DuckDuckGo instant-answer API. Point `base_url` at a stub server to test offline."""
+
+    def __init__(self, base_url: str = "https://api.duckduckgo.com/"):
+        self.base_url = base_url
+
+    async def search(self, client: "httpx.AsyncClient", query: str) -> List[Dict[str, str]]:
+        response = await client.get(
+            self.base_url,
+            params={"q": query, "format": "json", "no_html": "1", "skip_disambig": "1"},
+        )
+        response.raise_for_status()
+        data = response.json()
+
+        results = []
+
+        # Extract instant answer if available
+        if data.get('Answer'):
+            results.append({
+                'title': 'Instant Answer',
+                'url': data.get('AnswerURL', ''),
+                'snippet': data['Answer']
+            })
+
+        # Extract abstract if available
+        if data.get('AbstractText'):
+            results.append({
+                'title': data.get('Heading', 'Abstract'),
+                'url': data.get('AbstractURL', ''),
+                'snippet': data['AbstractText']
+            })
+
+        # Extract related topics
+        for topic in data.get('RelatedTopics', []):
+            if 'Text' in topic:
+                results.append({
+                    'title': topic.get('FirstURL', 'Related Topic'),
+                    'url': topic.get('FirstURL', ''),
+                    'snippet': topic['Text']
+                })
+
+        return results[:MAX_CACHED_RESULTS]
+
+
+class SearchService:
+    """Web search behind a pooled async client, a result cache and single-flight.
+
+    Results are cached per normalized query (LRU with TTL), and concurrent
+    misses for the same query share one upstream request. The upstream is
+    any object with `async search(client, query)`; by default DuckDuckGo at
+    SEARCH_API_URL.
+    """
+
+    def __init__(
+        self,
+        upstream: Optional[Any] = None,
+        max_entries: int = 1024,
+        ttl: float = 900.0,
+        timeout: float = 10.0,
+    ):
+        self.upstream = upstream or DuckDuckGoUpstream()
+        self.timeout = timeout
+        self.cache = LRUCache(max_entries=max_entries, ttl=ttl)
+        self._flight = SingleFlight()
+        self._client: Optional["httpx.AsyncClient"] = None
+        self.hits = 0
+        self.misses = 0
+        self.upstream_errors = 0
+
+    @classmethod
+    def from_env(cls) -> "SearchService":
+        return cls(
+            upstream=DuckDuckGoUpstream(os.getenv("SEARCH_API_URL", "https://api.duckduckgo.com/")),
+            max_entries=env_int("SEARCH_CACHE_MAX_ENTRIES", 1024),
+            ttl=env_float("SEARCH_CACHE_TTL_SECONDS", 900),
+            timeout=env_float("SEARCH_TIMEOUT_SECONDS", 10),
+        )
+
+    @property
+    def client(self) -> "httpx.AsyncClient":
+        if self._client is None:
+            import httpx
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout, connect=min(self.timeout, 5.0)),
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+                follow_redirects=True,
+                headers={"User-Agent": "HackneyDownsAI/1.0"},
+            )
+        return self._client
+
+    async def _fetch(self, key: str) -> List[Dict[str, str]]:
+        try:
+            results = await self.upstream.search(self.client, key)
+        except Exception:
+            self.upstream_errors += 1
+            raise
+        self.cache.set(key, results)
+        return results
+
+    async def search(self, query: str, max_results: int = 5, fallback: bool = True) -> List[Dict[str, str]]:
+        """Up to `max_results` results; with `fallback`, a search-page link when there are none."""
+        key = normalize_query(query)
+        results = self.cache.get(key)
+        if results is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            results = await self._flight.do(key, lambda: self._fetch(key))
+
+        if not results and fallback:
+            import httpx
+            return [{
+                'title': 'Search Results',
+                'url': str(httpx.URL("https://duckduckgo.com/", params={"q": query})),
+                'snippet': f"Search results for: {query}"
+            }]
+        return results[:max_results]
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        flight = self._flight.stats()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "upstream_requests": flight["executions"],
+            "coalesced": flight["coalesced"],
+            "upstream_errors": self.upstream_errors,
+            "entries": len(self.cache),
+        }
+
+
+search_service = SearchService.from_env()
@@ -0,0 +1,213 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from app.config import env_float, env_int, load_env
+
+load_env()
+
+# Rough per-message bookkeeping cost on top of the text itself
+MESSAGE_OVERHEAD_BYTES = 64
+
+
+class Session:
+    def __init__(self, session_id: str, messages: Optional[List[dict]] = None, created_at: Optional[float] = None):
+        self.id = session_id
+        self.messages: List[dict] = messages or []
+        self.created_at = created_at or time.time()
+        self.last_active = time.monotonic()
+        self.size_bytes = sum(self._message_bytes(m) for m in self.messages)
+
+    @staticmethod
+    def _message_bytes(message: dict) -> int:
+        return len(message.get("content") or "") + MESSAGE_OVERHEAD_BYTES
+
+    def append(self, messages: List[dict]) -> None:
+        self.messages.extend(messages)
+        self.size_bytes += sum(self._message_bytes(m) for m in messages)
+        self.last_active = time.monotonic()
+
+
+class SQLiteSessionBackend:
+    """Durable session storage in a local SQLite file (one row per message)."""
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, created_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                " session_id TEXT NOT NULL, seq INTEGER NOT NULL, role TEXT NOT NULL, content TEXT NOT NULL,"
+                " PRIMARY KEY (session_id, seq))"
+            )
+
+    def create(self, session: Session) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("INSERT INTO sessions (id, created_at) VALUES (?, ?)", (session.id, session.created_at))
+
+    def load(self, session_id: str) -> Optional[Session]:
+        with self._lock:
+            row = self._conn.execute("SELECT created_at FROM sessions WHERE id = ?", (session_id,)).fetchone()
+            if row is None:
+                return None
+            rows = self._conn.execute(
+                "SELECT role, content FROM messages WHERE session_id = ? ORDER BY seq", (session_id,)
+            ).fetchall()
+        return Session(session_id, [{"role": role, "content": content} for role, content in rows], created_at=row[0])
+
+    def append(self, session_id: str, start_seq: int, messages: List[dict]) -> None:
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO messages (session_id, seq, role, content) VALUES (?, ?, ?, ?)",
+                [(session_id, start_seq + i, m["role"], m.get("content") or "") for i, m in enumerate(messages)],
+            )
+
+    def delete(self, session_id: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            self._conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class SessionStore:
+    """Server-side conversation sessions with LRU eviction.
+
+    Sessions live in memory, capped by count (`max_sessions`), total text
+    size (`max_bytes`) and idle time (`idle_ttl`); the least recently used
+    are evicted first. With a backend configured, writes go through to it,
+    so evicted sessions are reloaded on their next use instead of being lost.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = 10000,
+        max_bytes: int = 64 * 1024 * 1024,
+        idle_ttl: float = 3600.0,
+        backend: Optional[SQLiteSessionBackend] = None,
+    ):
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        self.backend = backend
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._bytes = 0
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self.evictions = 0
+
+    @classmethod
+    def from_env(cls) -> "SessionStore":
+        db_path = os.getenv("SESSION_DB_PATH", "")
+        return cls(
+            max_sessions=env_int("SESSION_MAX_SESSIONS", 10000),
+            max_bytes=env_int("SESSION_MAX_BYTES", 64 * 1024 * 1024),
+            idle_ttl=env_float("SESSION_IDLE_SECONDS", 3600),
+            backend=SQLiteSessionBackend(db_path) if db_path else None,
+        )
+
+    def _lock(self, session_id: str) -> asyncio.Lock:
+        lock = self._locks.get(session_id)
+        if lock is None:
+            lock = self._locks[session_id] = asyncio.Lock()
+        return lock
+
+    def _remember(self, session: Session) -> None:
+        self._sessions[session.id] = session
+        self._sessions.move_to_end(session.id)
+        self._bytes += session.size_bytes
+        self._evict()
+
+    def _forget(self, session_id: str) -> None:
+        session = self._sessions.pop(session_id, None)
+        if session is not None:
+            self._bytes -= session.size_bytes
+        self._locks.pop(session_id, None)
+
+    def _evict(self) -> None:
+        now = time.monotonic()
+        for session_id, session in list(self._sessions.items()):
+            over_limit = len(self._sessions) > self.max_sessions or self._bytes > self.max_bytes
+            if not over_limit and now - session.last_active <= self.idle_ttl:
+                break
+            # Never drop a session while a request is appending to it
+            lock = self._locks.get(session_id)
+            if lock is not None and lock.locked():
+                continue
+            self._forget(session_id)
+            self.evictions += 1
+
+    async def create(self) -> Session:
+        session = Session(uuid.uuid4().hex)
+        if self.backend is not None:
+            await asyncio.to_thread(self.backend.create, session)
+        self._remember(session)
+        return session
+
+    async def get(self, session_id: str) -> Optional[Session]:
+        session = self._sessions.get(session_id)
+        if session is not None:
+            session.last_active = time.monotonic()
+            self._sessions.move_to_end(session_id)
+            return session
+        if self.backend is None:
+            return None
+        loaded = await asyncio.to_thread(self.backend.load, session_id)
+        # A concurrent get() may have cached it while this one was loading
+        session = self._sessions.get(session_id)
+        if session is not None:
+            return session
+        if loaded is not None:
+            self._remember(loaded)
+        return loaded
+
+    async def history(self, session_id: str) -> List[dict]:
+        session = await self.get(session_id)
+        if session is None:
+            raise KeyError(f"Unknown session: {session_id}")
+        return list(session.messages)
+
+    async def append(self, session_id: str, messages: List[dict]) -> None:
+        async with self._lock(session_id):
+            session = await self.get(session_id)
+            if session is None:
+                raise KeyError(f"Unknown session: {session_id}")
+            if self.backend is not None:
+                await asyncio.to_thread(self.backend.append, session_id, len(session.messages), messages)
+            before = session.size_bytes
+            session.append(messages)
+            if session_id in self._sessions:
+                self._bytes += session.size_bytes - before
+            self._evict()
+
+    async def delete(self, session_id: str) -> None:
+        self._forget(session_id)
+        if self.backend is not None:
+            await asyncio.to_thread(self.backend.delete, session_id)
+
+    def close(self) -> None:
+        if self.backend is not None:
+            self.backend.close()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "sessions": len(self._sessions),
+            "bytes": self._bytes,
+            "evictions": self.evictions,
+        }
+
+
+session_store = SessionStore.from_env()
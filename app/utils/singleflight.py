@@ -0,0 +1,145 @@
+import asyncio
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional
+
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key into one execution.
+
+    The first caller for a key starts the work in its own task; callers
+    arriving while it is still running await that same task instead of
+    starting another. A caller that is cancelled only stops waiting - the
+    shared work carries on for everyone else. With `cancel_orphans`, the
+    work is cancelled once every caller waiting on it has gone away.
+    """
+
+    def __init__(self, cancel_orphans: bool = False):
+        self.cancel_orphans = cancel_orphans
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self._waiters: Dict[asyncio.Task, int] = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._inflight
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            self.executions += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda task, key=key: self._done(key, task))
+        else:
+            self.coalesced += 1
+        if not self.cancel_orphans:
+            return await asyncio.shield(task)
+
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            self._waiters[task] -= 1
+            if not self._waiters[task]:
+                del self._waiters[task]
+                task.cancel()  # no-op once finished
+
+    def _done(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # mark retrieved even if every waiter went away
+
+    def stats(self) -> Dict[str, int]:
+        return {"executions": self.executions, "coalesced": self.coalesced, "in_flight": len(self._inflight)}
+
+
+class _Broadcast:
+    """One upstream stream being replayed to its subscribers."""
+
+    def __init__(self):
+        self.events: List[Any] = []
+        self.error: Optional[BaseException] = None
+        self.finished = False
+        self.subscribers = 0
+        self.changed = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    def notify(self) -> None:
+        # Wakes every current waiter; they re-check `events`/`finished` themselves
+        self.changed.set()
+        self.changed.clear()
+
+
+class StreamFlight:
+    """Fan one async event stream out to every concurrent subscriber with the same key.
+
+    The first subscriber for a key starts `fn()` in a background task; later
+    subscribers attach to it and get every event from the beginning (events
+    are buffered for the life of the stream), then follow along live. An
+    upstream error is raised to every subscriber. When the last subscriber
+    leaves early, the upstream stream is cancelled and closed.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, _Broadcast] = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._inflight
+
+    async def _pump(self, key: Hashable, broadcast: _Broadcast, fn: Callable[[], AsyncIterator[Any]]) -> None:
+        try:
+            stream = fn()
+            async with aclosing(stream):
+                async for event in stream:
+                    broadcast.events.append(event)
+                    broadcast.notify()
+        except BaseException as e:
+            broadcast.error = e
+            if isinstance(e, asyncio.CancelledError):
+                raise
+        finally:
+            broadcast.finished = True
+            if self._inflight.get(key) is broadcast:
+                del self._inflight[key]
+            broadcast.notify()
+
+    async def subscribe(self, key: Hashable, fn: Callable[[], AsyncIterator[Any]]) -> AsyncIterator[Any]:
+        broadcast = self._inflight.get(key)
+        if broadcast is None:
+            self.executions += 1
+            broadcast = _Broadcast()
+            self._inflight[key] = broadcast
+            broadcast.task = asyncio.ensure_future(self._pump(key, broadcast, fn))
+        else:
+            self.coalesced += 1
+
+        broadcast.subscribers += 1
+        try:
+            position = 0
+            while True:
+                while position < len(broadcast.events):
+                    yield broadcast.events[position]
+                    position += 1
+                if broadcast.finished:
+                    if broadcast.error is not None:
+                        raise broadcast.error
+                    return
+                await broadcast.changed.wait()
+        finally:
+            broadcast.subscribers -= 1
+            if not broadcast.subscribers and not broadcast.finished:
+                # Nobody is listening any more: stop the upstream call
+                if self._inflight.get(key) is broadcast:
+                    del self._inflight[key]
+                broadcast.task.cancel()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._inflight),
+            "subscribers": sum(b.subscribers for b in self._inflight.values()),
+        }
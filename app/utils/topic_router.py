@@ -0,0 +1,115 @@
+import re
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+
+class RouteResult(NamedTuple):
+    member: str
+    confidence: float
+    scores: Dict[str, float]
+
+
+# Queries are split as bytes: one table lookup per byte lowercases ASCII
+# letters and turns ASCII punctuation into a space. Non-ASCII queries are
+# lowercased and have their non-word characters (as in \w) blanked first, so
+# the UTF-8 bytes left over are all parts of words.
+_WORDS = bytes(ord(chr(b).lower()) if chr(b).isalnum() or b == ord("_") or b >= 128 else ord(" ") for b in range(256))
+_NON_WORD = re.compile(r"\W+")
+
+
+class TopicRouter:
+    """Single-pass keyword router for picking an AI gang member.
+
+    All keywords (the explicit tables plus each member's `specialization`)
+    go into one dict, with their plural forms added up front. A query is
+    split into words once, as bytes, and matched against the keywords with
+    one set intersection; two-word keywords are only checked where their
+    first word appears. Plurals are accepted; other word forms must be
+    listed explicitly, which keeps "training" from routing to "train" and
+    "start" from matching "art".
+    Ties go to whichever member comes first in `priority`.
+    """
+
+    def __init__(
+        self,
+        gang: Dict[str, Dict],
+        keywords: Dict[str, Iterable[str]],
+        default: str,
+        priority: Optional[List[str]] = None,
+    ):
+        self.default = default
+        self.priority = list(priority or keywords.keys())
+        for member in gang:
+            if member not in self.priority:
+                self.priority.append(member)
+        self._rank = {member: i for i, member in enumerate(self.priority)}
+
+        # keyword -> {member: weight}
+        table: Dict[str, Dict[str, float]] = {}
+        for member, words in keywords.items():
+            for word in words:
+                self._add(table, word, member)
+        for member, info in gang.items():
+            for word in info.get("specialization", []):
+                self._add(table, word.replace("_", " "), member)
+
+        # Plurals resolve to their keyword; an exact keyword always wins
+        keyed = dict(table)
+        for suffix in ("s", "es"):
+            for word, weights in list(keyed.items()):
+                table.setdefault(word + suffix, weights)
+        self._table: Dict[bytes, Dict[str, float]] = {word.encode(): weights for word, weights in table.items()}
+        self._firsts = {word.split()[0] for word in self._table if b" " in word}
+        # Every single word worth looking for: keywords and the first words of phrases
+        self._probe = {word for word in self._table if b" " not in word} | self._firsts
+
+    @staticmethod
+    def _add(table: Dict[str, Dict[str, float]], word: str, member: str) -> None:
+        words = word.lower().split()
+        if len(words) > 2:
+            raise ValueError(f"Routing keywords are one or two words: {word!r}")
+        table.setdefault(" ".join(words), {})[member] = 1.0
+
+    def _score_phrases(self, tokens: List[bytes], scores: Dict[str, float]) -> None:
+        """Count two-word keywords in place of the single words they are made of."""
+        i = 0
+        while i < len(tokens) - 1:
+            if tokens[i] in self._firsts:
+                phrase = self._table.get(tokens[i] + b" " + tokens[i + 1])
+                if phrase:
+                    for member, weight in phrase.items():
+                        scores[member] = scores.get(member, 0.0) + weight
+                    for word in tokens[i:i + 2]:
+                        for member, weight in self._table.get(word, {}).items():
+                            left = scores.get(member, 0.0) - weight
+                            if left > 0:
+                                scores[member] = left
+                            else:
+                                scores.pop(member, None)
+                    i += 2
+                    continue
+            i += 1
+
+    def route(self, query: str) -> RouteResult:
+        if not query.isascii():
+            query = _NON_WORD.sub(" ", query.lower())
+        text = query.encode().translate(_WORDS)
+        tokens = text.split()
+        found = self._probe.intersection(tokens)
+        scores: Dict[str, float] = {}
+        for word in found:
+            weights = self._table.get(word)
+            if weights:
+                # A substring count is cheap and bounds the word count from above
+                count = tokens.count(word) if text.count(word) > 1 else 1
+                for member, weight in weights.items():
+                    scores[member] = scores.get(member, 0.0) + weight * count
+        if not self._firsts.isdisjoint(found):
+            self._score_phrases(tokens, scores)
+
+        if not scores:
+            return RouteResult(self.default, 0.0, scores)
+        if len(scores) == 1:
+            return RouteResult(next(iter(scores)), 1.0, scores)
+
+        best = min(scores, key=lambda member: (-scores[member], self._rank.get(member, len(self._rank))))
+        return RouteResult(best, scores[best] / sum(scores.values()), scores)
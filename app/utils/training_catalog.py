@@ -0,0 +1,244 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.utils.training_store import INDEX_FILE, TrainingStore, training_store
+
+CATALOG_FILE = "catalog.json"
+FLUSH_DELAY = 0.5
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class TrainingCatalog:
+    """Per-dataset metadata kept current as training data is ingested.
+
+    Every durable store batch updates the dataset's sample count, bytes,
+    last-updated time and source in memory; the manifest (`catalog.json`)
+    is rewritten shortly afterwards, coalescing bursts of batches into one
+    write. `/api/training/status` answers from memory, reloading the
+    manifest only when another worker has rewritten it. `rebuild()` and
+    `verify()` reconcile the catalog with what is actually on disk.
+    """
+
+    def __init__(self, store: TrainingStore):
+        self.store = store
+        self.path = os.path.join(store.root, CATALOG_FILE)
+        self.datasets: Dict[str, Dict[str, Any]] = {}
+        self._stamp: Optional[tuple] = None
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        # Background flushes can overlap: writes are serialised and numbered
+        # so an older snapshot never replaces a newer one
+        self._write_lock = threading.Lock()
+        self._version = 0
+        self._written = 0
+        self._loaded = False
+
+    # -- persistence ---------------------------------------------------
+
+    def _read_manifest(self) -> Optional[Dict[str, Dict[str, Any]]]:
+        try:
+            st = os.stat(self.path)
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        self._stamp = (st.st_mtime_ns, st.st_size)
+        return data.get("datasets", {})
+
+    def _snapshot(self) -> Tuple[int, str]:
+        self._version += 1
+        return self._version, json.dumps({"updated": _now(), "datasets": self.datasets}, indent=2)
+
+    def _write_manifest(self, snapshot: Optional[Tuple[int, str]] = None) -> None:
+        version, text = snapshot if snapshot is not None else self._snapshot()
+        with self._write_lock:
+            if version < self._written:
+                return
+            os.makedirs(self.store.root, exist_ok=True)
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, "w") as f:
+                f.write(text)
+            os.replace(tmp, self.path)
+            st = os.stat(self.path)
+            self._stamp = (st.st_mtime_ns, st.st_size)
+            self._written = version
+
+    def load(self) -> None:
+        """Load the manifest, rebuilding it from disk if it does not exist yet."""
+        manifest = self._read_manifest()
+        if manifest is None:
+            self.rebuild()
+        else:
+            self.datasets = manifest
+        self._loaded = True
+
+    def _refresh(self) -> None:
+        if not self._loaded:
+            self.load()
+            return
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        if (st.st_mtime_ns, st.st_size) == self._stamp:
+            return
+        # Another worker rewrote the manifest: keep whichever entry is newer
+        for name, entry in (self._read_manifest() or {}).items():
+            mine = self.datasets.get(name)
+            if mine is None or entry.get("last_updated", "") > mine.get("last_updated", ""):
+                self.datasets[name] = entry
+
+    def _schedule_flush(self) -> None:
+        if self._flush_handle is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._write_manifest()
+            return
+        self._flush_handle = loop.call_later(FLUSH_DELAY, self._flush_soon)
+
+    def _flush_soon(self) -> None:
+        self._flush_handle = None
+        # Serialise on the loop so the writer thread never sees a dict mid-update
+        asyncio.get_running_loop().run_in_executor(None, self._write_manifest, self._snapshot())
+
+    def flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+            self._write_manifest()
+
+    # -- ingestion hook ----------------------------------------------------
+
+    def record_batch(self, dataset: str, records: List[dict], index: Dict[str, Any]) -> None:
+        """TrainingStore listener: the index passed in is authoritative for count/bytes."""
+        if not self._loaded:
+            self.load()
+        last = records[-1] if records else {}
+        entry = self.datasets.setdefault(dataset, {"kind": "store", "created": _now()})
+        entry.update({
+            "kind": "store",
+            "sample_count": index["count"],
+            "bytes": index["bytes"],
+            "last_updated": _now(),
+            "source": last.get("source") or last.get("model") or entry.get("source"),
+        })
+        self._schedule_flush()
+
+    # -- queries -----------------------------------------------------------
+
+    def status(self) -> Dict[str, Any]:
+        self._refresh()
+        return {
+            # Store datasets are directories; keep the trailing slash clients already see
+            "training_files": [
+                f"{name}/" if entry.get("kind") == "store" else name
+                for name, entry in sorted(self.datasets.items())
+            ],
+            "total_training_samples": sum(entry.get("sample_count", 0) for entry in self.datasets.values()),
+            "datasets": self.datasets,
+        }
+
+    # -- reconciliation ------------------------------------------------------
+
+    def _scan(self, count_lines: bool) -> Dict[str, Dict[str, Any]]:
+        """Describe every dataset on disk (store directories and legacy JSON files)."""
+        found: Dict[str, Dict[str, Any]] = {}
+        root = self.store.root
+        if not os.path.isdir(root):
+            return found
+
+        for name in self.store.datasets():
+            index = self.store.index(name)
+            count = index["count"]
+            if count_lines:
+                count = 0
+                for segment in index["segments"]:
+                    with open(os.path.join(root, name, segment["name"]), "rb") as f:
+                        count += sum(chunk.count(b"\n") for chunk in iter(lambda: f.read(1 << 20), b""))
+            mtime = os.path.getmtime(os.path.join(root, name, INDEX_FILE))
+            found[name] = {
+                "kind": "store",
+                "sample_count": count,
+                "bytes": index["bytes"],
+                "last_updated": datetime.fromtimestamp(mtime, timezone.utc).isoformat(),
+            }
+
+        # Pre-store whole-file JSON datasets
+        for name in os.listdir(root):
+            path = os.path.join(root, name)
+            if not name.endswith(".json") or name == CATALOG_FILE or not os.path.isfile(path):
+                continue
+            try:
+                with open(path, "r") as f:
+                    data = json.load(f)
+            except (ValueError, OSError):
+                continue
+            if isinstance(data, list):
+                found[name] = {
+                    "kind": "legacy_json",
+                    "sample_count": len(data),
+                    "bytes": os.path.getsize(path),
+                    "last_updated": datetime.fromtimestamp(os.path.getmtime(path), timezone.utc).isoformat(),
+                }
+        return found
+
+    def rebuild(self) -> Dict[str, Dict[str, Any]]:
+        """Replace the catalog with what is on disk, keeping known sources."""
+        found = self._scan(count_lines=False)
+        for name, entry in found.items():
+            if name in self.datasets:
+                entry.setdefault("source", self.datasets[name].get("source"))
+                entry.setdefault("created", self.datasets[name].get("created"))
+        self.datasets = found
+        self._write_manifest()
+        return self.datasets
+
+    def verify(self) -> List[Dict[str, Any]]:
+        """Compare the catalog with the disk (counting segment lines); returns mismatches."""
+        self._refresh()
+        found = self._scan(count_lines=True)
+        problems = []
+        for name in sorted(set(found) | set(self.datasets)):
+            expected = self.datasets.get(name, {}).get("sample_count")
+            actual = found.get(name, {}).get("sample_count")
+            if expected != actual:
+                problems.append({"dataset": name, "catalog": expected, "disk": actual})
+        return problems
+
+
+training_catalog = TrainingCatalog(training_store)
+training_store.add_listener(training_catalog.record_batch)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Rebuild or verify the training data catalog")
+    parser.add_argument("command", choices=["rebuild", "verify"])
+    args = parser.parse_args(argv)
+
+    if args.command == "rebuild":
+        datasets = training_catalog.rebuild()
+        total = sum(entry["sample_count"] for entry in datasets.values())
+        print(f"Rebuilt {training_catalog.path}: {len(datasets)} datasets, {total} samples")
+        return 0
+
+    training_catalog.load()
+    problems = training_catalog.verify()
+    for problem in problems:
+        print(f"MISMATCH {problem['dataset']}: catalog={problem['catalog']} disk={problem['disk']}")
+    if not problems:
+        print("Catalog matches disk")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,347 @@
+import asyncio
+import json
+import os
+import re
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from app.config import env_int, load_env
+
+if TYPE_CHECKING:
+    from app.utils.dedup import Deduplicator
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows - single-process locking only
+    fcntl = None
+
+load_env()
+
+INDEX_FILE = "index.json"
+LOCK_FILE = ".lock"
+SEGMENT_PATTERN = "segment-{:06d}.jsonl"
+# Raw copies of uploaded files; dataset names never start with "." (see safe_name)
+UPLOADS_DIR = ".uploads"
+
+
+class AppendResult(NamedTuple):
+    count: int  # records in the dataset afterwards
+    added: int
+    duplicates: int
+    near_duplicates: int
+
+
+def safe_name(name: str) -> str:
+    """Make a model/dataset name safe to use as a single path component"""
+    cleaned = re.sub(r"[^A-Za-z0-9_.-]", "_", name).lstrip(".")
+    return cleaned or "_"
+
+
+def _dedup_text(record: dict) -> str:
+    text = record.get("input")
+    return text if isinstance(text, str) else json.dumps(record, sort_keys=True)
+
+
+class _FileLock:
+    """Exclusive advisory lock so several uvicorn workers can append safely."""
+
+    def __init__(self, path: str):
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+
+    def __enter__(self):
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+class _ModelWriter:
+    """Single writer for one model's dataset.
+
+    Appends are queued and a single task drains the queue in batches:
+    each batch is written with one buffered write and made durable with one
+    fsync (group commit), then every waiting caller is released. Under load
+    batches grow on their own, so fsync cost is amortised across requests.
+    """
+
+    def __init__(self, store: "TrainingStore", model_name: str):
+        self.store = store
+        self.model_name = model_name
+        self.directory = os.path.join(store.root, model_name)
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock = _FileLock(os.path.join(self.directory, LOCK_FILE))
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+        self._index: Optional[Dict[str, Any]] = None
+        self._index_stamp: Optional[Tuple[int, int]] = None
+        self._dedup: Optional["Deduplicator"] = None
+
+    async def submit(self, records: List[dict]) -> AppendResult:
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((records, future))
+        return await future
+
+    async def _run(self) -> None:
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            pending = len(item[0])
+            while pending < self.store.batch_size and not self._queue.empty():
+                nxt = self._queue.get_nowait()
+                if nxt is None:
+                    await self._queue.put(None)  # finish this batch, then stop
+                    break
+                batch.append(nxt)
+                pending += len(nxt[0])
+
+            records = [record for records, _ in batch for record in records]
+            try:
+                index, kept, flags = await asyncio.to_thread(self._write, records)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            # flags: 0 kept, 1 exact duplicate, 2 near-duplicate (None without dedup)
+            start = 0
+            for submitted, future in batch:
+                end = start + len(submitted)
+                duplicates = near = 0
+                if flags is not None:
+                    duplicates = int((flags[start:end] == 1).sum())
+                    near = int((flags[start:end] == 2).sum())
+                start = end
+                if not future.done():
+                    future.set_result(AppendResult(index["count"], len(submitted) - duplicates - near, duplicates, near))
+            if kept:
+                self.store._notify(self.model_name, kept, index)
+
+    def _load_index(self) -> Dict[str, Any]:
+        """Read the sidecar index, reusing the cached copy if no other process touched it."""
+        path = os.path.join(self.directory, INDEX_FILE)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            self._index, self._index_stamp = TrainingStore.empty_index(), None
+            return self._index
+        stamp = (st.st_mtime_ns, st.st_size)
+        if self._index is None or stamp != self._index_stamp:
+            with open(path, "r") as f:
+                self._index = json.load(f)
+            self._index_stamp = stamp
+        return self._index
+
+    def _write(self, records: List[dict]):
+        with self._lock:
+            try:
+                if not self.store.dedup:
+                    return self._write_locked(records), records, None
+                if self._dedup is None:
+                    # Imported here, in the writer thread, so numpy only loads once dedup runs
+                    from app.utils.dedup import Deduplicator
+
+                    self._dedup = Deduplicator(self.directory, near=self.store.near_dedup, fsync=self.store.fsync)
+                if self._dedup.needs_backfill():
+                    # Dataset predates dedup: index what is already there first
+                    self._dedup.backfill(_dedup_text(r) for r in self.store.iter_records(self.model_name))
+                result = self._dedup.check([_dedup_text(r) for r in records])
+                kept = [record for record, keep in zip(records, result.keep) if keep]
+                index = self._write_locked(kept) if kept else self._load_index()
+                self._dedup.commit(result)
+                return index, kept, result.exact + 2 * result.near
+            except Exception:
+                # The cached index may be half-updated; re-read it next time
+                self._index = None
+                raise
+
+    def _write_locked(self, records: List[dict]) -> Dict[str, Any]:
+        lines = [(json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8") for record in records]
+        payload = b"".join(lines)
+        index = self._load_index()
+        segments = index["segments"]
+        if not segments or segments[-1]["bytes"] >= self.store.segment_bytes:
+            segments.append({"name": SEGMENT_PATTERN.format(len(segments)), "first_record": index["count"], "count": 0, "bytes": 0})
+        segment = segments[-1]
+
+        with open(os.path.join(self.directory, segment["name"]), "ab") as f:
+            offset = f.seek(0, os.SEEK_END)
+            if offset != segment["bytes"]:
+                # A crash mid-batch left bytes no caller was ever acknowledged for
+                f.truncate(segment["bytes"])
+                offset = segment["bytes"]
+            f.write(payload)
+            f.flush()
+            if self.store.fsync:
+                os.fsync(f.fileno())
+
+        # Sparse offsets: [record number, segment number, byte offset] every
+        # `offset_every` records, so readers can seek without scanning
+        every = self.store.offset_every
+        record_no = index["count"]
+        position = offset
+        for line in lines:
+            if record_no % every == 0:
+                index["offsets"].append([record_no, len(segments) - 1, position])
+            position += len(line)
+            record_no += 1
+
+        segment["count"] += len(lines)
+        segment["bytes"] = position
+        index["count"] = record_no
+        index["bytes"] = sum(s["bytes"] for s in segments)
+
+        self.store._write_index(self.directory, index)
+        st = os.stat(os.path.join(self.directory, INDEX_FILE))
+        self._index_stamp = (st.st_mtime_ns, st.st_size)
+        return index
+
+    async def close(self) -> None:
+        await self._queue.put(None)
+        await self._task
+        self._lock.close()
+
+
+class TrainingStore:
+    """Append-only JSONL store for training records.
+
+    Each model gets a directory under `root` holding numbered JSONL segments
+    plus a small `index.json` sidecar (record count, bytes, per-segment
+    stats and sparse byte offsets). Inserts are O(batch) rather than
+    rewriting the whole dataset, and go through one writer per model plus
+    a file lock, so concurrent requests and workers never interleave writes.
+    With `dedup` on, records whose `input` repeats earlier content are
+    dropped at ingest (and, with `near_dedup`, near-copies of it too).
+    """
+
+    def __init__(
+        self,
+        root: str = "data",
+        batch_size: int = 512,
+        fsync: bool = True,
+        segment_bytes: int = 64 * 1024 * 1024,
+        offset_every: int = 4096,
+        dedup: bool = True,
+        near_dedup: bool = False,
+    ):
+        self.root = root
+        self.batch_size = batch_size
+        self.fsync = fsync
+        self.segment_bytes = segment_bytes
+        self.offset_every = offset_every
+        self.dedup = dedup
+        self.near_dedup = near_dedup
+        self._writers: Dict[str, _ModelWriter] = {}
+        self._listeners: List = []
+
+    @classmethod
+    def from_env(cls) -> "TrainingStore":
+        return cls(
+            root=os.getenv("TRAINING_DATA_DIR", "data"),
+            batch_size=env_int("TRAINING_BATCH_RECORDS", 512),
+            fsync=os.getenv("TRAINING_FSYNC", "1").lower() not in ("0", "false", "no"),
+            segment_bytes=env_int("TRAINING_SEGMENT_BYTES", 64 * 1024 * 1024),
+            dedup=os.getenv("TRAINING_DEDUP", "1").lower() not in ("0", "false", "no"),
+            near_dedup=os.getenv("TRAINING_NEAR_DEDUP", "0").lower() not in ("0", "false", "no"),
+        )
+
+    @staticmethod
+    def empty_index() -> Dict[str, Any]:
+        return {"count": 0, "bytes": 0, "segments": [], "offsets": []}
+
+    @staticmethod
+    def _write_index(directory: str, index: Dict[str, Any]) -> None:
+        path = os.path.join(directory, INDEX_FILE)
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(index, f, separators=(",", ":"))
+        os.replace(tmp, path)
+
+    def add_listener(self, callback) -> None:
+        """Register `callback(model_name, records, index)`, called after every durable batch."""
+        self._listeners.append(callback)
+
+    def _notify(self, model_name: str, records: List[dict], index: Dict[str, Any]) -> None:
+        for callback in self._listeners:
+            try:
+                callback(model_name, records, index)
+            except Exception:
+                pass  # a broken listener must not fail ingestion
+
+    def _writer(self, model_name: str) -> _ModelWriter:
+        model_name = safe_name(model_name)
+        writer = self._writers.get(model_name)
+        if writer is None:
+            writer = self._writers[model_name] = _ModelWriter(self, model_name)
+        return writer
+
+    async def append(self, model_name: str, record: dict) -> int:
+        """Durably append one record; returns the model's record count afterwards."""
+        return (await self._writer(model_name).submit([record])).count
+
+    async def append_many(self, model_name: str, records: List[dict]) -> AppendResult:
+        if not records:
+            return AppendResult(self.count(model_name), 0, 0, 0)
+        return await self._writer(model_name).submit(records)
+
+    def datasets(self) -> List[str]:
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(
+            name for name in os.listdir(self.root)
+            if os.path.isfile(os.path.join(self.root, name, INDEX_FILE))
+        )
+
+    def upload_path(self, filename: str) -> str:
+        """Where to keep the raw copy of an uploaded file, apart from the datasets"""
+        directory = os.path.join(self.root, UPLOADS_DIR)
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, safe_name(os.path.basename(filename)))
+
+    def index(self, model_name: str) -> Dict[str, Any]:
+        path = os.path.join(self.root, safe_name(model_name), INDEX_FILE)
+        try:
+            with open(path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return self.empty_index()
+
+    def count(self, model_name: str) -> int:
+        return self.index(model_name)["count"]
+
+    def iter_records(self, model_name: str, start: int = 0) -> Iterator[dict]:
+        """Yield records from `start` onwards, seeking via the sparse offset index."""
+        directory = os.path.join(self.root, safe_name(model_name))
+        index = self.index(model_name)
+        segment_no, position, record_no = 0, 0, 0
+        for offset_record, offset_segment, offset in index["offsets"]:
+            if offset_record > start:
+                break
+            segment_no, position, record_no = offset_segment, offset, offset_record
+
+        for segment in index["segments"][segment_no:]:
+            with open(os.path.join(directory, segment["name"]), "rb") as f:
+                f.seek(position)
+                for line in f:
+                    if record_no >= index["count"]:
+                        return
+                    if record_no >= start:
+                        yield json.loads(line)
+                    record_no += 1
+            position = 0
+
+    async def close(self) -> None:
+        writers = list(self._writers.values())
+        self._writers.clear()
+        for writer in writers:
+            await writer.close()
+
+
+training_store = TrainingStore.from_env()
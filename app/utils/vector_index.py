@@ -0,0 +1,452 @@
+import asyncio
+import json
+import os
+import threading
+import zlib
+from typing import TYPE_CHECKING, Dict, Iterable, List, NamedTuple, Optional, Set
+
+from app.config import env_float, env_int, load_env
+from app.utils.history import TokenCounter, history_manager
+from app.utils.training_store import TrainingStore, _FileLock, training_store
+
+# numpy is imported where it is used, so importing the app does not load it
+if TYPE_CHECKING:
+    import numpy as np
+
+load_env()
+
+INDEX_DIR = ".vectors"  # under the training data root; safe_name() never yields a leading dot
+MANIFEST_FILE = "manifest.json"
+VECTORS_FILE = "vectors.f32"
+LABELS_FILE = "labels.i32"
+OFFSETS_FILE = "chunk_offsets.i64"
+CHUNKS_FILE = "chunks.jsonl"
+
+CHUNK_WORDS = 120
+CHUNK_OVERLAP = 20
+SYNC_RECORDS = 4096  # records chunked and embedded per step while catching up
+
+
+def chunk_text(text: str, words: int = CHUNK_WORDS, overlap: int = CHUNK_OVERLAP) -> List[str]:
+    """Split text into overlapping windows of `words` words."""
+    tokens = text.split()
+    if len(tokens) <= words:
+        return [" ".join(tokens)] if tokens else []
+    step = words - overlap
+    return [" ".join(tokens[i:i + words]) for i in range(0, len(tokens) - overlap, step)]
+
+
+class HashEmbedder:
+    """Deterministic, dependency-free embedder: signed feature hashing of words and word pairs.
+
+    Captures lexical overlap only, but needs no model download, so it is
+    the offline/test default and the fallback when no local model is set up.
+    """
+
+    name = "hash"
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+
+    def embed(self, texts: List[str]) -> "np.ndarray":
+        import numpy as np
+        rows: List[int] = []
+        features: List[int] = []
+        for row, text in enumerate(texts):
+            words = text.lower().split()
+            grams = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+            features.extend(zlib.crc32(gram.encode("utf-8")) for gram in grams)
+            rows.extend([row] * len(grams))
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        if features:
+            hashed = np.asarray(features, dtype=np.uint32)
+            signs = np.where(hashed & 0x80000000, -1.0, 1.0).astype(np.float32)
+            np.add.at(out, (np.asarray(rows), (hashed % self.dim).astype(np.int64)), signs)
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        return out / np.maximum(norms, 1e-12)
+
+
+class SentenceTransformerEmbedder:
+    """Local transformer embeddings (requires the optional `sentence-transformers` package)."""
+
+    def __init__(self, model_name: str, batch_size: int = 64):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            raise RuntimeError("VECTOR_EMBEDDER names a sentence-transformers model but the package is not installed")
+        self.name = f"st:{model_name}"
+        self.batch_size = batch_size
+        self._model = SentenceTransformer(model_name)
+        self.dim = self._model.get_sentence_embedding_dimension()
+
+    def embed(self, texts: List[str]) -> "np.ndarray":
+        import numpy as np
+        vectors = self._model.encode(texts, batch_size=self.batch_size, normalize_embeddings=True, convert_to_numpy=True)
+        return vectors.astype(np.float32)
+
+
+def embedder_from_env():
+    spec = os.getenv("VECTOR_EMBEDDER", "hash")
+    if spec.startswith("st:"):
+        return SentenceTransformerEmbedder(spec[3:])
+    return HashEmbedder(dim=env_int("VECTOR_DIM", 256))
+
+
+class IVF:
+    """Inverted-file ANN index: k-means centroids, each with the ids assigned to it.
+
+    A query scores only the vectors in its `nprobe` nearest lists, trading a
+    little recall for a large cut in rows touched on big corpora.
+    """
+
+    def __init__(self, vectors: "np.ndarray", nlist: int, iterations: int = 8, sample: int = 50000, seed: int = 0):
+        import numpy as np
+        rng = np.random.default_rng(seed)
+        n = len(vectors)
+        picks = np.sort(rng.choice(n, size=min(n, max(sample, nlist * 8)), replace=False))
+        train = np.asarray(vectors[picks])
+        centroids = train[rng.choice(len(train), size=nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assign = np.argmax(train @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, train)
+            empty = ~sums.any(axis=1)
+            sums[empty] = centroids[empty]  # keep empty clusters where they were
+            centroids = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+        self.centroids = centroids
+        self.lists: List[List["np.ndarray"]] = [[] for _ in range(nlist)]
+        self.size = 0
+        self.trained_on = n
+        self.add(vectors, 0)
+
+    def add(self, vectors: "np.ndarray", first_id: int, chunk: int = 65536) -> None:
+        import numpy as np
+        for start in range(first_id, len(vectors), chunk):
+            block = np.asarray(vectors[start:start + chunk])
+            assign = np.argmax(block @ self.centroids.T, axis=1)
+            order = np.argsort(assign, kind="stable")
+            bounds = np.searchsorted(assign[order], np.arange(len(self.centroids) + 1))
+            ids = order + start
+            for cluster in np.flatnonzero(np.diff(bounds)):
+                self.lists[cluster].append(ids[bounds[cluster]:bounds[cluster + 1]])
+        self.size = max(self.size, len(vectors))
+
+    def candidates(self, query: "np.ndarray", nprobe: int) -> "np.ndarray":
+        import numpy as np
+        nearest = np.argpartition(-(self.centroids @ query), min(nprobe, len(self.centroids)) - 1)[:nprobe]
+        parts = [ids for cluster in nearest for ids in self.lists[cluster]]
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+
+
+class Hit(NamedTuple):
+    score: float
+    dataset: str
+    text: str
+
+
+class VectorIndex:
+    """Embedding index over the training corpus for retrieval at chat time.
+
+    Records are chunked, embedded in batches and appended to flat files
+    under `<data>/.vectors/`: a float32 matrix (memory-mapped for search),
+    per-chunk dataset labels and byte offsets into `chunks.jsonl`, plus a
+    manifest of how many records of each dataset are indexed. New training
+    batches wake a background sync that indexes whatever the manifest has
+    not covered yet, under a file lock, so restarts and several workers
+    catch up without duplicating work. Search is a brute-force matmul, or
+    an IVF probe once the index holds `ivf_min_vectors` vectors.
+    """
+
+    def __init__(
+        self,
+        store: TrainingStore,
+        embedder=None,
+        ivf_min_vectors: int = 50000,
+        nprobe: int = 16,
+        context_k: int = 3,
+        min_score: float = 0.2,
+        context_tokens: int = 400,
+        context_datasets: Optional[Set[str]] = None,
+        counter: Optional[TokenCounter] = None,
+    ):
+        self.store = store
+        self.embedder = embedder or HashEmbedder()
+        self.directory = os.path.join(store.root, INDEX_DIR)
+        self.ivf_min_vectors = ivf_min_vectors
+        self.nprobe = nprobe
+        self.context_k = context_k
+        self.min_score = min_score
+        self.context_tokens = context_tokens
+        # Only these datasets are ever quoted into a chat prompt
+        self.context_datasets = set(context_datasets or ())
+        self.counter = counter or TokenCounter()
+        self._lock = threading.Lock()
+        self._manifest: Optional[dict] = None
+        self._stamp = None
+        self._vectors: Optional["np.ndarray"] = None
+        self._labels: Optional["np.ndarray"] = None
+        self._offsets: Optional["np.ndarray"] = None
+        self._ivf: Optional[IVF] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.syncs = 0
+        self.searches = 0
+
+    @classmethod
+    def from_env(cls) -> "VectorIndex":
+        return cls(
+            training_store,
+            embedder=embedder_from_env(),
+            ivf_min_vectors=env_int("VECTOR_IVF_MIN_VECTORS", 50000),
+            nprobe=env_int("VECTOR_IVF_NPROBE", 16),
+            context_k=env_int("VECTOR_CONTEXT_K", 3),
+            min_score=env_float("VECTOR_MIN_SCORE", 0.2),
+            context_tokens=env_int("VECTOR_CONTEXT_TOKENS", 400),
+            context_datasets={name.strip() for name in os.getenv("VECTOR_CONTEXT_DATASETS", "").split(",") if name.strip()},
+            counter=history_manager.counter,
+        )
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _empty_manifest(self) -> dict:
+        return {"embedder": self.embedder.name, "dim": self.embedder.dim, "count": 0, "chunk_bytes": 0, "datasets": [], "progress": {}}
+
+    # -- on-disk state -------------------------------------------------
+
+    def _refresh(self, force: bool = False) -> dict:
+        """Load the manifest and re-map the arrays if any process changed them."""
+        with self._lock:
+            return self._refresh_locked(force)
+
+    def _refresh_locked(self, force: bool) -> dict:
+        import numpy as np
+        path = self._path(MANIFEST_FILE)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            self._manifest, self._stamp = self._empty_manifest(), None
+            self._vectors = self._labels = self._offsets = self._ivf = None
+            return self._manifest
+        stamp = (st.st_mtime_ns, st.st_size)
+        if stamp == self._stamp and not force:
+            return self._manifest
+        with open(path, "r") as f:
+            manifest = json.load(f)
+        if manifest["embedder"] != self.embedder.name or manifest["dim"] != self.embedder.dim:
+            # Built with a different embedder - start again
+            manifest = self._empty_manifest()
+        count, dim = manifest["count"], manifest["dim"]
+        if count:
+            self._vectors = np.memmap(self._path(VECTORS_FILE), dtype=np.float32, mode="r", shape=(count, dim))
+            self._labels = np.memmap(self._path(LABELS_FILE), dtype=np.int32, mode="r", shape=(count,))
+            self._offsets = np.memmap(self._path(OFFSETS_FILE), dtype=np.int64, mode="r", shape=(count,))
+        else:
+            self._vectors = self._labels = self._offsets = None
+        self._manifest, self._stamp = manifest, stamp
+        if self._vectors is None or (self._ivf is not None and len(self._vectors) < self._ivf.size):
+            self._ivf = None  # index was reset
+        elif self._ivf is not None and len(self._vectors) > self._ivf.size:
+            self._ivf.add(self._vectors, self._ivf.size)
+        return manifest
+
+    def _train_ivf(self) -> None:
+        """Build the ANN index once there are enough vectors; retrain when the corpus has doubled."""
+        vectors, ivf = self._vectors, self._ivf
+        if vectors is None or len(vectors) < self.ivf_min_vectors:
+            return
+        if ivf is not None and len(vectors) <= 2 * ivf.trained_on:
+            return
+        ivf = IVF(vectors, nlist=int(len(vectors) ** 0.5))  # slow: searches carry on meanwhile
+        with self._lock:
+            if self._vectors is not None and len(self._vectors) > ivf.size:
+                ivf.add(self._vectors, ivf.size)
+            self._ivf = ivf
+
+    def _write_manifest(self, manifest: dict) -> None:
+        path = self._path(MANIFEST_FILE)
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp, path)
+
+    def _truncate_to(self, manifest: dict) -> None:
+        """Drop rows a crashed sync appended after the last manifest write."""
+        count, dim = manifest["count"], manifest["dim"]
+        for name, size in (
+            (VECTORS_FILE, count * dim * 4),
+            (LABELS_FILE, count * 4),
+            (OFFSETS_FILE, count * 8),
+            (CHUNKS_FILE, manifest["chunk_bytes"]),
+        ):
+            with open(self._path(name), "ab") as f:
+                if f.seek(0, os.SEEK_END) != size:
+                    f.truncate(size)
+
+    def _append(self, manifest: dict, dataset: str, chunks: List[str]) -> None:
+        import numpy as np
+        if dataset not in manifest["datasets"]:
+            manifest["datasets"].append(dataset)
+        label = manifest["datasets"].index(dataset)
+        lines = [(json.dumps(chunk, ensure_ascii=False) + "\n").encode("utf-8") for chunk in chunks]
+        offsets = manifest["chunk_bytes"] + np.concatenate(([0], np.cumsum([len(line) for line in lines])[:-1]))
+        vectors = self.embedder.embed(chunks)
+
+        with open(self._path(CHUNKS_FILE), "ab") as f:
+            f.write(b"".join(lines))
+        with open(self._path(VECTORS_FILE), "ab") as f:
+            f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        with open(self._path(LABELS_FILE), "ab") as f:
+            f.write(np.full(len(chunks), label, dtype=np.int32).tobytes())
+        with open(self._path(OFFSETS_FILE), "ab") as f:
+            f.write(offsets.astype(np.int64).tobytes())
+        manifest["count"] += len(chunks)
+        manifest["chunk_bytes"] += sum(len(line) for line in lines)
+
+    # -- indexing --------------------------------------------------------
+
+    def sync(self, datasets: Optional[Iterable[str]] = None) -> int:
+        """Index every record not yet covered; returns the number of chunks added."""
+        os.makedirs(self.directory, exist_ok=True)
+        lock = _FileLock(self._path(".lock"))
+        added = 0
+        try:
+            with lock:
+                manifest = dict(self._refresh(force=True))
+                manifest["progress"] = dict(manifest["progress"])
+                manifest["datasets"] = list(manifest["datasets"])
+                self._truncate_to(manifest)
+                for dataset in datasets or self.store.datasets():
+                    done = manifest["progress"].get(dataset, 0)
+                    total = self.store.count(dataset)
+                    batch: List[str] = []
+                    for record in self.store.iter_records(dataset, start=done):
+                        text = record.get("input")
+                        if isinstance(text, str):
+                            batch.extend(chunk_text(text))
+                        done += 1
+                        if done % SYNC_RECORDS == 0 or done >= total:
+                            if batch:
+                                self._append(manifest, dataset, batch)
+                                added += len(batch)
+                                batch = []
+                            manifest["progress"][dataset] = done
+                            self._write_manifest(manifest)
+                        if done >= total:
+                            break
+                self._refresh(force=True)
+        finally:
+            lock.close()
+        self._train_ivf()
+        self.syncs += 1
+        return added
+
+    def on_batch(self, model_name: str, records: List[dict], index: dict) -> None:
+        """TrainingStore listener: wake the background sync."""
+        if self._wake is not None:
+            self._wake.set()
+
+    async def _run(self) -> None:
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            try:
+                await asyncio.to_thread(self.sync)
+            except Exception:
+                pass  # retried on the next training batch
+
+    def start(self) -> None:
+        """Start the background indexer and catch up on anything already on disk."""
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        self._wake.set()
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    # -- queries -----------------------------------------------------------
+
+    def search(self, query: str, k: int = 3, exclude: Optional[Set[str]] = None, include: Optional[Set[str]] = None) -> List[Hit]:
+        """Top-k chunks by cosine similarity, skipping datasets named in `exclude` (or missing from `include`)."""
+        import numpy as np
+        with self._lock:
+            manifest = self._refresh_locked(False)
+            vectors, labels, offsets, ivf = self._vectors, self._labels, self._offsets, self._ivf
+        if vectors is None or not query.strip():
+            return []
+        self.searches += 1
+        q = self.embedder.embed([query])[0]
+
+        ids = None
+        if ivf is not None:
+            ids = ivf.candidates(q, self.nprobe)
+            ids = ids[ids < len(vectors)]
+        excluded = [
+            i for i, name in enumerate(manifest["datasets"])
+            if (exclude and name in exclude) or (include is not None and name not in include)
+        ]
+        if excluded:
+            keep = ~np.isin(labels if ids is None else labels[ids], excluded)
+            ids = np.flatnonzero(keep) if ids is None else ids[keep]
+
+        scores = np.asarray(vectors @ q if ids is None else vectors[ids] @ q)
+        if not len(scores):
+            return []
+        top = np.argpartition(-scores, min(k, len(scores)) - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        hits = []
+        with open(self._path(CHUNKS_FILE), "rb") as f:
+            for i in top:
+                row = int(i if ids is None else ids[i])
+                f.seek(int(offsets[row]))
+                hits.append(Hit(float(scores[i]), manifest["datasets"][labels[row]], json.loads(f.readline())))
+        return hits
+
+    @property
+    def serves_context(self) -> bool:
+        return self.context_k > 0 and bool(self.context_datasets)
+
+    def context(self, query: str, model: str, exclude: Optional[Set[str]] = None) -> Optional[str]:
+        """The best-matching training snippets for a chat turn, within `context_tokens`.
+
+        Only datasets listed in VECTOR_CONTEXT_DATASETS are searched, so an
+        upload cannot put text into other users' prompts unless designated.
+        """
+        if not self.serves_context:
+            return None
+        header = "Relevant notes from the Hackney training data:"
+        used = self.counter.count_text(model, header)
+        lines = []
+        for hit in self.search(query, self.context_k, exclude, self.context_datasets):
+            if hit.score < self.min_score:
+                break
+            line = f"- {hit.text}"
+            tokens = self.counter.count_text(model, line)
+            if used + tokens > self.context_tokens:
+                continue
+            lines.append(line)
+            used += tokens
+        return header + "\n" + "\n".join(lines) if lines else None
+
+    def stats(self) -> Dict[str, object]:
+        manifest = self._refresh()
+        return {
+            "embedder": manifest["embedder"],
+            "dim": manifest["dim"],
+            "vectors": manifest["count"],
+            "datasets": len(manifest["datasets"]),
+            "ann": "ivf" if self._ivf is not None else "brute-force",
+            "syncs": self.syncs,
+            "searches": self.searches,
+        }
+
+
+vector_index = VectorIndex.from_env()
+training_store.add_listener(vector_index.on_batch)
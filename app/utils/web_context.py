@@ -0,0 +1,227 @@
+import asyncio
+import ipaddress
+import math
+import re
+import socket
+from typing import Dict, List, NamedTuple, Optional
+from urllib.parse import urljoin, urlsplit
+
+from app.config import env_float, env_int, load_env
+from app.utils.history import TokenCounter, history_manager
+from app.utils.search import SearchService, search_service
+
+load_env()
+
+WORD = re.compile(r"[a-z0-9']+")
+STOPWORDS = frozenset(
+    "the and for are but not you your with what when where which who how why this that from have has was were "
+    "can could should would will about into than then them they their there its it's our out any all some".split()
+)
+DROP_TAGS = ["script", "style", "noscript", "template", "svg", "header", "footer", "nav", "aside", "form"]
+PASSAGE_WORDS = 80
+MIN_LINE_WORDS = 6
+MAX_REDIRECTS = 3
+
+
+class Passage(NamedTuple):
+    title: str
+    url: str
+    text: str
+
+
+def _terms(text: str) -> List[str]:
+    return [w for w in WORD.findall(text.lower()) if len(w) > 2 and w not in STOPWORDS]
+
+
+def extract_passages(html: str, title: str, url: str) -> List[Passage]:
+    """Visible page text split into ~PASSAGE_WORDS-word passages (boilerplate tags dropped)."""
+    from bs4 import BeautifulSoup  # only needed once a page is fetched; slow to import
+
+    soup = BeautifulSoup(html, "html.parser")
+    for tag in soup(DROP_TAGS):
+        tag.decompose()
+    if soup.title and soup.title.string:
+        title = soup.title.string.strip() or title
+
+    passages: List[Passage] = []
+    words: List[str] = []
+    for line in soup.get_text("\n").splitlines():
+        line_words = line.split()
+        if len(line_words) < MIN_LINE_WORDS:
+            continue  # menus, buttons, captions
+        words.extend(line_words)
+        while len(words) >= PASSAGE_WORDS:
+            passages.append(Passage(title, url, " ".join(words[:PASSAGE_WORDS])))
+            words = words[PASSAGE_WORDS:]
+    if words:
+        passages.append(Passage(title, url, " ".join(words)))
+    return passages
+
+
+async def check_public_url(url: str) -> None:
+    """Raise ValueError unless `url` is http(s) and its host resolves only to public addresses.
+
+    Result pages come from the open web, so a link (or a redirect) to
+    localhost, a cloud metadata address or the private network must never
+    be fetched from inside it.
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise ValueError(f"Refusing to fetch {url}: not an http(s) URL")
+    port = parts.port or (443 if parts.scheme == "https" else 80)
+    infos = await asyncio.get_running_loop().getaddrinfo(parts.hostname, port, type=socket.SOCK_STREAM)
+    for info in infos:
+        address = ipaddress.ip_address(info[4][0].split("%")[0])
+        if not address.is_global or address.is_multicast:
+            raise ValueError(f"Refusing to fetch {url}: {parts.hostname} resolves to non-public address {address}")
+
+
+def rank_passages(query: str, passages: List[Passage]) -> List[Passage]:
+    """Order passages by idf-weighted overlap with the query terms (duplicates removed)."""
+    query_terms = set(_terms(query))
+    unique = list({p.text: p for p in passages}.values())
+    if not query_terms:
+        return unique
+    term_sets = [set(_terms(p.text)) for p in unique]
+    df = {term: sum(term in terms for terms in term_sets) for term in query_terms}
+    n = len(unique)
+    scores = [
+        sum(math.log(1 + n / df[term]) for term in query_terms & terms) / math.sqrt(1 + len(terms) / PASSAGE_WORDS)
+        for terms in term_sets
+    ]
+    order = sorted(range(n), key=lambda i: scores[i], reverse=True)
+    return [unique[i] for i in order if scores[i] > 0]
+
+
+class WebContextBuilder:
+    """Builds web grounding text for a chat turn within a latency deadline.
+
+    Searches, fetches the top result pages in parallel over the search
+    service's pooled client (only public http(s) hosts, redirects
+    re-checked hop by hop), extracts their text, ranks passages against
+    the question and keeps the best that fit `token_budget`. Whatever has
+    not arrived by `deadline` seconds is cancelled and left out, so a slow
+    page costs at most the deadline, never its own timeout.
+    """
+
+    def __init__(
+        self,
+        search: SearchService,
+        counter: TokenCounter,
+        max_results: int = 5,
+        max_pages: int = 3,
+        token_budget: int = 1200,
+        deadline: float = 4.0,
+        page_bytes: int = 512 * 1024,
+    ):
+        self.search = search
+        self.counter = counter
+        self.max_results = max_results
+        self.max_pages = max_pages
+        self.token_budget = token_budget
+        self.deadline = deadline
+        self.page_bytes = page_bytes
+        self.builds = 0
+        self.deadline_misses = 0
+        self.pages_fetched = 0
+        self.pages_dropped = 0
+
+    @classmethod
+    def from_env(cls) -> "WebContextBuilder":
+        return cls(
+            search_service,
+            history_manager.counter,
+            max_results=env_int("WEB_CONTEXT_MAX_RESULTS", 5),
+            max_pages=env_int("WEB_CONTEXT_MAX_PAGES", 3),
+            token_budget=env_int("WEB_CONTEXT_TOKEN_BUDGET", 1200),
+            deadline=env_float("WEB_CONTEXT_DEADLINE_SECONDS", 4),
+        )
+
+    async def _page(self, result: Dict[str, str]) -> List[Passage]:
+        url = result.get("url", "")
+        html = await self._fetch_html(url)
+        if html is None:
+            return []
+        # Parsing is CPU-bound; keep it off the event loop
+        return await asyncio.to_thread(extract_passages, html, result.get("title", url), url)
+
+    async def _fetch_html(self, url: str) -> Optional[str]:
+        """The start of a result page, following redirects only to public http(s) hosts."""
+        for _ in range(MAX_REDIRECTS + 1):
+            await check_public_url(url)
+            async with self.search.client.stream("GET", url, follow_redirects=False) as response:
+                if response.is_redirect:
+                    url = urljoin(str(response.url), response.headers["location"])
+                    continue
+                response.raise_for_status()
+                content_type = response.headers.get("content-type", "")
+                if "html" not in content_type and not content_type.startswith("text/"):
+                    return None
+                body = bytearray()
+                async for chunk in response.aiter_bytes():
+                    body.extend(chunk)
+                    if len(body) >= self.page_bytes:
+                        break
+                return bytes(body[: self.page_bytes]).decode(response.encoding or "utf-8", errors="replace")
+        raise ValueError(f"Too many redirects fetching {url}")
+
+    async def build(self, query: str, model: str) -> Optional[str]:
+        """Grounding text for `query`, or None if nothing useful arrived in time."""
+        self.builds += 1
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline
+        try:
+            results = await asyncio.wait_for(self.search.search(query, self.max_results, fallback=False), self.deadline)
+        except asyncio.TimeoutError:
+            self.deadline_misses += 1
+            return None
+        except Exception:
+            return None
+
+        passages = [Passage(r.get("title", ""), r.get("url", ""), r["snippet"]) for r in results if r.get("snippet")]
+        pages = [r for r in results if r.get("url", "").startswith(("http://", "https://"))][: self.max_pages]
+        tasks = [asyncio.create_task(self._page(r)) for r in pages]
+        try:
+            if tasks:
+                done, pending = await asyncio.wait(tasks, timeout=max(0.0, deadline - loop.time()))
+                if pending:
+                    self.deadline_misses += 1
+                    self.pages_dropped += len(pending)
+                for task in done:
+                    if task.exception() is None:
+                        self.pages_fetched += 1
+                        passages.extend(task.result())
+                    else:
+                        self.pages_dropped += 1
+        finally:
+            # Also runs if the chat request itself is cancelled
+            for task in tasks:
+                task.cancel()
+
+        return self._render(query, model, passages)
+
+    def _render(self, query: str, model: str, passages: List[Passage]) -> Optional[str]:
+        header = "Web search results for the user's question. Use them where relevant and mention sources:"
+        used = self.counter.count_text(model, header)
+        blocks = []
+        for passage in rank_passages(query, passages):
+            block = f"[{len(blocks) + 1}] {passage.title} ({passage.url})\n{passage.text}"
+            tokens = self.counter.count_text(model, block)
+            if used + tokens > self.token_budget:
+                continue  # a shorter, lower-ranked passage may still fit
+            blocks.append(block)
+            used += tokens
+        if not blocks:
+            return None
+        return header + "\n\n" + "\n\n".join(blocks)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "builds": self.builds,
+            "deadline_misses": self.deadline_misses,
+            "pages_fetched": self.pages_fetched,
+            "pages_dropped": self.pages_dropped,
+        }
+
+
+web_context = WebContextBuilder.from_env()
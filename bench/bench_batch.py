@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""Throughput benchmark for /api/chat/batch at different concurrency caps.
+
+Usage: python bench/bench_batch.py [--prompts 256] [--concurrency 1,4,16,64] [--latency-ms 200]
+
+Starts bench/fake_provider.py in-process and posts a batch of `--prompts`
+distinct chat requests to /api/chat/batch once per concurrency cap,
+reading the NDJSON results. Reports wall time and prompts/s for each cap.
+(The fake provider shares this process, so very high caps end up measuring
+its CPU rather than the batch runner.)
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--prompts", type=int, default=256)
+    parser.add_argument("--concurrency", default="1,4,16,64")
+    parser.add_argument("--latency-ms", type=float, default=200)
+    args = parser.parse_args()
+
+    from fake_provider import start_in_thread
+
+    start_in_thread(latency_ms=args.latency_ms, jitter=0.2)
+    root = tempfile.mkdtemp(prefix="hackney-batch-bench-")
+    os.environ.update({"TRAINING_DATA_DIR": root, "BATCH_DIR": os.path.join(root, "batches"), "BATCH_MAX_CONCURRENCY": "1024"})
+
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    print(f"{args.prompts} prompts, {args.latency_ms:.0f} ms provider latency")
+    with TestClient(app) as client:
+        for concurrency in (int(c) for c in args.concurrency.split(",")):
+            requests = [{"message": f"eval prompt {concurrency}-{i}", "model": "hackney-boss"} for i in range(args.prompts)]
+            start = time.perf_counter()
+            response = client.post("/api/chat/batch", json={"requests": requests, "concurrency": concurrency})
+            elapsed = time.perf_counter() - start
+            done = json.loads(response.text.splitlines()[-1])
+            print(f"  concurrency {concurrency:>4}: {elapsed:6.2f}s  {args.prompts / elapsed:7.1f} prompts/s  ({done['completed']} ok, {done['failed']} failed)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""Burst benchmark for single-flight coalescing of identical chat requests.
+
+Usage: python bench/bench_coalescing.py [--burst 200] [--distinct 5] [--latency-ms 300]
+
+Starts bench/fake_provider.py in-process and fires `--burst` concurrent
+chat requests spread over `--distinct` different prompts, as
+generate_response calls and as streams, with coalescing off and then on.
+Reports wall time, upstream provider requests (counted by the fake) and
+how many callers were coalesced onto another caller's request.
+"""
+import argparse
+import asyncio
+import dataclasses
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+
+async def burst(args, stream: bool) -> float:
+    from app.utils.ai_model import AIModel
+    from app.utils.providers import providers
+
+    async def one(i: int) -> None:
+        message = f"what's the best pie and mash in Hackney, version {i % args.distinct}?"
+        if stream:
+            async for event in AIModel.stream_response(message, "hackney-boss", temperature=0.9):
+                assert event["type"] != "error", event
+        else:
+            await AIModel.generate_response(message, "hackney-boss", temperature=0.9)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(args.burst)))
+    elapsed = time.perf_counter() - start
+    await providers.close()
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--burst", type=int, default=200)
+    parser.add_argument("--distinct", type=int, default=5)
+    parser.add_argument("--latency-ms", type=float, default=300)
+    args = parser.parse_args()
+
+    from fake_provider import start_in_thread
+
+    fake = start_in_thread(latency_ms=args.latency_ms, jitter=0.2)
+    os.environ["TRAINING_DATA_DIR"] = tempfile.mkdtemp(prefix="hackney-coalesce-bench-")
+    import app.utils.ai_model as ai_model
+
+    print(f"burst of {args.burst} requests over {args.distinct} distinct prompts, {args.latency_ms:.0f} ms provider latency")
+    for stream in (False, True):
+        for coalesce in (False, True):
+            ai_model.settings = dataclasses.replace(ai_model.settings, chat_coalesce=coalesce)
+            flight = ai_model.chat_streams if stream else ai_model.chat_flight
+            before_upstream = fake.state.stats["openai"]["requests"]
+            before_coalesced = flight.coalesced
+            elapsed = asyncio.run(burst(args, stream))
+            upstream = fake.state.stats["openai"]["requests"] - before_upstream
+            label = f"{'stream' if stream else 'chat'}, coalescing {'on' if coalesce else 'off'}"
+            print(f"  {label:<26} {elapsed * 1000:7.0f} ms   upstream calls {upstream:4d}   coalesced {flight.coalesced - before_coalesced:4d}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""Throughput benchmark for training-data deduplication.
+
+Usage: python bench/bench_dedup.py [--records 2000000] [--batch 2000] [--dup-rate 0.3] [--near-rate 0.1] [--near]
+
+Feeds `--records` synthetic lines (a `--dup-rate` share of them exact
+repeats of earlier lines, a `--near-rate` share one-word edits) through the exact-hash dedup index in `--batch` sized
+chunks, as the training store does at ingest, in a throwaway directory.
+With --near the MinHash/LSH stage runs as well. Reports records/s, drop
+counts, on-disk index size and peak RSS.
+"""
+import argparse
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from app.utils.dedup import EXACT_FILE, NEAR_FILE, Deduplicator  # noqa: E402
+
+
+def line(i: int) -> str:
+    """Deterministic 12-word line, so duplicates can be regenerated instead of stored"""
+    rng = random.Random(i)
+    return " ".join(f"w{rng.randrange(50000)}" for _ in range(12))
+
+
+def corpus(records: int, dup_rate: float, near_rate: float, seed: int = 7):
+    rng = random.Random(seed)
+    for i in range(records):
+        roll = rng.random() if i else 1.0
+        if roll < dup_rate:
+            yield line(rng.randrange(i))
+        elif roll < dup_rate + near_rate:
+            yield line(rng.randrange(i)) + " again"  # an earlier line with one word added
+        else:
+            yield line(i)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=2_000_000)
+    parser.add_argument("--batch", type=int, default=2000)
+    parser.add_argument("--dup-rate", type=float, default=0.3)
+    parser.add_argument("--near-rate", type=float, default=0.1, help="share of lines that are one-word edits of earlier lines")
+    parser.add_argument("--near", action="store_true", help="also run MinHash/LSH near-duplicate detection")
+    parser.add_argument("--fsync", action="store_true", help="msync the index after every batch")
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="hackney-dedup-bench-")
+    dedup = Deduplicator(root, near=args.near, fsync=args.fsync)
+    kept = exact = near = 0
+    batch = []
+    elapsed = 0.0
+
+    def flush() -> None:
+        nonlocal kept, exact, near, elapsed
+        start = time.perf_counter()
+        result = dedup.check(batch)
+        dedup.commit(result)
+        elapsed += time.perf_counter() - start
+        kept += int(result.keep.sum())
+        exact += int(result.exact.sum())
+        near += int(result.near.sum())
+        batch.clear()
+
+    for text in corpus(args.records, args.dup_rate, args.near_rate):
+        batch.append(text)
+        if len(batch) >= args.batch:
+            flush()
+    if batch:
+        flush()
+
+    index_bytes = sum(
+        os.path.getsize(os.path.join(root, name)) for name in (EXACT_FILE, NEAR_FILE) if os.path.exists(os.path.join(root, name))
+    )
+    print(f"records     {args.records:,} ({'exact + near' if args.near else 'exact'})")
+    print(f"kept        {kept:,}")
+    print(f"dropped     {exact:,} exact, {near:,} near-duplicate")
+    print(f"elapsed     {elapsed:.2f}s (dedup only, corpus generation excluded)")
+    print(f"throughput  {args.records / elapsed:,.0f} records/s")
+    print(f"index size  {index_bytes / 1e6:,.1f} MB on disk")
+    print(f"peak RSS    {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:,.0f} MB")
+    shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
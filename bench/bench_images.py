@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""End-to-end check and timing of the image service against the fake provider.
+
+Usage: python bench/bench_images.py [--n 4] [--latency-ms 1000] [--concurrency 4] [--store-kb 64]
+
+Starts bench/fake_provider.py in-process and, through the API:
+generates `--n` images for one prompt (one parallel provider call each),
+repeats the request (served from the blob store, no provider calls),
+fetches an image whole, by byte range and with If-None-Match, and then
+generates enough new prompts to push the store past `--store-kb` and
+trigger LRU eviction. Prints timings and provider call counts per step.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--n", type=int, default=4)
+    parser.add_argument("--latency-ms", type=float, default=1000)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--store-kb", type=int, default=64)
+    args = parser.parse_args()
+
+    from fake_provider import start_in_thread
+
+    fake = start_in_thread(latency_ms=args.latency_ms, jitter=0.05)
+    root = tempfile.mkdtemp(prefix="hackney-image-bench-")
+    os.environ.update({
+        "TRAINING_DATA_DIR": root,
+        "IMAGE_STORE_DIR": os.path.join(root, "images"),
+        "IMAGE_STORE_MAX_BYTES": str(args.store_kb * 1024),
+        "IMAGE_CONCURRENCY": str(args.concurrency),
+    })
+
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    def provider_images() -> int:
+        return fake.state.stats["openai"].get("images", 0)
+
+    with TestClient(app) as client:
+        def generate(prompt: str, n: int):
+            before, start = provider_images(), time.perf_counter()
+            response = client.post("/api/images/generate", json={"prompt": prompt, "n": n})
+            response.raise_for_status()
+            return response.json()["images"], time.perf_counter() - start, provider_images() - before
+
+        generate("warm-up", 1)  # first call pays for client setup and SDK imports
+        urls, elapsed, calls = generate("a fox on Hackney Marshes", args.n)
+        print(f"generate n={args.n}: {elapsed * 1000:6.0f} ms, {calls} provider images ({args.latency_ms:.0f} ms each, concurrency {args.concurrency})")
+        again, elapsed, calls = generate("a fox on Hackney Marshes", args.n)
+        print(f"repeat   n={args.n}: {elapsed * 1000:6.0f} ms, {calls} provider images, same urls: {again == urls}")
+        more, elapsed, calls = generate("a fox on Hackney Marshes", args.n + 2)
+        print(f"grow to  n={args.n + 2}: {elapsed * 1000:6.0f} ms, {calls} provider images, first {args.n} reused: {more[:args.n] == urls}")
+
+        whole = client.get(urls[0])
+        etag = whole.headers["etag"]
+        part = client.get(urls[0], headers={"Range": "bytes=0-99"})
+        tail = client.get(urls[0], headers={"Range": "bytes=-10"})
+        cached = client.get(urls[0], headers={"If-None-Match": etag})
+        print(f"serve: {whole.status_code} {len(whole.content)} bytes {whole.headers['content-type']}, etag {etag[:14]}...")
+        print(f"  range 0-99 -> {part.status_code} {part.headers.get('content-range')}, matches: {part.content == whole.content[:100]}")
+        print(f"  suffix -10 -> {tail.status_code} {tail.headers.get('content-range')}, matches: {tail.content == whole.content[-10:]}")
+        print(f"  if-none-match -> {cached.status_code}")
+
+        for i in range(args.store_kb * 1024 // len(whole.content) + 2):
+            generate(f"filler prompt {i}", 1)
+        stats = client.get("/api/images/stats").json()
+        print(f"store after filling: {stats['blobs']} blobs, {stats['bytes'] // 1024} KB of {args.store_kb} KB, {stats['evictions']} evicted")
+        print(f"  oldest image now: {client.get(urls[0]).status_code}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""Load benchmark for the main routes, compared against a stored baseline.
+
+Usage: python bench/bench_load.py [--scenarios chat,chat_stream,code,train,search] [--requests 300]
+           [--concurrency 16] [--latency-ms 100] [--latency-dist lognormal] [--jitter 0.5]
+           [--error-rate 0.0] [--token-delay-ms 5] [--baseline bench/baseline.json]
+           [--save-baseline] [--tolerance 0.25]
+
+Needs no network. It starts bench/fake_provider.py in-process and runs
+the backend as a separate uvicorn process pointed at it, with throwaway
+data directories. Each scenario is then driven over HTTP by
+`--concurrency` clients after a short warm-up:
+
+    chat         POST /api/chat (distinct prompts, so nothing is cached)
+    chat_stream  POST /api/chat/stream, timed to the end of the stream
+    code         POST /api/code/execute (a small Python program)
+    train        POST /api/train (distinct records)
+    search       POST /api/web/search (50 distinct queries, so mostly cache hits)
+
+For each scenario the script reports p50/p95/p99 latency, requests/s,
+errors and the server's resident memory afterwards. It also reports the
+server's peak memory over the whole run.
+
+With --save-baseline the results are written to `--baseline`. Otherwise
+they are compared with it: a scenario is flagged as a regression if its
+p95 or p99 rose, its requests/s fell or its memory grew by more than
+`--tolerance`, or if its error rate rose. Any regression makes the
+script exit 1, so it can gate a deploy.
+
+Baselines are only comparable on the same machine with the same
+settings, so the settings are stored with them. The fake provider and
+the load generator share this process, so at very high concurrency the
+run measures them as much as the server.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+SETTINGS = ("requests", "concurrency", "latency_ms", "latency_dist", "jitter", "error_rate", "token_delay_ms")
+WARMUP_REQUESTS = 10
+
+
+def chat_body(i: int) -> dict:
+    return {"message": f"load test question {i} {uuid.uuid4().hex[:8]}", "model": "auto", "temperature": 0.9}
+
+
+SCENARIOS = {
+    "chat": ("/api/chat", chat_body),
+    "chat_stream": ("/api/chat/stream", chat_body),
+    "code": ("/api/code/execute", lambda i: {"code": f"print(sum(range({i} * 1000)))", "language": "python"}),
+    "train": ("/api/train", lambda i: {"data": f"load test record {i} {uuid.uuid4().hex}", "model_name": "load_test"}),
+    "search": ("/api/web/search", lambda i: {"query": f"hackney downs {i % 50}", "max_results": 5}),
+}
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def memory_mb(pid: int):
+    """(resident, peak resident) MB of a process, from /proc; (None, None) where unavailable."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line)
+    except OSError:
+        return None, None
+    kb = lambda name: int(fields[name].split()[0]) if name in fields else None  # noqa: E731
+    rss, peak = kb("VmRSS"), kb("VmHWM")
+    return (rss / 1024 if rss else None), (peak / 1024 if peak else None)
+
+
+def start_server(port: int, data_dir: str) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "PYTHONPATH": os.path.abspath(ROOT),
+        "TRAINING_DATA_DIR": os.path.join(data_dir, "training"),
+        "BATCH_DIR": os.path.join(data_dir, "batches"),
+        "IMAGE_STORE_DIR": os.path.join(data_dir, "images"),
+        "LOG_LEVEL": "WARNING",
+    }
+    env.pop("SESSION_DB_PATH", None)
+    os.makedirs(os.path.join(data_dir, "data"), exist_ok=True)
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=data_dir,  # relative data/ paths land in the throwaway directory
+        env=env,
+    )
+
+
+async def wait_until_up(client, server: subprocess.Popen, timeout: float = 60.0) -> float:
+    """Seconds until the server answers and has finished its background warm-up."""
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        if server.poll() is not None:
+            raise RuntimeError(f"server exited with code {server.returncode}")
+        try:
+            response = await client.get("/")
+            if response.status_code == 200 and not response.json().get("warming_up"):
+                return time.perf_counter() - started
+        except Exception:
+            pass
+        await asyncio.sleep(0.05)
+    raise RuntimeError(f"server did not start within {timeout:.0f}s")
+
+
+async def run_scenario(client, name: str, count: int, concurrency: int, pid: int) -> dict:
+    path, body = SCENARIOS[name]
+    latencies, errors = [], 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int) -> None:
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                response = await client.post(path, json=body(i))
+                failed = response.status_code >= 400 or (name == "chat_stream" and '"type": "error"' in response.text)
+            except Exception:
+                failed = True
+            latencies.append((time.perf_counter() - start) * 1000)
+            errors += failed
+
+    await asyncio.gather(*(one(-1 - i) for i in range(WARMUP_REQUESTS)))
+    latencies.clear()
+    errors = 0
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(count)))
+    elapsed = time.perf_counter() - started
+    rss, _ = memory_mb(pid)
+    return {
+        "requests": count,
+        "errors": errors,
+        "rps": round(count / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50), 1),
+        "p95_ms": round(percentile(latencies, 0.95), 1),
+        "p99_ms": round(percentile(latencies, 0.99), 1),
+        "rss_mb": round(rss, 1) if rss else None,
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float, min_delta_ms: float) -> list:
+    """Regression messages for `results` against a saved baseline."""
+    problems = []
+    for name, result in results.items():
+        base = baseline["results"].get(name)
+        if base is None:
+            continue
+        for key in ("p95_ms", "p99_ms"):
+            if result[key] > base[key] * (1 + tolerance) and result[key] - base[key] > min_delta_ms:
+                problems.append(f"{name}: {key} {base[key]} -> {result[key]}")
+        if result["rps"] < base["rps"] * (1 - tolerance):
+            problems.append(f"{name}: rps {base['rps']} -> {result['rps']}")
+        if result["rss_mb"] and base.get("rss_mb") and result["rss_mb"] > base["rss_mb"] * (1 + tolerance):
+            problems.append(f"{name}: rss {base['rss_mb']} MB -> {result['rss_mb']} MB")
+        if result["errors"] / result["requests"] > base["errors"] / base["requests"] + 0.01:
+            problems.append(f"{name}: errors {base['errors']}/{base['requests']} -> {result['errors']}/{result['requests']}")
+    return problems
+
+
+def change(new, old) -> str:
+    return f"{(new - old) / old:+.0%}" if old else ""
+
+
+async def run(args, scenarios) -> dict:
+    import httpx
+    from fake_provider import start_in_thread
+
+    start_in_thread(
+        latency_ms=args.latency_ms, latency_dist=args.latency_dist, jitter=args.jitter,
+        error_rate=args.error_rate, token_delay_ms=args.token_delay_ms,
+    )
+    port = args.port
+    data_dir = tempfile.mkdtemp(prefix="hackney-load-bench-")
+    server = start_server(port, data_dir)
+    results = {}
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=120) as client:
+            startup = await wait_until_up(client, server)
+            print(f"server up and warm in {startup:.2f}s, {args.requests} requests per scenario at concurrency {args.concurrency}")
+            print(f"{'scenario':<12} {'errors':>6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'rss MB':>8}")
+            for name in scenarios:
+                result = results[name] = await run_scenario(client, name, args.requests, args.concurrency, server.pid)
+                print(f"{name:<12} {result['errors']:>6} {result['rps']:>8.1f} {result['p50_ms']:>8.1f} "
+                      f"{result['p95_ms']:>8.1f} {result['p99_ms']:>8.1f} {result['rss_mb'] or 0:>8.1f}")
+        _, peak = memory_mb(server.pid)
+        if peak:
+            print(f"server peak rss {peak:.1f} MB")
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency-ms", type=float, default=100)
+    parser.add_argument("--latency-dist", default="lognormal")
+    parser.add_argument("--jitter", type=float, default=0.5)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--token-delay-ms", type=float, default=5)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--baseline", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json"))
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--min-delta-ms", type=float, default=5.0, help="ignore latency changes smaller than this")
+    args = parser.parse_args()
+
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)} (choose from {', '.join(SCENARIOS)})")
+
+    results = asyncio.run(run(args, scenarios))
+    settings = {key: getattr(args, key) for key in SETTINGS}
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump({"settings": settings, "machine": platform.node(), "python": platform.python_version(), "results": results}, f, indent=2)
+            f.write("\n")
+        print(f"baseline saved to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"no baseline at {args.baseline}; run with --save-baseline to create one")
+        return
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get("settings") != settings:
+        print(f"warning: baseline was recorded with different settings: {baseline.get('settings')}")
+    print("vs baseline:")
+    for name, result in results.items():
+        base = baseline["results"].get(name)
+        if base:
+            print(f"  {name:<12} p95 {change(result['p95_ms'], base['p95_ms']):>5}   p99 {change(result['p99_ms'], base['p99_ms']):>5}"
+                  f"   req/s {change(result['rps'], base['rps']):>5}")
+    problems = compare(results, baseline, args.tolerance, args.min_delta_ms)
+    for problem in problems:
+        print(f"REGRESSION {problem}")
+    if problems:
+        sys.exit(1)
+    print("no regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""Tail-latency benchmark for provider timeouts, retries, hedging and fallback.
+
+Usage: python bench/bench_resilience.py [--requests 400] [--concurrency 20] [--model hackney-boss]
+           [--latency-ms 200] [--stall-rate 0.05] [--error-rate 0.05] [--timeout 3]
+
+Starts bench/fake_provider.py in-process, points the provider clients at it
+and sends `--requests` chat completions through AIModel, first without and
+then with hedged requests. Reports p50/p95/p99 latency, failures and the
+resilience counters (retries, hedges, hedge wins, fallbacks) for each run.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def run(label: str, hedge: bool, args) -> None:
+    from app.utils.ai_model import AIModel
+    from app.utils.providers import providers
+    from app.utils.resilience import Resilience
+    import app.utils.ai_model as ai_model
+
+    policy = Resilience(timeout=args.timeout, hedge=hedge, hedge_min_delay=0.05, reset_timeout=5.0)
+    ai_model.resilience = policy
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies, failures = [], 0
+
+    async def one(i: int) -> None:
+        nonlocal failures
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await AIModel.generate_response(f"bench question {i}", args.model, temperature=0.9)
+            except Exception:
+                failures += 1
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(args.requests)))
+    elapsed = time.perf_counter() - started
+    await providers.close()
+
+    print(f"{label}: {args.requests / elapsed:,.0f} req/s, {failures} failed")
+    print(f"  p50 {percentile(latencies, 0.5):7.0f} ms   p95 {percentile(latencies, 0.95):7.0f} ms   p99 {percentile(latencies, 0.99):7.0f} ms")
+    for provider, counters in policy.stats()["providers"].items():
+        print(f"  {provider}: {counters}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--model", default="hackney-boss")
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--stall-rate", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.05)
+    parser.add_argument("--timeout", type=float, default=3.0)
+    args = parser.parse_args()
+
+    from fake_provider import start_in_thread
+
+    start_in_thread(latency_ms=args.latency_ms, stall_rate=args.stall_rate, stall_seconds=30.0, error_rate=args.error_rate)
+    os.environ["TRAINING_DATA_DIR"] = tempfile.mkdtemp(prefix="hackney-resilience-bench-")
+    print(f"fake provider: median {args.latency_ms:.0f} ms, {args.stall_rate:.0%} stalls, {args.error_rate:.0%} errors, {args.timeout:.0f}s timeout")
+    asyncio.run(run("no hedging", False, args))
+    asyncio.run(run("hedged at p95", True, args))
+
+
+if __name__ == "__main__":
+    main()
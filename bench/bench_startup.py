@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""Cold-start benchmark: import time and time to first request.
+
+Usage: python bench/bench_startup.py [--runs 5] [--repo PATH] [--latency-ms 50]
+
+Each run starts a fresh interpreter and reports four timings:
+
+    import       seconds to `import app.main`
+    first req    seconds from process start to the first 200 from /api/models
+    first chat   latency of a /api/chat sent as soon as /api/models answers,
+                 to bench/fake_provider.py running in this process
+    boot->chat   the two together: process start to the first chat reply
+
+The chat timing covers whatever provider setup the first chat still pays
+for. The script prints the median and best of each timing. `--repo`
+points at another checkout, so a before/after comparison is:
+
+    git worktree add /tmp/before <old commit>
+    python bench/bench_startup.py --repo /tmp/before
+    python bench/bench_startup.py
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def environment(repo: str) -> dict:
+    env = {**os.environ, "PYTHONPATH": repo, "LOG_LEVEL": "WARNING"}
+    env["TRAINING_DATA_DIR"] = tempfile.mkdtemp(prefix="hackney-startup-bench-")
+    return env
+
+
+def import_time(repo: str) -> float:
+    code = "import time; t = time.perf_counter(); import app.main; print(time.perf_counter() - t)"
+    out = subprocess.check_output([sys.executable, "-c", code], cwd=tempfile.mkdtemp(), env=environment(repo))
+    return float(out.decode().strip().splitlines()[-1])
+
+
+def request(url: str, body: bytes = None, timeout: float = 60.0) -> int:
+    req = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(req, timeout=timeout) as response:
+        response.read()
+        return response.status
+
+
+def first_requests(repo: str):
+    """(seconds to the first /api/models 200, latency of the first /api/chat)"""
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=tempfile.mkdtemp(),
+        env=environment(repo),
+    )
+    try:
+        while True:
+            if server.poll() is not None:
+                raise RuntimeError(f"server exited with code {server.returncode}")
+            try:
+                if request(f"{base}/api/models", timeout=1) == 200:
+                    break
+            except OSError:
+                time.sleep(0.005)
+        ready = time.perf_counter() - started
+
+        chat_started = time.perf_counter()
+        request(f"{base}/api/chat", b'{"message": "first chat after boot", "model": "gpt-4", "temperature": 0.9}')
+        return ready, time.perf_counter() - chat_started
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--repo", default=os.path.abspath(os.path.join(HERE, "..")))
+    parser.add_argument("--latency-ms", type=float, default=50)
+    args = parser.parse_args()
+
+    from fake_provider import start_in_thread
+
+    start_in_thread(latency_ms=args.latency_ms, jitter=0.0)
+    repo = os.path.abspath(args.repo)
+    imports, readies, chats = [], [], []
+    for _ in range(args.runs):
+        imports.append(import_time(repo))
+        ready, chat = first_requests(repo)
+        readies.append(ready)
+        chats.append(chat)
+
+    print(f"{repo}: {args.runs} runs, fake provider latency {args.latency_ms:.0f} ms")
+    boots = [ready + chat for ready, chat in zip(readies, chats)]
+    for label, values in (("import", imports), ("first req", readies), ("first chat", chats), ("boot->chat", boots)):
+        print(f"  {label:<11} median {statistics.median(values):6.3f}s   best {min(values):6.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""Ingest benchmark for the append-only JSONL training store.
+
+Usage: python bench/bench_training_store.py [--records 1000000] [--producers 64] [--batch 1] [--no-fsync]
+
+Simulates `--producers` concurrent /api/train requests each appending
+`--batch` records at a time until `--records` have been written, into a
+throwaway directory. Reports throughput, fsync batches and a read-back
+check of the sidecar index. With --legacy N it also times the old
+read-modify-rewrite JSON approach for N records, for comparison.
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from app.utils.training_store import TrainingStore  # noqa: E402
+
+
+async def run(args) -> None:
+    root = tempfile.mkdtemp(prefix="hackney-train-bench-")
+    store = TrainingStore(root=root, batch_size=args.writer_batch, fsync=not args.no_fsync, dedup=not args.no_dedup)
+    batches = []
+    store.add_listener(lambda model, records, index: batches.append(len(records)))
+
+    per_producer = args.records // args.producers
+    total = per_producer * args.producers
+
+    async def producer(worker: int) -> None:
+        for i in range(0, per_producer, args.batch):
+            records = [
+                {"input": f"sample line {worker}-{j} from the bench corpus", "timestamp": "2025-01-01T00:00:00+00:00", "model": "bench"}
+                for j in range(i, min(i + args.batch, per_producer))
+            ]
+            if len(records) == 1:
+                await store.append("bench", records[0])
+            else:
+                await store.append_many("bench", records)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(producer(w) for w in range(args.producers)))
+    await store.close()
+    elapsed = time.perf_counter() - start
+
+    index = store.index("bench")
+    print(f"records     {index['count']:,} (expected {total:,})")
+    print(f"bytes       {index['bytes']:,} in {len(index['segments'])} segment(s)")
+    print(f"elapsed     {elapsed:.2f}s")
+    print(f"throughput  {total / elapsed:,.0f} records/s")
+    print(f"write batches {len(batches):,} (avg {total / max(len(batches), 1):.1f} records per fsync)")
+
+    start = time.perf_counter()
+    tail = list(store.iter_records("bench", start=max(0, total - 10)))
+    print(f"seek+read last 10 records via offset index: {(time.perf_counter() - start) * 1000:.2f} ms ({len(tail)} read)")
+    shutil.rmtree(root)
+
+
+def run_legacy(records: int) -> None:
+    """The pre-store /api/train behaviour: load, append, rewrite the whole file"""
+    root = tempfile.mkdtemp(prefix="hackney-train-legacy-")
+    path = os.path.join(root, "bench_training.json")
+    start = time.perf_counter()
+    for i in range(records):
+        existing = []
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                existing = json.load(f)
+        existing.append({"input": f"sample line {i} from the bench corpus", "timestamp": "2025-01-01", "model": "bench"})
+        with open(path, "w") as f:
+            json.dump(existing, f, indent=2)
+    elapsed = time.perf_counter() - start
+    print(f"legacy      {records:,} records in {elapsed:.2f}s ({records / elapsed:,.0f} records/s, O(n) per insert)")
+    shutil.rmtree(root)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=1_000_000)
+    parser.add_argument("--producers", type=int, default=64)
+    parser.add_argument("--batch", type=int, default=1, help="records per append call")
+    parser.add_argument("--writer-batch", type=int, default=512, help="max records per group commit")
+    parser.add_argument("--no-fsync", action="store_true")
+    parser.add_argument("--no-dedup", action="store_true")
+    parser.add_argument("--legacy", type=int, default=0, help="also time the old JSON rewrite for N records")
+    args = parser.parse_args()
+    if args.legacy:
+        run_legacy(args.legacy)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
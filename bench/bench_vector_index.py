@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""Query latency and recall benchmark for the training-data vector index.
+
+Usage: python bench/bench_vector_index.py [--sizes 10000,100000] [--queries 200] [--k 5] [--nprobe 16]
+
+For each corpus size, writes synthetic topical training records into a
+throwaway training store, indexes them with the hash embedder (timed), and
+runs `--queries` searches both brute-force and through the IVF index.
+Reports indexing throughput, p50/p95 query latency and IVF recall@k
+against the exact brute-force results.
+"""
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from app.utils.training_store import TrainingStore  # noqa: E402
+from app.utils.vector_index import VectorIndex  # noqa: E402
+
+TOPICS = 200
+TOPIC_WORDS = 40
+
+
+def make_text(rng: random.Random) -> str:
+    """A line mixing one topic's vocabulary with common words, so neighbours exist"""
+    topic = rng.randrange(TOPICS)
+    words = [f"t{topic}w{rng.randrange(TOPIC_WORDS)}" for _ in range(10)]
+    words += [f"common{rng.randrange(500)}" for _ in range(6)]
+    rng.shuffle(words)
+    return " ".join(words)
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def fill(store: TrainingStore, size: int, rng: random.Random) -> None:
+    for start in range(0, size, 5000):
+        await store.append_many("bench", [{"input": make_text(rng)} for _ in range(min(5000, size - start))])
+    await store.close()
+
+
+def run(size: int, args) -> None:
+    root = tempfile.mkdtemp(prefix="hackney-vector-bench-")
+    rng = random.Random(size)
+    store = TrainingStore(root=root, fsync=False, dedup=False)
+    asyncio.run(fill(store, size, rng))
+
+    exact = VectorIndex(store, ivf_min_vectors=10 ** 12)
+    start = time.perf_counter()
+    exact.sync()
+    build = time.perf_counter() - start
+    ann = VectorIndex(store, ivf_min_vectors=0, nprobe=args.nprobe)
+    start = time.perf_counter()
+    ann._refresh()
+    ann._train_ivf()
+    train = time.perf_counter() - start
+
+    queries = [make_text(rng) for _ in range(args.queries)]
+    timings = {"brute-force": [], "ivf": []}
+    recall = []
+    for query in queries:
+        t0 = time.perf_counter()
+        truth = exact.search(query, args.k)
+        t1 = time.perf_counter()
+        found = ann.search(query, args.k)
+        t2 = time.perf_counter()
+        timings["brute-force"].append((t1 - t0) * 1000)
+        timings["ivf"].append((t2 - t1) * 1000)
+        # Score-based, so ties at the k-th place do not count as misses
+        cutoff = truth[-1].score - 1e-6 if truth else 0.0
+        recall.append(sum(hit.score >= cutoff for hit in found) / max(len(truth), 1))
+
+    print(f"corpus {size:,} records: indexed in {build:.2f}s ({size / build:,.0f} records/s), IVF trained in {train:.2f}s")
+    for name, values in timings.items():
+        print(f"  {name:<12} p50 {percentile(values, 0.5):6.2f} ms   p95 {percentile(values, 0.95):6.2f} ms")
+    print(f"  ivf recall@{args.k} {statistics.mean(recall):.3f} (nprobe={args.nprobe})")
+    shutil.rmtree(root)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10000,100000")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--nprobe", type=int, default=16)
+    args = parser.parse_args()
+    for size in (int(s) for s in args.sizes.split(",")):
+        run(size, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""Local fake of the OpenAI, Anthropic and xAI APIs with fault injection.
+
+Usage: python bench/fake_provider.py [--port 9100] [--latency-ms 300] [--jitter 0.5]
+           [--latency-dist lognormal] [--error-rate 0.0] [--rate-limit-rate 0.0]
+           [--stall-rate 0.0] [--token-delay-ms 20] [--token-jitter 0.0] [--reply-words 16]
+
+Point the backend at it with:
+
+    OPENAI_BASE_URL=http://127.0.0.1:9100/v1
+    ANTHROPIC_BASE_URL=http://127.0.0.1:9100
+    XAI_API_URL=http://127.0.0.1:9100/v1
+    SEARCH_API_URL=http://127.0.0.1:9100/ddg/
+
+(plus any non-empty OPENAI_API_KEY / ANTHROPIC_API_KEY / XAI_API_KEY).
+
+Serves /v1/chat/completions, /v1/messages and /v1/completions, streaming
+and non-streaming, /v1/images/generations (small random PNGs) and a
+DuckDuckGo instant-answer stand-in at /ddg/. Each request waits a latency
+drawn from `--latency-dist` with median `--latency-ms`:
+
+    lognormal    spread `--jitter` (the default)
+    fixed        always the median
+    uniform      within median * (1 +- jitter)
+    exponential  memoryless, a long-ish tail
+    pareto       heavy tail, shape 1 + 1/jitter
+
+then fails with a 500 (`--error-rate`), a 429 with Retry-After
+(`--rate-limit-rate`), or hangs for `--stall-seconds` (`--stall-rate`).
+Streams send `--reply-words` tokens `--token-delay-ms` apart (lognormal
+spread `--token-jitter`). Faults can be set per provider ("search" for
+/ddg/) and changed while running:
+
+    curl -X POST localhost:9100/_fake/config -d '{"anthropic": {"error_rate": 1.0}}'
+
+GET /_fake/stats returns request and fault counts per provider.
+"""
+import argparse
+import asyncio
+import base64
+import json
+import math
+import os
+import random
+import socket
+import threading
+import time
+import uuid
+import zlib
+from typing import Any, Dict
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+PROVIDERS = ("openai", "anthropic", "xai", "search")
+LATENCY_DISTRIBUTIONS = ("lognormal", "fixed", "uniform", "exponential", "pareto")
+IMAGE_SIDE = 64
+REPLY = "Alright mate, this is the fake provider talking, proper quick and no nonsense about it innit."
+
+DEFAULT_FAULTS = {
+    "latency_ms": 300.0,
+    "jitter": 0.5,
+    "error_rate": 0.0,
+    "rate_limit_rate": 0.0,
+    "stall_rate": 0.0,
+    "stall_seconds": 120.0,
+    "token_delay_ms": 20.0,
+    "retry_after": 1,
+    "latency_dist": "lognormal",
+    "token_jitter": 0.0,
+    "reply_words": 16,
+}
+
+
+def sample_latency(median: float, spread: float, distribution: str = "lognormal") -> float:
+    """Seconds drawn from `distribution` with the given median."""
+    if median <= 0 or distribution == "fixed":
+        return max(median, 0.0)
+    if distribution == "uniform":
+        return max(0.0, median * random.uniform(1 - spread, 1 + spread))
+    if distribution == "exponential":
+        return random.expovariate(math.log(2) / median)
+    if distribution == "pareto":
+        shape = 1 + 1 / max(spread, 0.01)
+        return median / 2 ** (1 / shape) * random.paretovariate(shape)
+    return median * math.exp(random.gauss(0, spread))
+
+
+def reply_text(words: int) -> str:
+    base = REPLY.split(" ")
+    return " ".join(base[i % len(base)] for i in range(max(1, int(words))))
+
+
+def fake_png(side: int = IMAGE_SIDE) -> bytes:
+    """A random-noise RGB PNG, so every generated image has distinct bytes."""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return len(data).to_bytes(4, "big") + kind + data + zlib.crc32(kind + data).to_bytes(4, "big")
+
+    rows = b"".join(b"\x00" + os.urandom(side * 3) for _ in range(side))
+    header = side.to_bytes(4, "big") * 2 + bytes([8, 2, 0, 0, 0])
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(rows)) + chunk(b"IEND", b"")
+
+
+def create_app(**faults: Any) -> FastAPI:
+    """A fake provider app; keyword arguments override DEFAULT_FAULTS for every provider."""
+    config: Dict[str, Dict[str, Any]] = {p: {**DEFAULT_FAULTS, **faults} for p in PROVIDERS}
+    stats: Dict[str, Dict[str, int]] = {p: {"requests": 0, "errors": 0, "rate_limited": 0, "stalled": 0} for p in PROVIDERS}
+    app = FastAPI(title="Fake LLM provider")
+
+    async def fault(provider: str):
+        """Wait the simulated latency; return an error response if a fault fires."""
+        settings = config[provider]
+        stats[provider]["requests"] += 1
+        await asyncio.sleep(sample_latency(settings["latency_ms"] / 1000, settings["jitter"], settings["latency_dist"]))
+        roll = random.random()
+        if roll < settings["stall_rate"]:
+            stats[provider]["stalled"] += 1
+            await asyncio.sleep(settings["stall_seconds"])
+        roll -= settings["stall_rate"]
+        if 0 <= roll < settings["rate_limit_rate"]:
+            stats[provider]["rate_limited"] += 1
+            return JSONResponse({"error": {"type": "rate_limit_error", "message": "fake rate limit"}}, status_code=429,
+                                headers={"retry-after": str(settings["retry_after"])})
+        roll -= settings["rate_limit_rate"]
+        if 0 <= roll < settings["error_rate"]:
+            stats[provider]["errors"] += 1
+            return JSONResponse({"error": {"type": "api_error", "message": "fake upstream failure"}}, status_code=500)
+        return None
+
+    async def tokens(provider: str):
+        settings = config[provider]
+        for word in reply_text(settings["reply_words"]).split(" "):
+            await asyncio.sleep(sample_latency(settings["token_delay_ms"] / 1000, settings["token_jitter"]))
+            yield word + " "
+
+    def reply(provider: str) -> str:
+        return reply_text(config[provider]["reply_words"])
+
+    def sse(data: Dict[str, Any], event: str = None) -> str:
+        prefix = f"event: {event}\n" if event else ""
+        return f"{prefix}data: {json.dumps(data)}\n\n"
+
+    @app.post("/v1/chat/completions")
+    async def openai_chat(request: Request):
+        body = await request.json()
+        error = await fault("openai")
+        if error is not None:
+            return error
+        created, model, text = int(time.time()), body.get("model", "gpt-4"), reply("openai")
+        usage = {"prompt_tokens": 10, "completion_tokens": len(text.split()), "total_tokens": 10 + len(text.split())}
+        if not body.get("stream"):
+            return {
+                "id": f"chatcmpl-{uuid.uuid4().hex}", "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": usage,
+            }
+
+        async def events():
+            chunk = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": created, "model": model}
+            async for token in tokens("openai"):
+                yield sse({**chunk, "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]})
+            yield sse({**chunk, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+            if (body.get("stream_options") or {}).get("include_usage"):
+                yield sse({**chunk, "choices": [], "usage": usage})
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.post("/v1/messages")
+    async def anthropic_messages(request: Request):
+        body = await request.json()
+        error = await fault("anthropic")
+        if error is not None:
+            return error
+        model, text = body.get("model", "claude-3-opus"), reply("anthropic")
+        usage = {"input_tokens": 10, "output_tokens": len(text.split())}
+        message = {"id": f"msg_{uuid.uuid4().hex}", "type": "message", "role": "assistant", "model": model,
+                   "stop_reason": "end_turn", "stop_sequence": None}
+        if not body.get("stream"):
+            return {**message, "content": [{"type": "text", "text": text}], "usage": usage}
+
+        async def events():
+            start = {**message, "content": [], "stop_reason": None, "usage": {"input_tokens": 10, "output_tokens": 1}}
+            yield sse({"type": "message_start", "message": start}, "message_start")
+            yield sse({"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}}, "content_block_start")
+            async for token in tokens("anthropic"):
+                yield sse({"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": token}}, "content_block_delta")
+            yield sse({"type": "content_block_stop", "index": 0}, "content_block_stop")
+            yield sse({"type": "message_delta", "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                       "usage": {"output_tokens": usage["output_tokens"]}}, "message_delta")
+            yield sse({"type": "message_stop"}, "message_stop")
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.post("/v1/completions")
+    async def xai_completions(request: Request):
+        body = await request.json()
+        error = await fault("xai")
+        if error is not None:
+            return error
+        text = reply("xai")
+        usage = {"prompt_tokens": 10, "completion_tokens": len(text.split())}
+        if not body.get("stream"):
+            return {"choices": [{"index": 0, "text": text}], "usage": usage}
+
+        async def events():
+            async for token in tokens("xai"):
+                yield sse({"choices": [{"index": 0, "text": token}]})
+            yield sse({"choices": [], "usage": usage})
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.post("/v1/images/generations")
+    async def images(request: Request):
+        body = await request.json()
+        error = await fault("openai")
+        if error is not None:
+            return error
+        stats["openai"]["images"] = stats["openai"].get("images", 0) + body.get("n", 1)
+        data = []
+        for _ in range(body.get("n", 1)):
+            png = fake_png()
+            if body.get("response_format") == "b64_json":
+                data.append({"b64_json": base64.b64encode(png).decode("ascii"), "revised_prompt": body.get("prompt")})
+            else:
+                data.append({"url": f"https://fake.invalid/{uuid.uuid4().hex}.png"})
+        return {"created": int(time.time()), "data": data}
+
+    @app.get("/ddg/")
+    async def search(q: str = ""):
+        error = await fault("search")
+        if error is not None:
+            return error
+        return {
+            "Heading": q.title(),
+            "AbstractText": f"{q}: {reply('search')}",
+            "AbstractURL": f"https://fake.invalid/{uuid.uuid5(uuid.NAMESPACE_URL, q).hex}",
+            "RelatedTopics": [{"Text": f"{q} related topic {i}", "FirstURL": f"https://fake.invalid/{i}"} for i in range(5)],
+        }
+
+    @app.post("/_fake/config")
+    async def set_config(request: Request):
+        """Merge {"provider": {fault: value}} (or {fault: value} for all providers) into the config."""
+        body = await request.json()
+        for provider in PROVIDERS:
+            config[provider].update(body.get(provider) or {k: v for k, v in body.items() if k in DEFAULT_FAULTS})
+        return config
+
+    @app.get("/_fake/stats")
+    async def get_stats():
+        return stats
+
+    app.state.config = config
+    app.state.stats = stats
+    return app
+
+
+def start_in_thread(**faults: Any) -> FastAPI:
+    """Serve a fake provider on a free local port in a daemon thread.
+
+    Points the OpenAI/Anthropic/xAI/search env vars at it (with dummy keys) and
+    returns the app; its `state.config` / `state.stats` are live.
+    """
+    import uvicorn
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    app = create_app(**faults)
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+
+    base = f"http://127.0.0.1:{port}"
+    os.environ.update({
+        "OPENAI_API_KEY": "fake", "ANTHROPIC_API_KEY": "fake", "XAI_API_KEY": "fake",
+        "OPENAI_BASE_URL": f"{base}/v1", "ANTHROPIC_BASE_URL": base, "XAI_API_URL": f"{base}/v1",
+        "SEARCH_API_URL": f"{base}/ddg/",
+    })
+    return app
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    for name, default in DEFAULT_FAULTS.items():
+        choices = LATENCY_DISTRIBUTIONS if name == "latency_dist" else None
+        parser.add_argument(f"--{name.replace('_', '-')}", type=type(default), default=default, choices=choices)
+    args = vars(parser.parse_args())
+    host, port = args.pop("host"), args.pop("port")
+    uvicorn.run(create_app(**args), host=host, port=port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,49 @@
 #!/usr/bin/env bash
 # Restart the Hackney backend and run a quick test against the grok model.
-# Usage: ./restart_and_test.sh
+# Usage: ./restart_and_test.sh [--fake] [--bench]
+#   --fake   point the backend at bench/fake_provider.py instead of the real APIs (no network, no keys)
+#   --bench  afterwards, run the offline load benchmark and compare it with bench/baseline.json
 
 set -e
 cd "$(dirname "$0")"
 
-# Kill any running uvicorn instances for this app (best-effort)
-pkill -f 'uvicorn app.main:app' || true
+FAKE=0
+BENCH=0
+for arg in "$@"; do
+  case "$arg" in
+    --fake) FAKE=1 ;;
+    --bench) BENCH=1 ;;
+    *) echo "Unknown option: $arg" >&2; exit 2 ;;
+  esac
+done
 
-# Start the server in background using the venv python
 if [ -x ./venv/bin/python ]; then
-  ./venv/bin/python -m uvicorn app.main:app --host 127.0.0.1 --port 8002 &
+  PYTHON=./venv/bin/python
 else
-  python -m uvicorn app.main:app --host 127.0.0.1 --port 8002 &
+  PYTHON=python
+fi
+
+# Kill any running uvicorn instances for this app (best-effort)
+pkill -f 'uvicorn app.main:app' || true
+
+if [ "$FAKE" = 1 ]; then
+  pkill -f 'bench/fake_provider.py' || true
+  $PYTHON bench/fake_provider.py --port 9100 --latency-ms 100 &
+  FPID=$!
+  export OPENAI_API_KEY=fake ANTHROPIC_API_KEY=fake XAI_API_KEY=fake
+  export OPENAI_BASE_URL=http://127.0.0.1:9100/v1 ANTHROPIC_BASE_URL=http://127.0.0.1:9100
+  export XAI_API_URL=http://127.0.0.1:9100/v1 SEARCH_API_URL=http://127.0.0.1:9100/ddg/
 fi
 
+# Start the server in background
+$PYTHON -m uvicorn app.main:app --host 127.0.0.1 --port 8002 &
+
 VPID=$!
-# give it a couple seconds to start
-sleep 2
+# wait (up to 30s) until it answers
+for _ in $(seq 60); do
+  curl -sf -o /dev/null http://127.0.0.1:8002/ && break
+  sleep 0.5
+done
 
 echo "Server started (PID=$VPID). Testing /chat with grok-code-fast-1..."
 
@@ -28,4 +54,13 @@ curl -s -X POST http://127.0.0.1:8002/api/chat \
 
 echo
 
-echo "If you get a response, Grok is working. If you see an error about missing XAI_API_KEY, run ./set_xai_key.py to set it first." 
+if [ "$FAKE" = 1 ]; then
+  echo "That reply came from the fake provider (PID=$FPID); both keep running in the background."
+else
+  echo "If you get a response, Grok is working. If you see an error about missing XAI_API_KEY, run ./set_xai_key.py to set it first."
+fi
+
+if [ "$BENCH" = 1 ]; then
+  # Starts its own server and fake provider on other ports
+  $PYTHON bench/bench_load.py
+fi
@@ -0,0 +1,33 @@
+import os
+import sys
+import tempfile
+
+# Keep the app's stores out of the working tree before any app module is imported
+_ROOT = tempfile.mkdtemp(prefix="hackney-tests-")
+os.environ.setdefault("TRAINING_DATA_DIR", os.path.join(_ROOT, "training"))
+os.environ.setdefault("IMAGE_STORE_DIR", os.path.join(_ROOT, "images"))
+os.environ.setdefault("BATCH_DIR", os.path.join(_ROOT, "batches"))
+os.environ["STARTUP_WARMUP"] = "0"
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bench"))
+
+import httpx  # noqa: E402
+import pytest  # noqa: E402
+from fake_provider import create_app  # noqa: E402
+
+
+@pytest.fixture
+def fake():
+    """bench/fake_provider.py with no latency or faults; tweak `fake.state.config` per test."""
+    return create_app(latency_ms=0, jitter=0, latency_dist="fixed", token_delay_ms=0)
+
+
+def fake_http(app, base_url: str = "http://fake") -> httpx.AsyncClient:
+    """An httpx client that calls the fake app in-process (create it inside the test's event loop)."""
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url=base_url)
+
+
+def fake_openai(app):
+    import openai
+
+    return openai.AsyncOpenAI(api_key="fake", base_url="http://fake/v1", http_client=fake_http(app), max_retries=0)
@@ -0,0 +1,117 @@
+import asyncio
+import time
+
+import pytest
+
+from app.utils.cache import CompletionCache, InMemoryBackend, LRUCache
+
+KEY_ARGS = dict(member="hackney-boss", model="gpt-4", prompt="You are the boss", message="alright?", history=[], temperature=0.0, max_tokens=100)
+
+
+def test_key_covers_every_field_that_changes_the_answer():
+    key = CompletionCache.make_key(**KEY_ARGS)
+    assert key == CompletionCache.make_key(**KEY_ARGS)
+    assert CompletionCache.make_key(**{**KEY_ARGS, "history": None}) == key  # no history is an empty one
+
+    changes = {
+        "member": "shoreditch-sage",
+        "model": "claude-3-opus",
+        "prompt": "You are the sage",
+        "message": "alright mate?",
+        "history": [{"role": "user", "content": "hi"}],
+        "temperature": 0.2,
+        "max_tokens": 200,
+    }
+    keys = {CompletionCache.make_key(**{**KEY_ARGS, field: value}) for field, value in changes.items()}
+    assert key not in keys and len(keys) == len(changes)
+
+
+def test_lru_entries_expire_after_their_ttl():
+    cache = LRUCache(max_entries=10, ttl=0.05)
+    cache.set("a", 1)
+    cache.set("b", 2, ttl=10)
+    assert cache.get("a") == 1
+    time.sleep(0.1)
+    assert cache.get("a") is None and cache.get("b") == 2
+    assert len(cache) == 1
+
+
+def test_lru_evicts_the_least_recently_used_entry():
+    cache = LRUCache(max_entries=2, ttl=None)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # b is now the least recently used
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+
+
+def test_shared_tier_is_read_through_into_the_local_tier():
+    shared = InMemoryBackend()
+    writer = CompletionCache(shared=shared)
+    reader = CompletionCache(shared=shared)  # another worker, with its own local tier
+
+    async def run():
+        await writer.set("k", "cached reply")
+        first = await reader.get("k")
+        second = await reader.get("k")
+        return first, second, await reader.get("missing")
+
+    first, second, missing = asyncio.run(run())
+    assert first == second == "cached reply" and missing is None
+    assert reader.shared_hits == 1 and reader.local_hits == 1
+    assert reader.stats()["entries"] == 1
+    assert reader.stats()["shared_tier"] == "InMemoryBackend"
+
+
+def test_shared_tier_entries_expire():
+    shared = InMemoryBackend()
+
+    async def run():
+        await shared.set("k", "v", ttl=0.05)
+        await shared.set("forever", "v")
+        await asyncio.sleep(0.1)
+        return await shared.get("k"), await shared.get("forever")
+
+    assert asyncio.run(run()) == (None, "v")
+
+
+def test_shared_tier_failures_are_counted_and_ignored():
+    class Broken:
+        async def get(self, key):
+            raise ConnectionError("redis went away")
+
+        async def set(self, key, value, ttl=None):
+            raise ConnectionError("redis went away")
+
+    cache = CompletionCache(shared=Broken())
+
+    async def run():
+        await cache.set("k", "v")
+        return await cache.get("k"), await cache.get("other")
+
+    assert asyncio.run(run()) == ("v", None)
+    assert cache.shared_errors == 2 and cache.misses == 1
+
+
+@pytest.mark.parametrize("temperature, cached", [(0.0, True), (0.3, True), (0.31, False), (0.9, False)])
+def test_only_low_temperature_requests_are_cached(temperature, cached):
+    cache = CompletionCache(max_temperature=0.3)
+    assert cache.should_cache(temperature) is cached
+    assert cache.skipped == (0 if cached else 1)
+
+
+def test_hit_and_miss_counters():
+    cache = CompletionCache()
+
+    async def run():
+        assert await cache.get("k") is None
+        await cache.set("k", "v")
+        assert await cache.get("k") == "v"
+        assert await cache.get("k") == "v"
+
+    asyncio.run(run())
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["local_hits"], stats["shared_hits"]) == (2, 1, 2, 0)
+    assert stats["hit_rate"] == pytest.approx(2 / 3)
+    assert stats["shared_tier"] is None
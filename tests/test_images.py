@@ -0,0 +1,154 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.routes import images as image_routes
+from app.utils import images
+from app.utils.images import BlobStore, ImageService
+from conftest import fake_openai
+
+
+def _service(tmp_path, max_bytes: int = 10 * 1024 * 1024, concurrency: int = 4) -> ImageService:
+    return ImageService(BlobStore(root=str(tmp_path / "images"), max_bytes=max_bytes), concurrency=concurrency)
+
+
+@pytest.fixture
+def openai_fake(fake, monkeypatch):
+    """Route ImageService's provider calls to the fake; returns the fake's stats."""
+    monkeypatch.setattr(images.providers, "_openai", None)
+
+    def client():
+        if images.providers._openai is None:
+            images.providers._openai = fake_openai(fake)
+        return images.providers._openai
+
+    monkeypatch.setattr(type(images.providers), "openai", property(lambda self: client()))
+    return fake.state.stats["openai"]
+
+
+def test_n_images_are_parallel_single_image_calls(tmp_path, fake, openai_fake):
+    service = _service(tmp_path)
+
+    async def run():
+        await service.generate("warm-up", n=1)  # client setup is not what is measured
+        fake.state.config["openai"]["latency_ms"] = 300
+        started = time.perf_counter()
+        names = await service.generate("a fox on Hackney Marshes", n=3)
+        return names, time.perf_counter() - started
+
+    names, elapsed = asyncio.run(run())
+    assert len(set(names)) == 3
+    assert openai_fake["requests"] == 4 and openai_fake["images"] == 4  # one image per call
+    assert elapsed < 0.75  # three 300ms calls side by side, not 900ms one after another
+
+
+def test_same_prompt_size_quality_is_served_from_the_store(tmp_path, openai_fake):
+    service = _service(tmp_path)
+
+    async def run():
+        first = await service.generate("pie and mash", n=2)
+        again = await service.generate("pie and mash", n=2)
+        fewer = await service.generate("pie and mash", n=1)
+        other_size = await service.generate("pie and mash", size="512x512", n=1)
+        return first, again, fewer, other_size
+
+    first, again, fewer, other_size = asyncio.run(run())
+    assert again == first and fewer == first[:1]
+    assert other_size[0] not in first
+    assert service.hits == 2
+    assert openai_fake["requests"] == 3
+
+
+def test_growing_n_reuses_stored_variants(tmp_path, openai_fake):
+    service = _service(tmp_path)
+
+    async def run():
+        first = await service.generate("eel pie", n=2)
+        more, also = await asyncio.gather(service.generate("eel pie", n=4), service.generate("eel pie", n=3))
+        return first, more, also
+
+    first, more, also = asyncio.run(run())
+    assert more[:2] == first and also == more[:3]
+    assert openai_fake["requests"] == 4
+    assert service.store.get_key(service.key("eel pie", "1024x1024", "standard")) == more
+
+
+def test_least_recently_used_blobs_are_evicted(tmp_path):
+    store = BlobStore(root=str(tmp_path / "images"), max_bytes=300)
+    a, b = store.put(b"a" * 100), store.put(b"b" * 100)
+    c = store.put(b"c" * 100)
+    assert store.path(a) is not None  # a is now the most recently used
+    d = store.put(b"d" * 100)
+
+    assert store.path(b) is None
+    assert all(store.path(name) is not None for name in (a, c, d))
+    assert store.stats()["evictions"] == 1 and store.stats()["bytes"] == 300
+
+    # A fresh store rebuilds recency from the files on disk
+    assert BlobStore(root=str(tmp_path / "images"), max_bytes=300).stats()["blobs"] == 3
+
+
+def test_evicted_key_regenerates(tmp_path, openai_fake):
+    service = _service(tmp_path, max_bytes=1)  # room for one blob at a time
+
+    async def run():
+        first = await service.generate("chips", n=1)
+        await service.generate("gravy", n=1)
+        return first, await service.generate("chips", n=1)
+
+    first, again = asyncio.run(run())
+    assert again != first
+    assert openai_fake["requests"] == 3
+
+
+@pytest.fixture
+def client(tmp_path, openai_fake, monkeypatch):
+    service = _service(tmp_path)
+    monkeypatch.setattr(image_routes, "image_service", service)
+    app = FastAPI()
+    app.include_router(image_routes.router)
+    return TestClient(app)
+
+
+def _stored_image(client) -> tuple:
+    url = client.post("/images/generate", json={"prompt": "a cat in London Fields"}).json()["images"][0]
+    path = "/images/" + url.rsplit("/", 1)[1]
+    return path, client.get(path)
+
+
+def test_etag_and_if_none_match(client):
+    path, response = _stored_image(client)
+    assert response.status_code == 200 and response.content.startswith(b"\x89PNG")
+    etag = response.headers["etag"]
+    assert etag == '"' + path.rsplit("/", 1)[1].split(".")[0] + '"'
+    assert "immutable" in response.headers["cache-control"]
+
+    cached = client.get(path, headers={"If-None-Match": etag})
+    assert cached.status_code == 304 and cached.content == b""
+    assert client.get(path, headers={"If-None-Match": '"other"'}).status_code == 200
+    assert client.get("/images/" + "0" * 64 + ".png").status_code == 404
+
+
+def test_range_and_if_range(client):
+    path, whole = _stored_image(client)
+    size, etag = len(whole.content), whole.headers["etag"]
+
+    part = client.get(path, headers={"Range": "bytes=0-7"})
+    assert part.status_code == 206
+    assert part.content == whole.content[:8]
+    assert part.headers["content-range"] == f"bytes 0-7/{size}"
+
+    tail = client.get(path, headers={"Range": "bytes=-10"})
+    assert tail.status_code == 206 and tail.content == whole.content[-10:]
+
+    unsatisfiable = client.get(path, headers={"Range": f"bytes={size}-"})
+    assert unsatisfiable.status_code == 416
+    assert unsatisfiable.headers["content-range"] == f"bytes */{size}"
+
+    # If-Range: the range only applies while the client's copy is this image
+    assert client.get(path, headers={"Range": "bytes=0-7", "If-Range": etag}).status_code == 206
+    stale = client.get(path, headers={"Range": "bytes=0-7", "If-Range": '"other"'})
+    assert stale.status_code == 200 and stale.content == whole.content
@@ -0,0 +1,48 @@
+import json
+
+from app.utils.ai_model import AIModel, _compile_persona, personas
+from app.utils.history import PreparedHistory
+
+MEMBER = "shoreditch-sage"
+
+SHORT = PreparedHistory(messages=[], summary=None, tokens=0)
+LONG = PreparedHistory(
+    messages=[
+        {"role": "user", "content": "Design me a logo"},
+        {"role": "assistant", "content": "Here's a bold one, bruv"},
+    ],
+    summary="Earlier the user asked about branding for a cafe.",
+    tokens=42,
+    context="Web result: Hackney Downs cafe opens on Saturday.",
+)
+
+
+def _bytes(blocks) -> bytes:
+    return json.dumps(blocks).encode()
+
+
+def test_persona_prompt_is_built_identically():
+    info = AIModel.AI_GANG[MEMBER]
+    first = _compile_persona(AIModel._create_personality_prompt(info))
+    second = _compile_persona(AIModel._create_personality_prompt(info))
+
+    assert first.text.encode() == second.text.encode()
+    assert _bytes(first.anthropic_system) == _bytes(second.anthropic_system)
+    assert _bytes(first.openai_message) == _bytes(second.openai_message)
+    assert first.text == personas[MEMBER].text
+
+
+def test_cached_prefix_is_the_same_across_histories():
+    persona = AIModel._persona(MEMBER, AIModel.AI_GANG[MEMBER]["model"])
+    short = AIModel._anthropic_system(persona, SHORT)
+    long = AIModel._anthropic_system(persona, LONG)
+
+    cached = [block for block in short if "cache_control" in block]
+    assert cached == persona.anthropic_system
+    assert _bytes(long[:len(cached)]) == _bytes(cached)
+    # Per-turn text only ever follows the cached block
+    assert all("cache_control" not in block for block in long[len(cached):])
+
+    assert _bytes(AIModel._openai_messages(persona, "hi", SHORT)[0]) == _bytes(AIModel._openai_messages(persona, "logo?", LONG)[0])
+    assert AIModel._xai_input(persona, "hi", SHORT).startswith(persona.text)
+    assert AIModel._xai_input(persona, "logo?", LONG).startswith(persona.text)
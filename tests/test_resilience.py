@@ -0,0 +1,157 @@
+import asyncio
+import dataclasses
+import time
+
+import pytest
+
+from app.utils import ai_model
+from app.utils.ai_model import AIModel
+from app.utils.resilience import LatencyTracker, ProviderError, ProviderRateLimited, ProviderUnavailable, Resilience
+from conftest import fake_http, fake_openai
+
+CHAT = {"model": "gpt-4", "messages": [{"role": "user", "content": "alright?"}]}
+
+
+def _policy(**overrides) -> Resilience:
+    return Resilience(**{"timeout": 2.0, "deadline": 5.0, "retries": 2, "backoff_base": 0.01, "backoff_max": 0.05, **overrides})
+
+
+def _attempt(http, fake, then=None):
+    """One chat completion against the fake; `then` adjusts the fake's faults after each request."""
+    async def attempt():
+        response = await http.post("/v1/chat/completions", json=CHAT)
+        if then is not None:
+            then(fake.state.config["openai"])
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]["content"]
+    return attempt
+
+
+@pytest.mark.parametrize("fault", ["error_rate", "rate_limit_rate"])
+def test_transient_failure_is_retried_until_it_succeeds(fake, fault):
+    fake.state.config["openai"].update({fault: 1.0, "retry_after": 0})
+    resilience = _policy()
+
+    async def run():
+        async with fake_http(fake) as http:
+            return await resilience.call("openai", "gpt-4", _attempt(http, fake, then=lambda config: config.update({fault: 0.0})))
+
+    assert asyncio.run(run())
+    stats = fake.state.stats["openai"]
+    assert stats["requests"] == 2 and stats["errors"] + stats["rate_limited"] == 1
+    assert resilience.counters["openai"]["retries"] == 1
+    assert resilience.breaker("openai").state == "closed"
+
+
+def test_retries_give_up_with_the_matching_error(fake):
+    fake.state.config["openai"].update({"rate_limit_rate": 1.0, "retry_after": 0})
+    resilience = _policy(retries=1)
+
+    async def run():
+        async with fake_http(fake) as http:
+            await resilience.call("openai", "gpt-4", _attempt(http, fake))
+
+    with pytest.raises(ProviderRateLimited) as error:
+        asyncio.run(run())
+    assert error.value.status_code == 429 and error.value.retry_after == 0
+    assert fake.state.stats["openai"]["requests"] == 2
+
+
+def test_client_errors_are_not_retried(fake):
+    resilience = _policy()
+
+    async def run():
+        async with fake_http(fake) as http:
+            async def attempt():
+                (await http.post("/v1/no-such-endpoint", json=CHAT)).raise_for_status()
+            await resilience.call("openai", "gpt-4", attempt)
+
+    with pytest.raises(ProviderError) as error:
+        asyncio.run(run())
+    assert not isinstance(error.value, ProviderUnavailable)
+    assert resilience.counters["openai"].get("retries", 0) == 0
+
+
+def test_hedge_fires_after_the_observed_latency(fake):
+    fake.state.config["openai"].update({"stall_rate": 1.0, "stall_seconds": 5.0})
+    resilience = _policy(hedge=True, hedge_min_delay=0.1)
+    tracker = resilience.latencies["gpt-4"] = LatencyTracker(min_samples=1)
+    tracker.record(0.1)
+
+    async def run():
+        async with fake_http(fake) as http:
+            plain, tries = _attempt(http, fake), []
+
+            async def attempt():
+                tries.append(1)
+                if len(tries) == 2:  # the first request is already stalled; the hedge gets through
+                    fake.state.config["openai"]["stall_rate"] = 0.0
+                return await plain()
+
+            started = time.perf_counter()
+            reply = await resilience.call("openai", "gpt-4", attempt)
+            return reply, time.perf_counter() - started
+
+    reply, elapsed = asyncio.run(run())
+    assert reply
+    assert 0.1 <= elapsed < 2.0  # waited for the hedge delay, not for the stalled request
+    assert resilience.counters["openai"]["hedges"] == 1
+    assert resilience.counters["openai"]["hedge_wins"] == 1
+    assert fake.state.stats["openai"]["stalled"] == 1
+
+
+def test_breaker_opens_fails_fast_probes_and_closes(fake):
+    fake.state.config["openai"]["error_rate"] = 1.0
+    resilience = _policy(retries=0, failure_threshold=2, reset_timeout=0.2)
+    breaker = resilience.breaker("openai")
+
+    async def run():
+        async with fake_http(fake) as http:
+            call = lambda: resilience.call("openai", "gpt-4", _attempt(http, fake))  # noqa: E731
+            for _ in range(2):
+                with pytest.raises(ProviderUnavailable):
+                    await call()
+            assert breaker.state == "open"
+
+            # Open: fails fast without reaching the provider
+            requests = fake.state.stats["openai"]["requests"]
+            with pytest.raises(ProviderUnavailable, match="circuit open") as error:
+                await call()
+            assert error.value.retry_after > 0
+            assert fake.state.stats["openai"]["requests"] == requests
+            assert resilience.counters["openai"]["short_circuits"] == 1
+
+            # Half-open: a failed probe re-opens it
+            await asyncio.sleep(0.25)
+            assert breaker.state == "half_open"
+            with pytest.raises(ProviderUnavailable):
+                await call()
+            assert breaker.state == "open" and breaker.opens == 2
+
+            # A successful probe closes it
+            await asyncio.sleep(0.25)
+            fake.state.config["openai"]["error_rate"] = 0.0
+            assert await call()
+            assert breaker.state == "closed"
+
+    asyncio.run(run())
+
+
+def test_fallback_to_another_gang_provider(fake, monkeypatch):
+    fake.state.config["openai"]["error_rate"] = 1.0
+    # Only OpenAI and xAI are configured, so xAI's gang model is the fallback
+    monkeypatch.setattr(ai_model, "settings", dataclasses.replace(ai_model.settings, openai_api_key="fake", anthropic_api_key=None, xai_api_key="fake"))
+    monkeypatch.setattr(ai_model, "resilience", _policy(retries=0))
+    xai_model = next(info["model"] for info in AIModel.AI_GANG.values() if info["model"].startswith("grok"))
+
+    async def run():
+        monkeypatch.setattr(ai_model.providers, "_openai", fake_openai(fake))
+        monkeypatch.setattr(ai_model.providers, "_xai", fake_http(fake, "http://fake/v1"))
+        return await AIModel.generate_reply("what's the best pie and mash in Hackney?", "gpt-4", temperature=0.9)
+
+    reply = asyncio.run(run())
+    assert reply.model_used == xai_model
+    assert reply.response
+    assert fake.state.stats["openai"]["errors"] == 1
+    assert fake.state.stats["xai"]["requests"] == 1
+    assert ai_model.resilience.counters["openai"]["fallbacks"] == 1
@@ -0,0 +1,71 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.utils.history import TokenCounter
+from app.utils.search import SearchService
+from app.utils.web_context import WebContextBuilder, check_public_url
+
+PUBLIC = "http://93.184.216.34"  # IP literals, so no DNS is needed
+PAGE = "<html><title>Hackney</title><p>" + "Broadway Market sells the best pie and mash in all of Hackney. " * 3 + "</p></html>"
+
+
+@pytest.mark.parametrize("url", [
+    "http://127.0.0.1/",
+    "http://localhost:8000/admin",
+    "http://169.254.169.254/latest/meta-data/",
+    "http://10.0.0.5/",
+    "http://192.168.1.1/",
+    "http://[::1]/",
+    "http://[::ffff:127.0.0.1]/",
+    "file:///etc/passwd",
+    "ftp://93.184.216.34/",
+])
+def test_private_and_non_http_urls_are_refused(url):
+    with pytest.raises(ValueError, match="Refusing"):
+        asyncio.run(check_public_url(url))
+
+
+def test_public_urls_pass():
+    asyncio.run(check_public_url(f"{PUBLIC}/page"))
+    asyncio.run(check_public_url("https://[2606:4700:4700::1111]/"))
+
+
+def _builder(routes) -> WebContextBuilder:
+    requested = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requested.append(str(request.url))
+        status, headers, body = routes[str(request.url)]
+        return httpx.Response(status, headers=headers, text=body)
+
+    search = SearchService()
+    search._client = httpx.AsyncClient(transport=httpx.MockTransport(handler), follow_redirects=True)
+    builder = WebContextBuilder(search, TokenCounter())
+    builder.requested = requested
+    return builder
+
+
+def test_redirects_to_private_hosts_are_not_followed():
+    builder = _builder({
+        f"{PUBLIC}/go": (302, {"location": "http://169.254.169.254/latest/meta-data/"}, ""),
+        "http://169.254.169.254/latest/meta-data/": (200, {"content-type": "text/html"}, "secret"),
+    })
+
+    with pytest.raises(ValueError, match="non-public"):
+        asyncio.run(builder._page({"url": f"{PUBLIC}/go", "title": "go"}))
+    assert builder.requested == [f"{PUBLIC}/go"]
+
+
+def test_public_redirects_are_followed_up_to_a_limit():
+    builder = _builder({
+        f"{PUBLIC}/old": (301, {"location": "/new"}, ""),
+        f"{PUBLIC}/new": (200, {"content-type": "text/html; charset=utf-8"}, PAGE),
+        f"{PUBLIC}/loop": (302, {"location": "/loop"}, ""),
+    })
+
+    passages = asyncio.run(builder._page({"url": f"{PUBLIC}/old", "title": "old"}))
+    assert passages and "pie and mash" in passages[0].text
+    with pytest.raises(ValueError, match="Too many redirects"):
+        asyncio.run(builder._page({"url": f"{PUBLIC}/loop", "title": "loop"}))